@@ -1,276 +1,424 @@
 import re
 import os
-from flask import Flask, request, jsonify
+import json
+import datetime
+import gc
+import threading
+from flask import Flask, Response, request, jsonify
+import numpy as np
 import pandas as pd
-import random
 from flask_cors import CORS
 from word2number import w2n
+import metrics
+from cache import LRUCache
+from catalog import build_catalog
+from datasets import SNAPSHOT_SHEETS, DatasetCache, DatasetWatcher, build_snapshots
+from filters import build_accommodation_index, describe_filter, filtered_ranking, has_limits, parse_accommodation_filter
+from matchers import IntentRouter, build_city_index, build_food_index, build_location_index, find_name, normalize_text
+from rankings import build_accommodation_rankings, build_location_ranking, ranked_page
+from render import (
+    ACCOMMODATION_CARD, ACTIVITIES_LINE, AVAILABLE_DATES_LINE, BEST_DATE_LINE, BEST_SEASON_LINE, BEST_SEASON_WHY_LINE,
+    DESCRIPTION_LINE, FOOD_CARD, FOOD_LOCATION_CARD, FOOD_TYPE_LINE, HOURS_LINE, LOCATION_CARD, LOCATION_ITEM, RATING_LINE,
+    ACCOMMODATION_CITY_CARD, FOOD_CITY_CARD, FOOD_LOCATION_CITY_CARD, FOOD_TYPE_CITY_LINE, LOCATION_CITY_CARD, OPEN_LOCATION_ITEM,
+    chunks,
+)
+from schedules import build_schedule, days_asked, describe_days, format_minute, open_at, open_on
+from search import build_food_search, build_location_search, search
+from sessions import decode_cursor, encode_cursor, open_session_store
 
 app = Flask(__name__)
 CORS(app)
 
+# Handlers receive shallow copies of the cached frames (SheetData.view). With copy-on-write any
+# write they make lands in their own copy instead of the shared parsed data (always on from pandas 3).
+if int(pd.__version__.split('.')[0]) < 3:
+    pd.set_option('mode.copy_on_write', True)
+
 datasets_path = "d:/Dataset/"
 
-pagination_state = {}
+# Upper bound on the number of parsed sheets kept in memory (eleven cities, three sheets each).
+dataset_cache_size = int(os.environ.get("CHATBOT_DATASET_CACHE_SIZE", 33))
+# "request" re-checks a workbook's modification time whenever a request reads it. "watch" has a
+# background thread reload changed workbooks every dataset_watch_interval seconds instead, so
+# requests never read a workbook; they only stat datasets_path, to notice added or removed ones
+# (see city_index). __main__ and asgi.py start the thread, and otherwise the first request does.
+dataset_reload = os.environ.get("CHATBOT_DATASET_RELOAD", "request")
+dataset_watch_interval = float(os.environ.get("CHATBOT_DATASET_WATCH_INTERVAL", 5))
+
+# Indexes the handlers derive from each sheet, built by the watcher before a new version is served.
+DERIVED_INDEXES = {
+    "Sheet1": [
+        ("location_index", build_location_index), ("location_ranking", build_location_ranking), ("schedule", build_schedule),
+        ("location_search", build_location_search),
+    ],
+    "Sheet2": [("accommodation_rankings", build_accommodation_rankings), ("accommodation_filter_index", build_accommodation_index)],
+    "Sheet3": [("food_index", build_food_index), ("food_search", build_food_search)],
+}
+
+if dataset_reload == "watch":
+    dataset_cache = DatasetWatcher(datasets_path, dataset_watch_interval, derived=DERIVED_INDEXES)
+else:
+    dataset_cache = DatasetCache(max_sheets=dataset_cache_size)
+
+# "1" loads and indexes every workbook when this module is imported (see preload_datasets), so
+# that under `gunicorn --preload` the master does it once and every worker it forks shares the
+# result instead of parsing the workbooks again.
+preload = os.environ.get("CHATBOT_PRELOAD", "0") == "1"
+
+# Users idle for longer than session_ttl seconds start over; past max_sessions the least recently active are dropped.
+session_ttl = int(os.environ.get("CHATBOT_SESSION_TTL", 1800))
+max_sessions = int(os.environ.get("CHATBOT_MAX_SESSIONS", 10000))
+# "memory" keeps sessions in this process; "sqlite" shares them between worker processes
+# (e.g. gunicorn -w 4) through the database at session_db_path.
+session_backend = os.environ.get("CHATBOT_SESSION_BACKEND", "memory")
+session_db_path = os.environ.get("CHATBOT_SESSION_DB", os.path.join(os.path.dirname(os.path.abspath(__file__)), "sessions.db"))
+sessions = open_session_store(session_backend, session_db_path, ttl=session_ttl, max_sessions=max_sessions)
+
+# Responses to repeated single-answer questions (hours, ratings, where to buy...), keyed by
+# the normalized question and the version of the sheet that answered it.
+response_cache_size = int(os.environ.get("CHATBOT_RESPONSE_CACHE_SIZE", 4096))
+response_cache_ttl = int(os.environ.get("CHATBOT_RESPONSE_CACHE_TTL", 3600))
+response_cache = LRUCache(response_cache_size, ttl=response_cache_ttl)
+
+# Most results one page may ask for ("show 50 locations in calamba").
+max_page_size = int(os.environ.get("CHATBOT_MAX_PAGE_SIZE", 100))
+
+# Largest number of questions accepted by one /query/batch request.
+max_batch_size = int(os.environ.get("CHATBOT_MAX_BATCH_SIZE", 1000))
+
+# Whether JSON /query responses carry a Server-Timing header with the time spent in each stage.
+timing_header = os.environ.get("CHATBOT_TIMING_HEADER", "0") == "1"
+
+_city_index = (None, None)
+
+def city_index():
+    """Returns the city matcher for the workbooks under datasets_path, rebuilt only when that folder changes."""
+    global _city_index
+    try:
+        key = (datasets_path, os.stat(datasets_path).st_mtime_ns)
+    except OSError:
+        key = (datasets_path, None)
+    if _city_index[0] != key:
+        _city_index = (key, build_city_index(datasets_path))
+    return _city_index[1]
+
+def city_file_path(city_name):
+    """Returns the workbook path for a given city."""
+    return city_index().files.get(city_name)
+
+# Sheets held by the batch being answered on this thread, by (city, sheet name).
+_pinned = threading.local()
+
+@metrics.timed("dataset")
+def load_city_sheet(city_name, sheet_name):
+    """Returns the cached SheetData for one sheet of a city's workbook."""
+    pinned = getattr(_pinned, 'sheets', None)
+    if pinned is not None and (city_name, sheet_name) in pinned:
+        return pinned[(city_name, sheet_name)]
+
+    path = city_file_path(city_name)
+    if path is None:
+        return None
+    return dataset_cache.load(path, sheet_name)
+
+def load_sheet(city_name, sheet_name):
+    """Returns a shallow copy of one sheet of a city's workbook from the dataset cache (see SheetData.view)."""
+    sheet = load_city_sheet(city_name, sheet_name)
+    if sheet is None:
+        return None
+    return sheet.view()
 
 def load_city_data(city_name):
     """Loads the Excel file for a given city."""
-    city_file = os.path.join(datasets_path, f"{city_name.lower().replace(' ', '_')}.xlsx")
-    
-    if os.path.exists(city_file):
-        data = pd.read_excel(city_file)
-        data.columns = data.columns.str.lower()
-        return data
-    else:
-        return None
+    return load_sheet(city_name, "Sheet1")
     
 def load_accommodation_data(city_name):
-    city_file = os.path.join(datasets_path, f"{city_name.lower().replace(' ', '_')}.xlsx")
-    
-    if os.path.exists(city_file):
-        data = pd.read_excel(city_file, sheet_name="Sheet2")
-        data.columns = data.columns.str.lower()
-        return data
-    else:
-        return None
+    return load_sheet(city_name, "Sheet2")
 
 def load_foods_data(city_name):
-    city_file = os.path.join(datasets_path, f"{city_name.lower().replace(' ', '_')}.xlsx")
-    
-    if os.path.exists(city_file):
-        data = pd.read_excel(city_file, sheet_name="Sheet3")
-        data.columns = data.columns.str.lower()
-        return data
-    else:
-        return None
+    return load_sheet(city_name, "Sheet3")
 
-def extract_number(query, default=5):
-    """Extract number from the query or use default."""
+def extract_number(query, default=5, limit=None):
+    """Extract number from the query or use default, kept between 1 and limit (max_page_size if not given)."""
+    limit = limit or max_page_size
     numbers = re.findall(r'\b\d+\b', query)
     if numbers:
-        return int(numbers[0])
-    try:
-        return w2n.word_to_num(query)
-    except ValueError:
-        return default
+        # A number with more digits than the limit is over it; int() on thousands of digits is slow or refused.
+        digits = numbers[0].lstrip('0') or '0'
+        number = int(digits) if len(digits) <= len(str(limit)) else limit
+    else:
+        try:
+            number = int(w2n.word_to_num(query))
+        except (ValueError, IndexError):
+            # word2number raises IndexError on some number words it cannot combine ("a million hundred").
+            number = default
+    return max(1, min(number, limit))
 
+@metrics.timed("city")
 def extract_city(query):
     """Extracts the city name from the user's query."""
-    city_keywords = ["san pedro", "binan", "cabuyao", "calamba", "sta rosa", "los baños", "victoria", "bay", "kalayaan", "santa cruz", "pagsanjan"]
-    for city in city_keywords:
-        if city in query.lower():
-            return city
-    return None
+    # Questions usually end with "in <city>", so the last city mentioned wins.
+    return city_index().matcher.last(normalize_text(query))
+
+def without_city(text):
+    """Blanks out the city mention of a normalized query, so fuzzy lookups don't match names against it."""
+    match = city_index().matcher.last_match(text)
+    return text if match is None else text[:match[0]] + text[match[1]:]
 
 
 #Locations________________________________________________________________________________________________
+def location_index(city_name):
+    """Returns the city's location index, built once per version of its Sheet1."""
+    sheet = load_city_sheet(city_name, "Sheet1")
+    if sheet is None:
+        return None, None
+    return sheet, sheet.derived("location_index", build_location_index)
+
+@metrics.timed("location")
 def extract_location(query, city_name):
-    """Extracts location name from the user's query based on the available locations in the dataset."""
-    data = load_city_data(city_name)
-    if data is not None:
-        location_keywords = data['location'].unique() 
-        for location in location_keywords:
-            if location.lower() in query.lower():
-                return location
-    return None
-
-def show_hours_for_location(user_id, location_name, city_name):
+    """Extracts location name from the user's query based on the available locations in the dataset.
+    Returns (name, exact), exact False if the query only misspells it; (None, False) if there is none."""
+    sheet, index = location_index(city_name)
+    if index is not None:
+        # Exact mentions first; misspelled ones ("rizal shrne") through the n-gram index.
+        text = normalize_text(query)
+        key, exact = find_name(index, text, without_city(text))
+        if key is not None:
+            return index.names[key], exact
+    return None, False
+
+def did_you_mean(name, exact, response):
+    """Prefixes an answer about a name the query did not spell out with the name it was taken for."""
+    return response if exact else f"Did you mean {name}?<br>{response}"
+
+def load_location_rows(city_name, location_name):
+    """Returns the Sheet1 rows of a location by direct lookup in the location index."""
+    sheet, index = location_index(city_name)
+    if sheet is None:
+        return None
+    rows = index.rows.get(normalize_text(location_name), [])
+    return sheet.frame.iloc[rows]
+
+def show_hours_for_location(session, location_name, city_name):
     """Returns the operating hours for a specific location in a city."""
-    data = load_city_data(city_name)
-    if data is None:
+    location_data = load_location_rows(city_name, location_name)
+    if location_data is None:
         return "Sorry, I couldn't find information for this city."
-
-    location_data = data[data['location'].str.contains(location_name, case=False, na=False)]
     
     if location_data.empty:
         return f"Sorry, I couldn't find any information for {location_name} in {city_name}."
 
     response = f"The operating hours for {location_name} in {city_name} are:<br>"
-    for _, row in location_data.iterrows():
-        response += (
-            f"Location: {row['location']}<br>"
-            f"Operating Hours: {row['opening']}AM - {row['closing']}PM<br><br>"
-        )
+    response += HOURS_LINE.render(location_data)
     return response
 
-def show_activities_for_location(user_id, location_name, city_name):
+def show_activities_for_location(session, location_name, city_name):
     """Returns the activities available at a specific location in a city."""
-    data = load_city_data(city_name)
-    if data is None:
+    location_data = load_location_rows(city_name, location_name)
+    if location_data is None:
         return "Sorry, I couldn't find information for this city."
-
-    location_data = data[data['location'].str.contains(location_name, case=False, na=False)]
     
     if location_data.empty:
         return f"Sorry, I couldn't find any information for {location_name} in {city_name}."
 
     response = f"Here are the activities you can do at {location_name} in {city_name}:<br>"
-    for _, row in location_data.iterrows():
-        response += f"* {row['to_do_activies']}<br>"
+    response += ACTIVITIES_LINE.render(location_data)
 
     return response
 
-def show_locations(user_id, query, city_name):
+def show_locations(session, query, city_name):
     data = load_city_data(city_name)
     if data is None:
         return "Sorry, I couldn't find any locations for this city."
 
     locations = data['location'].unique()
-    random.shuffle(locations)
-    num_results = extract_number(query)
-
-    start_index = pagination_state[user_id]['locations']
-    locations_to_show = locations[start_index:start_index + num_results]
+    # The session's seed fixes the shuffled order, so each page continues the same permutation.
+    order = np.random.default_rng(session.seed).permutation(len(locations))
+    num_results = extract_number(query, default=session.page_size or 5)
+    session.page_size = num_results
 
-    pagination_state[user_id]['locations'] += num_results
+    start_index = session.offset
+    page = order[start_index:start_index + num_results]
 
-    response = f"Here are some locations and attractions in {city_name}:<br>"
-    for loc in locations_to_show:
-        response += f"* {loc}<br>"
+    session.offset += num_results
 
-    if pagination_state[user_id]['locations'] < len(locations):
-        response += "<br>Would you like to see more?"
+    if session.offset < len(locations):
+        footer = "<br>Would you like to see more?"
     else:
-        response += "<br>No more locations to show."
-    return response
+        footer = "<br>No more locations to show."
 
-def show_best_locations(user_id, query, city_name):
-    data = load_city_data(city_name)
-    if data is None:
+    # Returned in pieces so /query can stream a long page as it is rendered.
+    header = f"Here are some locations and attractions in {city_name}:<br>"
+    return chunks(header, LOCATION_ITEM, lambda: {'location': locations[page]}, footer)
+
+def show_best_locations(session, query, city_name):
+    sheet = load_city_sheet(city_name, "Sheet1")
+    if sheet is None:
         return "Sorry, I couldn't find the best locations for this city."
 
-    start_index = pagination_state[user_id]['best_locations']
-    sorted_data = data.sort_values(by='rating', ascending=False)
+    start_index = session.offset
+    ranking = sheet.derived("location_ranking", build_location_ranking)
     
-    num_results = extract_number(query)
+    num_results = extract_number(query, default=session.page_size or 5)
+    session.page_size = num_results
 
-    best_locations = sorted_data[['location', 'rating', 'entrance_fee', 'to_do_activies']].iloc[start_index:start_index + num_results]
+    session.offset += num_results
 
-    pagination_state[user_id]['best_locations'] += num_results
-
-    response = f"Here are the best locations in {city_name} based on ratings:<br>"
-    for _, row in best_locations.iterrows():
-        response += (
-            f"Location: {row['location']}<br>"
-            f"Rating: {row['rating']}<br>"
-            f"Entrance Fee: {row['entrance_fee']}<br>"
-            f"Activities: {row['to_do_activies']}<br><br>"
-        )
-
-    if pagination_state[user_id]['best_locations'] < len(sorted_data):
-        response += "<br>Would you like to see more?"
+    if session.offset < len(ranking):
+        footer = "<br>Would you like to see more?"
     else:
-        response += "<br>No more best locations to show."
-    return response
+        footer = "<br>No more best locations to show."
 
-def show_description_for_location(user_id, location_name, city_name):
+    header = f"Here are the best locations in {city_name} based on ratings:<br>"
+    return chunks(header, LOCATION_CARD, lambda: ranked_page(sheet.frame, ranking, start_index, num_results), footer)
+
+def show_description_for_location(session, location_name, city_name):
     """Returns the description of a specific location in a city."""
-    data = load_city_data(city_name)
-    if data is None:
+    location_data = load_location_rows(city_name, location_name)
+    if location_data is None:
         return "Sorry, I couldn't find information for this city."
-
-    location_data = data[data['location'].str.contains(location_name, case=False, na=False)]
     
     if location_data.empty:
         return f"Sorry, I couldn't find any information for {location_name} in {city_name}."
 
     response = f"The {location_name} in {city_name}:<br>"
-    for _, row in location_data.iterrows():
-        response += f"{row['description']}<br>"
+    response += DESCRIPTION_LINE.render(location_data)
     
     return response
 
-def show_rating_for_location(user_id, location_name, city_name):
+def show_rating_for_location(session, location_name, city_name):
     """Returns the rating of a specific location in a city."""
-    data = load_city_data(city_name)
-    if data is None:
+    location_data = load_location_rows(city_name, location_name)
+    if location_data is None:
         return "Sorry, I couldn't find information for this city."
-
-    location_data = data[data['location'].str.contains(location_name, case=False, na=False)]
     
     if location_data.empty:
         return f"Sorry, I couldn't find any information for {location_name} in {city_name}."
 
     response = f"The rating for {location_name} in {city_name} is:<br>"
-    for _, row in location_data.iterrows():
-        response += f"Rating: {row['rating']}<br>"
+    response += RATING_LINE.render(location_data)
 
     return response
 
-def show_best_season_for_location(user_id, location_name, city_name):
+def show_best_season_for_location(session, location_name, city_name):
     """Returns the best season to visit a specific location in a city."""
-    data = load_city_data(city_name)
-    if data is None:
+    location_data = load_location_rows(city_name, location_name)
+    if location_data is None:
         return "Sorry, I couldn't find information for this city."
-
-    location_data = data[data['location'].str.contains(location_name, case=False, na=False)]
     
     if location_data.empty:
         return f"Sorry, I couldn't find any information for {location_name} in {city_name}."
 
     response = f"The best season to visit {location_name} in {city_name} is:<br>"
-    for _, row in location_data.iterrows():
-        response += f"Best Season: {row['best_season']}<br>"
-        response += f"Reason: {row['best_season_why']}<br>"
+    response += BEST_SEASON_LINE.render(location_data)
 
     return response
 
-def show_best_date_for_location(user_id, location_name, city_name):
+def show_best_date_for_location(session, location_name, city_name):
     """Returns the best date to visit a specific location in a city."""
-    data = load_city_data(city_name)
-    if data is None:
+    location_data = load_location_rows(city_name, location_name)
+    if location_data is None:
         return "Sorry, I couldn't find information for this city."
-
-    location_data = data[data['location'].str.contains(location_name, case=False, na=False)]
     
     if location_data.empty:
         return f"Sorry, I couldn't find any information for {location_name} in {city_name}."
 
     response = f"The best date to visit {location_name} in {city_name} is:<br>"
-    for _, row in location_data.iterrows():
-        # Assuming the column is 'best_date'
-        response += f"Best Date: {row['best_date']}<br>"
+    response += BEST_DATE_LINE.render(location_data)
 
     return response
 
-def show_best_season_why_for_location(user_id, location_name, city_name):
+def show_best_season_why_for_location(session, location_name, city_name):
     """Returns why the best season is considered the best for a specific location in a city."""
-    data = load_city_data(city_name)
-    if data is None:
+    location_data = load_location_rows(city_name, location_name)
+    if location_data is None:
         return "Sorry, I couldn't find information for this city."
-
-    location_data = data[data['location'].str.contains(location_name, case=False, na=False)]
     
     if location_data.empty:
         return f"Sorry, I couldn't find any information for {location_name} in {city_name}."
 
     response = f"Here's why {location_name} in {city_name} should be visited in that season:<br>"
-    for _, row in location_data.iterrows():
-        # Assuming the column is 'Best_Season_Why'
-        response += f"Reason:{row['best_season_why']}<br>"
+    response += BEST_SEASON_WHY_LINE.render(location_data)
 
     return response
 
-def show_available_dates_for_location(user_id, location_name, city_name):
+def show_available_dates_for_location(session, location_name, city_name):
     """Returns the available dates for a specific location in a city."""
-    data = load_city_data(city_name)
-    if data is None:
+    location_data = load_location_rows(city_name, location_name)
+    if location_data is None:
         return "Sorry, I couldn't find information for this city."
-
-    location_data = data[data['location'].str.contains(location_name, case=False, na=False)]
     
     if location_data.empty:
         return f"Sorry, I couldn't find any information for {location_name} in {city_name}."
 
     response = f"The available dates for {location_name} in {city_name} are:<br>"
-    for _, row in location_data.iterrows():
-        # Assuming the column is 'available_date'
-        response += f"Available Date: {row['available_days']}<br>"
+    response += AVAILABLE_DATES_LINE.render(location_data)
 
     return response
 
+# Local time of the attractions: Philippine Standard Time, which has no daylight saving.
+LOCAL_TIMEZONE = datetime.timezone(datetime.timedelta(hours=8), "PHT")
+
+def show_location_open(sheet, query, city_name, is_open, when):
+    """Returns whether the location the query names is open (is_open: which rows of the sheet are),
+    with its hours and days, or None if the query names no location."""
+    location_name, exact = extract_location(query, city_name)
+    if location_name is None:
+        return None
+    rows = location_index(city_name)[1].rows[normalize_text(location_name)]
+    if is_open[rows].any():
+        response = f"Yes, {location_name} in {city_name} is open {when}.<br>"
+    else:
+        response = f"No, {location_name} in {city_name} is not open {when}.<br>"
+    location_data = sheet.frame.iloc[rows]
+    response += HOURS_LINE.render(location_data) + AVAILABLE_DATES_LINE.render(location_data)
+    return did_you_mean(location_name, exact, response)
+
+def show_open_now(session, query, city_name):
+    """Returns the locations in a city that are open at the current local time, or whether the one the query names is."""
+    sheet = load_city_sheet(city_name, "Sheet1")
+    if sheet is None:
+        return f"Sorry, I couldn't find location information for {city_name}."
+
+    # Opening and closing minutes and open days as arrays, computed once per dataset version
+    schedule = sheet.derived("schedule", build_schedule)
+    now = datetime.datetime.now(LOCAL_TIMEZONE)
+    is_open = open_at(schedule, now)
+
+    when = f"{now:%A}, {format_minute(now.hour * 60 + now.minute)}"
+    # "is rizal shrine open now" asks about that location alone.
+    response = show_location_open(sheet, query, city_name, is_open, f"right now ({when})")
+    if response is not None:
+        return response
+    open_locations = sheet.frame.take(np.flatnonzero(is_open))
+    if open_locations.empty:
+        return f"Sorry, none of the locations in {city_name} are open right now ({when})."
+    return chunks(f"Here are the locations in {city_name} open right now ({when}):<br>", OPEN_LOCATION_ITEM, open_locations, "")
+
+def show_open_on_day(session, query, city_name):
+    """Returns the locations in a city open on the days the query names ("on sunday", "this weekend"),
+    or whether the one the query names is."""
+    sheet = load_city_sheet(city_name, "Sheet1")
+    if sheet is None:
+        return f"Sorry, I couldn't find location information for {city_name}."
+
+    days = days_asked(query, datetime.datetime.now(LOCAL_TIMEZONE).weekday())
+    if not days:
+        return "Sorry, I couldn't tell which day you're asking about. Try a day like \"on sunday\"."
+
+    schedule = sheet.derived("schedule", build_schedule)
+    is_open = open_on(schedule, days)
+    # "is rizal shrine open today", "opening hours of rizal shrine on sunday" ask about that location alone.
+    response = show_location_open(sheet, query, city_name, is_open, f"on {describe_days(days)}")
+    if response is not None:
+        return response
+    open_locations = sheet.frame.take(np.flatnonzero(is_open))
+    if open_locations.empty:
+        return f"Sorry, none of the locations in {city_name} are open on {describe_days(days)}."
+    return chunks(f"Here are the locations in {city_name} open on {describe_days(days)}:<br>", OPEN_LOCATION_ITEM, open_locations, "")
+
 #Accommodations________________________________________________________________________________
-def show_accommodations(user_id, city_name):
+def show_accommodations(session, city_name):
     """Returns a list of accommodations available in a specific city, paginated 5 at a time."""
     data = load_accommodation_data(city_name)
     if data is None:
@@ -282,493 +430,799 @@ def show_accommodations(user_id, city_name):
         return f"Sorry, no accommodations were found in {city_name}."
 
     # Get the current start index from pagination state (default to 0 if not set)
-    start_index = pagination_state[user_id].get('accommodations', 0)
+    start_index = session.offset
 
     # Show the next 5 accommodations
-    accommodations_to_show = accommodations.iloc[start_index:start_index + 4]
+    accommodations_to_show = accommodations.iloc[start_index:start_index + 5]
 
     # Update the index for next request
-    pagination_state[user_id]['accommodations'] = start_index + 5
+    session.offset = start_index + 5
 
     # Format the response
     response = f"Here are some accommodations available in {city_name}:<br>"
-    for _, row in accommodations_to_show.iterrows():
-        response += (
-            f"<b>{row['name']}</b><br>"
-            f"Description: {row['description']}<br>"
-            f"Price Range: {row['price_range']}<br>"
-            f"One-Day Rate: {row['one-day_rate']}<br>"
-            f"Twelve Hours Rate: {row['12-hours_rate']}<br>"
-            f"Six Hours Rate: {row['6-hours_rate']}<br>"
-            f"Nearest Attraction: {row['nearest_attraction']}<br>"
-            f"Type: {row['type_of_accomodation']}<br>"
-            f"Level: {row['level_of_accomodation']}<br>"
-            f"Phone Number: {row['phone_number']}<br>"
-            f"Rating: {row['rating']}<br><br>"  
-        )
+    response += ACCOMMODATION_CARD.render(accommodations_to_show)
     response += "<br>For more detail try searching the name and calling the phone number provided<br>"
 
     # Check if there are more accommodations to show
-    if pagination_state[user_id]['accommodations'] < len(accommodations):
+    if session.offset < len(accommodations):
         response += "<br>Would you like to see more?"
     else:
         response += "<br>No more accommodations to show."
 
-    pagination_state[user_id]['user_intent'] = 'best_accommodation'  # Keep track of user intent
-    pagination_state[user_id]['showing_more'] = True  # Track if user wants to see more
-
     return response
 
-def show_best_accommodation(user_id, city_name):
+def show_best_accommodation(session, city_name):
     """Returns the best-rated accommodation in a city."""
     # Load the accommodation data for the city
-    data = load_accommodation_data(city_name)
+    sheet = load_city_sheet(city_name, "Sheet2")
     
-    if data is None:
+    if sheet is None:
         return f"Sorry, I couldn't find accommodation information for {city_name}."
     
-    # Sort accommodations by rating in descending order
-    sorted_data = data.sort_values(by='rating', ascending=False)
+    # Accommodations ranked by rating in descending order, computed once per dataset version
+    rankings = sheet.derived("accommodation_rankings", build_accommodation_rankings)
     
     # Get the first accommodation (pagination state starts at 0)
-    start_index = pagination_state[user_id].get('accommodations', 0)  # Default to 0 if not found
+    start_index = session.offset
     
-    accommodations_to_show = sorted_data.iloc[start_index:start_index + 1]  # Show one accommodation at a time
+    accommodations_to_show = ranked_page(sheet.frame, rankings.by_rating, start_index, 1)  # Show one accommodation at a time
 
     # Update the pagination state to the next accommodation
-    pagination_state[user_id]['accommodations'] = start_index + 1
+    session.offset = start_index + 1
     
     # If no accommodation is found, return a message
     if accommodations_to_show.empty:
         return "No more accommodations to show."
     
-    # Get the best accommodation to display
-    best_accommodation = accommodations_to_show.iloc[0]
-    
     # Return details of the best accommodation
     response = f"The best accommodation in {city_name} is:<br>"
-    response += (
-        f"<b>{best_accommodation['name']}</b><br>"
-        f"Description: {best_accommodation['description']}<br>"
-        f"Price Range: {best_accommodation['price_range']}<br>"
-        f"One-Day Rate: {best_accommodation['one-day_rate']}<br>"
-        f"Twelve Hours Rate: {best_accommodation['12-hours_rate']}<br>"
-        f"Six Hours Rate: {best_accommodation['6-hours_rate']}<br>"
-        f"Nearest Attraction: {best_accommodation['nearest_attraction']}<br>"
-        f"Type: {best_accommodation['type_of_accomodation']}<br>"
-        f"Level: {best_accommodation['level_of_accomodation']}<br>"
-        f"Phone Number: {best_accommodation['phone_number']}<br>"
-        f"Rating: {best_accommodation['rating']}<br><br>"
-        )
+    response += ACCOMMODATION_CARD.render(accommodations_to_show)
     
     response += "<br>For more detail try searching the name and calling the phone number provided<br>"
     
     # Ask if the user would like more information
     response += "<br>Would you like to know more about this place or other accommodations?"
-    
-    # Keep track of user intent and if they want to see more accommodations
-    pagination_state[user_id]['user_intent'] = 'best_accommodation'
-    pagination_state[user_id]['showing_more'] = True
+
     return response
 
-def show_cheapest_accommodation(user_id, city_name):
+def show_cheapest_accommodation(session, city_name):
     """Returns the cheapest accommodation in a city."""
     # Load the accommodation data for the city
-    data = load_accommodation_data(city_name)
+    sheet = load_city_sheet(city_name, "Sheet2")
     
-    if data is None:
+    if sheet is None:
         return f"Sorry, I couldn't find accommodation information for {city_name}."
     
-    # Extract the minimum price from the price range for sorting
-    def extract_min_price(price_range):
-        try:
-            # Split the range (e.g., '₱500-₱1,000') and get the lower value
-            min_price = price_range.split('-')[0].replace('₱', '').replace(',', '').strip()
-            return int(min_price)
-        except (ValueError, AttributeError):
-            return float('inf')  # Default to a very high value if parsing fails
+    # Accommodations ranked by the minimum of their price range in ascending order
+    cheapest_accommodation = sheet.derived("accommodation_rankings", build_accommodation_rankings).by_min_price
 
-    # Add a new column for the extracted minimum price
-    data['min_price'] = data['price_range'].apply(extract_min_price)
-
-    # Sort accommodations by the extracted minimum price in ascending order
-    cheapest_accommodation = data.sort_values(by='min_price', ascending=True)
-
-    # Ensure the pagination starts from the first accommodation
-    if user_id not in pagination_state:
-        pagination_state[user_id] = {'accommodations': 0}  # Initialize to 0 on first request
-
-    start_index = pagination_state[user_id].get('accommodations', 0)  # Get the current index for pagination
+    start_index = session.offset  # Get the current index for pagination
 
     # Show the accommodation at the current start_index
-    accommodation_to_show = cheapest_accommodation.iloc[start_index:start_index + 1]
+    accommodation_to_show = ranked_page(sheet.frame, cheapest_accommodation, start_index, 1)
 
     # Update the index for the next request (increment by 1 for next accommodation)
-    pagination_state[user_id]['accommodations'] = start_index + 1
+    session.offset = start_index + 1
 
     # Prepare the response with details of the current cheapest accommodation
     response = f"Here is the cheapest accommodation in {city_name}:<br>"
-    for _, row in accommodation_to_show.iterrows():
-        response += (
-            f"<b>{row['name']}</b><br>"
-            f"Description: {row['description']}<br>"
-            f"Price Range: {row['price_range']}<br>"
-            f"One-Day Rate: {row['one-day_rate']}<br>"
-            f"Twelve Hours Rate: {row['12-hours_rate']}<br>"
-            f"Six Hours Rate: {row['6-hours_rate']}<br>"
-            f"Nearest Attraction: {row['nearest_attraction']}<br>"
-            f"Type: {row['type_of_accomodation']}<br>"
-            f"Level: {row['level_of_accomodation']}<br>"
-            f"Phone Number: {row['phone_number']}<br>"
-            f"Rating: {row['rating']}<br><br>"
-        )
+    response += ACCOMMODATION_CARD.render(accommodation_to_show)
     response += "<br>For more detail try searching the name and calling the phone number provided<br>"
 
     # Check if there are more accommodations to show
-    if pagination_state[user_id]['accommodations'] < len(cheapest_accommodation):
+    if session.offset < len(cheapest_accommodation):
         response += "<br>Would you like to see more accommodations?"
     else:
         response += "<br>No more accommodations to show."
 
     return response
 
-def show_most_expensive_accommodation(user_id, city_name):
+def show_most_expensive_accommodation(session, city_name):
     """Returns the most expensive accommodation in a city."""
     # Load the accommodation data for the city
-    data = load_accommodation_data(city_name)
+    sheet = load_city_sheet(city_name, "Sheet2")
     
-    if data is None:
+    if sheet is None:
         return f"Sorry, I couldn't find accommodation information for {city_name}."
 
-    # Convert price range to numeric for sorting
-    def extract_max_price(price_range):
-        try:
-            # Split the range (e.g., '₱700-₱1,500') and get the upper value
-            max_price = price_range.split('-')[-1].replace('₱', '').replace(',', '').strip()
-            return int(max_price)
-        except (ValueError, AttributeError):
-            return 0  # Default to 0 if parsing fails
-
-    # Add a new column for the extracted maximum price
-    data['max_price'] = data['price_range'].apply(extract_max_price)
-
-    # Sort accommodations by the extracted maximum price in descending order
-    most_expensive_accommodation = data.sort_values(by='max_price', ascending=False)
-
-    # Initialize pagination state if needed
-    if user_id not in pagination_state:
-        pagination_state[user_id] = {'accommodations': 0}  # Initialize to 0 on first request
+    # Accommodations ranked by the maximum of their price range in descending order
+    most_expensive_accommodation = sheet.derived("accommodation_rankings", build_accommodation_rankings).by_max_price
 
     # Get the current index for pagination
-    start_index = pagination_state[user_id].get('accommodations', 0)
+    start_index = session.offset
 
     # Show the accommodation at the current start_index
-    accommodation_to_show = most_expensive_accommodation.iloc[start_index:start_index + 1]
+    accommodation_to_show = ranked_page(sheet.frame, most_expensive_accommodation, start_index, 1)
 
     # Update the index for the next request (increment by 1 for next accommodation)
-    pagination_state[user_id]['accommodations'] = start_index + 1
+    session.offset = start_index + 1
 
     # Prepare the response with details of the current most expensive accommodation
     response = f"Here is the most expensive accommodation in {city_name}:<br>"
-    for _, row in accommodation_to_show.iterrows():
-        response += (
-            f"<b>{row['name']}</b><br>"
-            f"Description: {row['description']}<br>"
-            f"Price Range: {row['price_range']}<br>"
-            f"One-Day Rate: {row['one-day_rate']}<br>"
-            f"Twelve Hours Rate: {row['12-hours_rate']}<br>"
-            f"Six Hours Rate: {row['6-hours_rate']}<br>"
-            f"Nearest Attraction: {row['nearest_attraction']}<br>"
-            f"Type: {row['type_of_accomodation']}<br>"
-            f"Level: {row['level_of_accomodation']}<br>"
-            f"Phone Number: {row['phone_number']}<br>"
-            f"Rating: {row['rating']}<br><br>"
-        )
+    response += ACCOMMODATION_CARD.render(accommodation_to_show)
     response += "<br>For more detail try searching the name and calling the phone number provided<br>"
     # Check if there are more accommodations to show
-    if pagination_state[user_id]['accommodations'] < len(most_expensive_accommodation):
+    if session.offset < len(most_expensive_accommodation):
         response += "<br>Would you like to see more accommodations?"
     else:
         response += "<br>No more accommodations to show."
 
     return response
 
-def convert_price_to_numeric(price_range):
-    if isinstance(price_range, str):
+# Orders of filtered accommodations by the intent of the question; best rated first otherwise.
+FILTERED_ORDERS = {'cheapest_accommodation': 'by_min_price', 'most_expensive_accommodation': 'by_max_price'}
+
+def show_filtered_accommodations(session, query, city_name):
+    """Returns the accommodations in a city within the budget, rating, kind and price level the query asks for, paginated 5 at a time."""
+    sheet = load_city_sheet(city_name, "Sheet2")
+    if sheet is None:
+        return f"Sorry, I couldn't find accommodation information for {city_name}."
+
+    # Price bounds, ratings and kinds as arrays, computed once per dataset version
+    index = sheet.derived("accommodation_filter_index", build_accommodation_index)
+    rankings = sheet.derived("accommodation_rankings", build_accommodation_rankings)
+    return filtered_accommodations_page(session, query, sheet.frame, index, rankings, city_name, ACCOMMODATION_CARD)
+
+def filtered_accommodations_page(session, query, data, index, rankings, place, card):
+    """Shows the next 5 rows of data that pass the query's filter, evaluated over every row at once."""
+    filters = parse_accommodation_filter(query)
+    intent, _ = intent_router.classify(query)
+    matches = filtered_ranking(index, filters, getattr(rankings, FILTERED_ORDERS.get(intent, 'by_rating')))
+    if len(matches) == 0:
+        return f"Sorry, no accommodations in {place} match what you asked for ({describe_filter(filters)})."
+
+    start_index = session.offset
+    accommodations_to_show = ranked_page(data, matches, start_index, 5)
+    session.offset = start_index + 5
+
+    if accommodations_to_show.empty:
+        return "No more accommodations to show."
+
+    response = f"Here are the accommodations in {place} ({describe_filter(filters)}):<br>"
+    response += card.render(accommodations_to_show)
+    response += "<br>For more detail try searching the name and calling the phone number provided<br>"
+
+    if session.offset < len(matches):
+        response += "<br>Would you like to see more?"
+    else:
+        response += "<br>No more accommodations to show."
+    return response
 
-        price_range = price_range.replace('$', '').split('-')
-        if len(price_range) == 2:
-            return float(price_range[0])
-        else:
-            return float(price_range[0])
-    return 0
 #Foods_________________________________________________________________________________________________________
-def show_famous_food(user_id, city_name):
+def show_famous_food(session, city_name):
     """Returns a random famous food in a given city."""
     # Load food data for the city
-    data = load_foods_data(city_name)
+    sheet = load_city_sheet(city_name, "Sheet3")
     
-    if data is None:
+    if sheet is None:
         return f"Sorry, I couldn't find any food information for {city_name}."
 
-    # Shuffle the dataset to randomize the order
-    data = data.sample(frac=1).reset_index(drop=True)
-
-    # Ensure pagination state for food queries
-    if user_id not in pagination_state:
-        pagination_state[user_id] = {'foods': 0}  # Initialize pagination state
+    data = sheet.frame
+    # Randomize the order with the session's seed, so every page continues the same permutation
+    order = np.random.default_rng(session.seed).permutation(len(data))
 
-    start_index = pagination_state[user_id].get('foods', 0)
+    start_index = session.offset
 
     # Display one food item per response
     if start_index >= len(data):
         return "No more famous foods to show. Would you like to start over?"
 
-    food_to_show = data.iloc[start_index:start_index + 5]
+    food_to_show = ranked_page(data, order, start_index, 5)
 
     # Update pagination state
-    pagination_state[user_id]['foods'] = start_index + 5
+    session.offset = start_index + 5
 
     # Prepare response
     response = f"Here is a famous food in {city_name}:<br>"
-    for _, row in food_to_show.iterrows():
-        response += (
-            f"<b>{row['name']}</b><br>"
-            f"Description: {row['description']}<br>"
-            f"Price Range: {row['price_range']}<br>"
-            f"Type of Food: {row['type']}<br><br>"
-        )
+    response += FOOD_CARD.render(food_to_show)
 
     # Check if more food items are available
-    if pagination_state[user_id]['foods'] < len(data):
+    if session.offset < len(data):
         response += "<br>Would you like to see more famous foods?"
     else:
         response += "<br>No more famous foods to show."
 
     return response
 
-def show_food_locations(user_id, city_name, query):
+def food_index(city_name):
+    """Returns the city's food index, built once per version of its Sheet3."""
+    sheet = load_city_sheet(city_name, "Sheet3")
+    if sheet is None:
+        return None, None
+    return sheet, sheet.derived("food_index", build_food_index)
+
+@metrics.timed("food")
+def extract_food(query, city_name):
+    """Extracts the food name from the user's query, however it is phrased, based on the foods in the dataset.
+    Returns (name, exact), exact False if the query only misspells it; (None, False) if there is none."""
+    sheet, index = food_index(city_name)
+    if index is not None:
+        # One pass over the query for every food name; misspelled ones through the n-gram index.
+        text = normalize_text(query)
+        key, exact = find_name(index, text, without_city(text))
+        if key is not None:
+            return index.names[key], exact
+    return None, False
+
+def load_food_rows(city_name, food_name):
+    """Returns the Sheet3 rows of a food by direct lookup in the food index."""
+    sheet, index = food_index(city_name)
+    if sheet is None:
+        return None
+    rows = index.rows.get(normalize_text(food_name), [])
+    return sheet.frame.iloc[rows]
+
+def food_name_after_phrase(query):
+    """Returns the text after the intent's phrase, up to " in ...": "what type of food is buko pie in laguna?" -> "buko pie"."""
+    _, span = intent_router.classify(query)
+    if span is None:
+        return query.strip(" ?.!,")
+    name = re.sub(r"^\s*(?:is|are)\b", "", query[span[1]:])
+    return re.split(r"\bin\b", name)[0].strip(" ?.!,")
+
+def show_food_locations(session, city_name, query):
     """Returns places where the given food can be bought in the given city."""
-    # Load food data for the city
-    food_data = load_foods_data(city_name)
-
-    if food_data is None:
-        return f"Sorry, I couldn't find any food information for {city_name}."
-
-    # Try to match food name in the query itself (without extracting it manually)
-    # You can assume that the user asks for food directly, e.g., "Where can I buy Adobo in Manila?"
-    food_name = query.split("where can i buy")[1].split("in")[0].strip()  # Extract food name using string splitting
-    
-    # Search for the food in the dataset
-    food_data_filtered = food_data[food_data['name'].str.contains(food_name, case=False, na=False)]
+    # Find the food the query mentions, e.g. "Where can I buy Adobo in Manila?" or "adobo, where to buy?"
+    food_name, exact = extract_food(query, city_name)
+    if food_name is None:
+        if load_city_sheet(city_name, "Sheet3") is None:
+            return f"Sorry, I couldn't find any food information for {city_name}."
+        return f"Sorry, I couldn't find {food_name_after_phrase(query)} in {city_name}. Maybe you can try another food item?"
 
-    if food_data_filtered.empty:
-        return f"Sorry, I couldn't find {food_name} in {city_name}. Maybe you can try another food item?"
+    food_data_filtered = load_food_rows(city_name, food_name)
 
     # Display locations selling the food
     response = f"Here are places in {city_name} where you can buy {food_name}:<br>"
-    for _, row in food_data_filtered.iterrows():
-        response += (
-            f"<b>{row['name']}</b><br>"
-            f"You Can Buy It In: {row['where_to_buy']}<br>"
-            f"Price Range: {row['price_range']}<br>"
-        )
+    response += FOOD_LOCATION_CARD.render(food_data_filtered)
 
-    return response
+    return did_you_mean(food_name, exact, response)
 
-def show_food_type(user_id, city_name, query):
+def show_food_type(session, city_name, query):
     """Returns the type of a given food in the specified city."""
-    # Load food data for the city
-    food_data = load_foods_data(city_name)
-
-    if food_data is None:
-        return f"Sorry, I couldn't find any food information for {city_name}."
-
-    # Try to match food name in the query itself (e.g., "What type of food is Adobo in Manila?")
-    food_name = query.split("what type of food is")[1].split("in")[0].strip()  # Extract food name using string splitting
+    # Find the food the query mentions (e.g., "What type of food is Adobo in Manila?")
+    food_name, exact = extract_food(query, city_name)
+    if food_name is None:
+        if load_city_sheet(city_name, "Sheet3") is None:
+            return f"Sorry, I couldn't find any food information for {city_name}."
+        return f"Sorry, I couldn't find {food_name_after_phrase(query)} in {city_name}. Maybe you can try another food item?"
 
-    # Search for the food in the dataset
-    food_data_filtered = food_data[food_data['name'].str.contains(food_name, case=False, na=False)]
-
-    if food_data_filtered.empty:
-        return f"Sorry, I couldn't find {food_name} in {city_name}. Maybe you can try another food item?"
+    food_data_filtered = load_food_rows(city_name, food_name)
 
     # Display the type of food
     response = f"The type of food {food_name} is in {city_name} is:<br>"
-    for _, row in food_data_filtered.iterrows():
-        response += f"Type: {row['type']}<br>"
+    response += FOOD_TYPE_LINE.render(food_data_filtered)
+
+    return did_you_mean(food_name, exact, response)
+
+
+#Across cities_________________________________________________________________________________________________
+# Questions that name no city ("best hotel in Laguna", "where can I buy buko pie") are answered
+# over every city at once, under this name.
+ALL_CITIES = "laguna"
+
+_catalog = (None, None, {})
+
+def catalog():
+    """Returns every city's data merged into one Catalog, rebuilt only when one of the sheets changes."""
+    global _catalog
+    key, merged, held = _catalog
+    sheets = {}
+    for city in city_index().files:
+        for sheet_name in SNAPSHOT_SHEETS:
+            # The catalog keeps the sheets it was built from, so a dataset cache smaller than every
+            # sheet of every city doesn't make each question naming no city parse them all again.
+            sheet = held.get((city, sheet_name))
+            if sheet is None or not dataset_cache.is_current(sheet):
+                sheet = load_city_sheet(city, sheet_name)
+            if sheet is not None:
+                sheets[(city, sheet_name)] = sheet
+    version = tuple((name, sheet.version) for name, sheet in sheets.items())
+    if key != version:
+        merged = build_catalog({name: sheet.frame for name, sheet in sheets.items()})
+    _catalog = (version, merged, sheets)
+    return merged
+
+def show_ranked_accommodation_anywhere(session, ranking, header):
+    """Shows the next accommodation of one of the catalog's rankings, one at a time like the per-city handlers."""
+    data = catalog()
+    order = getattr(data.accommodation_rankings, ranking)
+
+    start_index = session.offset
+    accommodation_to_show = ranked_page(data.accommodations, order, start_index, 1)
+    session.offset = start_index + 1
+
+    if accommodation_to_show.empty:
+        return "No more accommodations to show."
+
+    response = header
+    response += ACCOMMODATION_CITY_CARD.render(accommodation_to_show)
+    response += "<br>For more detail try searching the name and calling the phone number provided<br>"
 
+    if session.offset < len(order):
+        response += "<br>Would you like to see more accommodations?"
+    else:
+        response += "<br>No more accommodations to show."
     return response
 
+def show_best_accommodation_anywhere(session, query):
+    return show_ranked_accommodation_anywhere(session, 'by_rating', "The best accommodation in Laguna is:<br>")
 
-def chatbot_response(query, user_id):
-    query = query.lower()
+def show_cheapest_accommodation_anywhere(session, query):
+    return show_ranked_accommodation_anywhere(session, 'by_min_price', "Here is the cheapest accommodation in Laguna:<br>")
 
-    if user_id not in pagination_state:
-        pagination_state[user_id] = {
-            'locations': 0, 'best_locations': 0, 'hours': 0, 'last_location_request': None, 'user_intent': None, 'city_name': None
-        }
+def show_most_expensive_accommodation_anywhere(session, query):
+    return show_ranked_accommodation_anywhere(session, 'by_max_price', "Here is the most expensive accommodation in Laguna:<br>")
 
-    city_name = extract_city(query)
-    if city_name is None:
-        return "Sorry, I couldn't determine the city you're asking about. Please include the city in your question(in (City)...)"
-    
-    if "famous food" in query or "local food" in query or "what to eat" in query or "foods" in query:
-        # Set the user intent to 'famous_food'
-        pagination_state[user_id]['user_intent'] = 'famous_food'
-        pagination_state[user_id]['city_name'] = city_name
-        # Show famous food in the city
-        return show_famous_food(user_id, city_name)
-
-    elif "where can i buy" in query or "where to buy" in query:
+def show_filtered_accommodations_anywhere(session, query):
+    data = catalog()
+    return filtered_accommodations_page(
+        session, query, data.accommodations, data.accommodation_filter_index, data.accommodation_rankings, "Laguna", ACCOMMODATION_CITY_CARD
+    )
+
+def show_best_locations_anywhere(session, query):
+    """Shows the best rated locations of every city together."""
+    data = catalog()
+
+    start_index = session.offset
+    num_results = extract_number(query, default=session.page_size or 5)
+    session.page_size = num_results
+    session.offset += num_results
+
+    if session.offset < len(data.location_ranking):
+        footer = "<br>Would you like to see more?"
+    else:
+        footer = "<br>No more best locations to show."
+
+    header = "Here are the best locations in Laguna based on ratings:<br>"
+    return chunks(header, LOCATION_CITY_CARD, lambda: ranked_page(data.locations, data.location_ranking, start_index, num_results), footer)
+
+def show_food_locations_anywhere(session, query):
+    """Returns the places in every city where the food the query names can be bought."""
+    foods, exact = catalog().find_foods(normalize_text(query))
+    if foods.empty:
+        return f"Sorry, I couldn't find {food_name_after_phrase(query)} in any city. Maybe you can try another food item?"
+
+    response = f"Here are places in Laguna where you can buy {foods['name'].iloc[0]}:<br>"
+    response += FOOD_LOCATION_CITY_CARD.render(foods)
+    return did_you_mean(foods['name'].iloc[0], exact, response)
+
+def show_food_type_anywhere(session, query):
+    """Returns the type of the food the query names, in every city that has it."""
+    foods, exact = catalog().find_foods(normalize_text(query))
+    if foods.empty:
+        return f"Sorry, I couldn't find {food_name_after_phrase(query)} in any city. Maybe you can try another food item?"
+
+    response = f"The type of food {foods['name'].iloc[0]} is:<br>"
+    response += FOOD_TYPE_CITY_LINE.render(foods)
+    return did_you_mean(foods['name'].iloc[0], exact, response)
+
+#Search_________________________________________________________________________________________________________
+# Distinct words a row must share with a question naming no city to answer it from every city. One
+# word is too often a stray one ("can you help me" -> "University of Perpetual Help").
+CATALOG_MIN_TERMS = 2
+
+# Words that send a question no intent matched to the foods instead of the locations.
+FOOD_WORDS = {"eat", "food", "foods", "snack", "snacks", "dessert", "desserts", "delicacy", "delicacies", "dish", "dishes", "pasalubong", "treats"}
+
+def search_results(query, city_name, limit=5):
+    """Returns whether a question asks about food, and the rows of the city's foods (if so) or
+    locations whose text best matches its words, best first. No rows if none shares a word with it."""
+    text = without_city(normalize_text(query))
+    food = not FOOD_WORDS.isdisjoint(text.split())
+    if city_name == ALL_CITIES:
+        data = catalog()
+        frame, index = (data.foods, data.food_search) if food else (data.locations, data.location_search)
+    else:
+        sheet = load_city_sheet(city_name, "Sheet3" if food else "Sheet1")
+        if sheet is None:
+            return food, None
+        frame = sheet.frame
+        # A BM25 matrix over the sheet's text, built once per dataset version
+        index = sheet.derived("food_search", build_food_search) if food else sheet.derived("location_search", build_location_search)
+    with metrics.span("search"):
+        return food, frame.take(search(index, text, limit, CATALOG_MIN_TERMS if city_name == ALL_CITIES else 1))
+
+def search_answer(query, city_name):
+    """Answers a question no intent matched ("where can i go swimming in los banos") with the
+    locations, or the foods if it asks about food, whose descriptions and activities best match
+    its words. Returns None if none shares a word with it."""
+    food, results = search_results(query, city_name, extract_number(query, default=5))
+    if results is None or results.empty:
+        return None
+    metrics.label("search")
+    if city_name == ALL_CITIES:
+        place, card = "Laguna", FOOD_CITY_CARD if food else LOCATION_CITY_CARD
+    else:
+        place, card = city_name, FOOD_CARD if food else LOCATION_CARD
+    header = f"Here are the {'foods' if food else 'places'} in {place} that best match your question:<br>"
+    return header + card.render(results)
+
+# Intents that can be answered across every city, taking (session, query).
+CATALOG_HANDLERS = {
+    'best_accommodation': show_best_accommodation_anywhere,
+    'cheapest_accommodation': show_cheapest_accommodation_anywhere,
+    'most_expensive_accommodation': show_most_expensive_accommodation_anywhere,
+    'filtered_accommodations': show_filtered_accommodations_anywhere,
+    'best_locations': show_best_locations_anywhere,
+    'food_locations': show_food_locations_anywhere,
+    'food_type': show_food_type_anywhere,
+}
+
+#Intents__________________________________________________________________________________________________
+# The first intent (in this order) with a phrase anywhere in the query wins.
+INTENTS = [
+    ('famous_food', ["famous food", "local food", "what to eat", "foods"]),
+    ('food_locations', ["where can i buy", "where to buy"]),
+    ('food_type', ["what type of food", "type of food"]),
+    ('best_accommodation', ["best accommodation", "best hotel"]),
+    ('cheapest_accommodation', ["cheapest hotel", "cheapest accommodation"]),
+    ('most_expensive_accommodation', ["most expensive hotel", "most expensive accommodation"]),
+    ('accommodations', ["accommodation", "where to stay", "hotel"]),
+    ('open_now', ["open now", "open right now", "open at the moment"]),
+    ('open_on_day', [f"on {day}" for day in ("monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday")]
+                    + ["on weekends", "on the weekend", "this weekend", "on weekdays", "open today", "open tomorrow", "visit today", "visit tomorrow"]),
+    # Before 'rating', which "operating hours" also contains.
+    ('hours', ["operating hours", "opening hours", "operating time", "opening time"]),
+    ('available_dates', ["available date", "when is", "is it open"]),
+    ('best_season_why', ["why the best season", "why is this the best season", "why visit in this season"]),
+    ('best_date', ["best date", "ideal date", "when to visit"]),
+    ('best_season', ["best season", "best time to visit", "when to visit"]),
+    ('rating', ["rating", "rate", "what is the rating"]),
+    ('description', ["what is", "tell me about", "description of"]),
+    ('activities', ["activity", "activities", "what can i do"]),
+    ('best_locations', ["best location"]),
+    ('locations', ["location", "attraction"]),
+]
+intent_router = IntentRouter(INTENTS)
+
+# Intents answered from a single location's row in Sheet1.
+LOCATION_HANDLERS = {
+    'available_dates': show_available_dates_for_location,
+    'best_season_why': show_best_season_why_for_location,
+    'best_date': show_best_date_for_location,
+    'best_season': show_best_season_for_location,
+    'rating': show_rating_for_location,
+    'description': show_description_for_location,
+    'activities': show_activities_for_location,
+    'hours': show_hours_for_location,
+}
+
+# Intents about when a city's locations are open, taking (session, query, city name). Their answers
+# depend on the time of asking, so they are never cached.
+SCHEDULE_HANDLERS = {
+    'open_now': show_open_now,
+    'open_on_day': show_open_on_day,
+}
+
+# Intents whose answer depends only on the question and one sheet of the city's data, by that sheet.
+CACHEABLE_INTENTS = {'food_locations': "Sheet3", 'food_type': "Sheet3"}
+CACHEABLE_INTENTS.update((intent, "Sheet1") for intent in LOCATION_HANDLERS)
+
+# Intents whose results can be continued with "yes".
+PAGINATED_INTENTS = {'famous_food', 'best_accommodation', 'cheapest_accommodation', 'most_expensive_accommodation', 'accommodations', 'best_locations', 'locations', 'filtered_accommodations'}
+
+# Paginated intents whose later pages are computed from the question that started them.
+QUERY_INTENTS = {'filtered_accommodations'}
+
+ACCOMMODATION_INTENTS = {'accommodations', 'best_accommodation', 'cheapest_accommodation', 'most_expensive_accommodation'}
+
+def is_accommodation_filter(query, intent):
+    """Whether a question asks for accommodations within limits ("resorts under ₱2000 rated 4 and up")
+    rather than a fixed list. A kind alone ("resorts in calamba") counts only if no other intent matched."""
+    filters = parse_accommodation_filter(query)
+    if has_limits(filters):
+        return bool(filters.types) or intent in ACCOMMODATION_INTENTS
+    return bool(filters.types) and intent is None
+
+def show_more(session, intent, query, city_name):
+    """Shows the next page of results for a paginated intent."""
+    if intent in QUERY_INTENTS and session.query is not None:
+        query = session.query
+    if city_name == ALL_CITIES:
+        return CATALOG_HANDLERS[intent](session, query)
+    if intent == 'filtered_accommodations':
+        return show_filtered_accommodations(session, query, city_name)
+    if intent == 'accommodations':
+        return show_accommodations(session, city_name)
+    elif intent == 'best_accommodation':
+        return show_best_accommodation(session, city_name)
+    elif intent == 'locations':
+        return show_locations(session, query, city_name)
+    elif intent == 'best_locations':
+        return show_best_locations(session, query, city_name)
+    elif intent == 'cheapest_accommodation':
+        return show_cheapest_accommodation(session, city_name)
+    elif intent == 'most_expensive_accommodation':
+        return show_most_expensive_accommodation(session, city_name)
+    elif intent == 'famous_food':
+        return show_famous_food(session, city_name)
+
+def answer_question(intent, query, session, city_name):
+    """Answers a question about one food or location, which never starts a paginated list."""
+    if city_name == ALL_CITIES:
+        return CATALOG_HANDLERS[intent](session, query)
+
+    if intent == 'food_locations':
         # Pass the query to show_food_locations to extract the food name from it
-        return show_food_locations(user_id, city_name, query)
+        return show_food_locations(session, city_name, query)
 
-    elif "what type of food" in query or "type of food" in query:
+    if intent == 'food_type':
         # Pass the query to show_food_type to extract the food name from it
-        return show_food_type(user_id, city_name, query)
-
-    #Accommodations_____________________________________________________________________________
-    if "best accommodation" in query or "best hotel" in query:
-        # Set the user intent to 'best_accommodation'
-        pagination_state[user_id]['user_intent'] = 'best_accommodation'
-        pagination_state[user_id]['city_name'] = city_name
-        # Return the best-rated accommodation in the city
-        return show_best_accommodation(user_id, city_name)
-    
-    if "cheapest hotel" in query or "cheapest accommodation" in query:
-        pagination_state[user_id]['user_intent'] = 'cheapest_accommodation'
-        pagination_state[user_id]['city_name'] = city_name
-        return show_cheapest_accommodation(user_id, city_name)
-    
-    if "most expensive hotel" in query or "most expensive accommodation" in query:
-        # Set the user intent to 'most_expensive_accommodation'
-        pagination_state[user_id]['user_intent'] = 'most_expensive_accommodation'
-        pagination_state[user_id]['city_name'] = city_name
-        # Show the most expensive accommodation in the city
-        return show_most_expensive_accommodation(user_id, city_name)
-    
-    if "accommodation" in query or "where to stay" in query or "hotel" in query:
-        # Set the user intent to 'accommodations'
-        pagination_state[user_id]['user_intent'] = 'accommodations'
-        pagination_state[user_id]['city_name'] = city_name
-        # Show accommodations in the city
-        return show_accommodations(user_id, city_name)
-    
-    #Locations___________________________________________________________________________________________________________
-    if "available date" in query or "when is" in query or "is it open" in query:
-        location_name = extract_location(query, city_name)
-        if location_name:
-            return show_available_dates_for_location(user_id, location_name, city_name)
-        else:
-            return "Sorry, I couldn't identify the location you're asking about. Please provide a clear location name."
-    
-    if "why the best season" in query or "why is this the best season" in query or "why visit in this season" in query:
-        location_name = extract_location(query, city_name)
-        if location_name:
-            return show_best_season_why_for_location(user_id, location_name, city_name)
-        else:
-            return "Sorry, I couldn't identify the location you're asking about. Please provide a clear location name."
-    
-    if "best date" in query or "ideal date" in query or "when to visit" in query:
-        location_name = extract_location(query, city_name)
-        if location_name:
-            return show_best_date_for_location(user_id, location_name, city_name)
-        else:
-            return "Sorry, I couldn't identify the location you're asking about. Please provide a clear location name."
-    
-    if "best season" in query or "best time to visit" in query or "when to visit" in query:
-        location_name = extract_location(query, city_name)
-        if location_name:
-            return show_best_season_for_location(user_id, location_name, city_name)
-        else:
-            return "Sorry, I couldn't identify the location you're asking about. Please provide a clear location name."
-    
-    if "rating" in query or "rate" in query or "what is the rating" in query:
-        location_name = extract_location(query, city_name)
-        if location_name:
-            return show_rating_for_location(user_id, location_name, city_name)
-        else:
-            return "Sorry, I couldn't identify the location you're asking about. Please provide a clear location name."
-
-    if "what is" in query or "tell me about" in query or "description of" in query:
-        location_name = extract_location(query, city_name)
-        if location_name:
-            return show_description_for_location(user_id, location_name, city_name)
-        else:
-            return "Sorry, I couldn't identify the location you're asking about. Please provide a clear location name."
-
-    if "activity" in query or "activities" in query or "what can i do" in query:
-        location_name = extract_location(query, city_name)
-        if location_name:
-            return show_activities_for_location(user_id, location_name, city_name)
-        else:
-            return "Sorry, I couldn't identify the location you're asking about. Please provide a clear location name."
-
-    if "location" in query or "attraction" in query:
-        if "best location" in query or "best locations" in query or "rating" in query:
-            pagination_state[user_id]['user_intent'] = 'best_locations'
-            pagination_state[user_id]['city_name'] = city_name
-            return show_best_locations(user_id, query, city_name)
-        else:
-            pagination_state[user_id]['user_intent'] = 'locations'
-            pagination_state[user_id]['city_name'] = city_name
-            return show_locations(user_id, query, city_name)
-
-    elif "operating hours" in query or "opening hours" in query or "operating time" in query or "opening time" in query:
-        location_name = extract_location(query, city_name)
-        if location_name:
-            return show_hours_for_location(user_id, location_name, city_name)
-        else:
-            return "Sorry, I couldn't identify the location you're asking about. Please provide a clear location name."
+        return show_food_type(session, city_name, query)
 
+    location_name, exact = extract_location(query, city_name)
+    if location_name:
+        return did_you_mean(location_name, exact, LOCATION_HANDLERS[intent](session, location_name, city_name))
     else:
-        return "Sorry, I didn't quite get that. Please ask about something you want to know about the place."
+        return "Sorry, I couldn't identify the location you're asking about. Please provide a clear location name."
+
+def cached_answer(intent, query, session, city_name):
+    """Answers a question, reusing the response to the same normalized question about the same dataset version."""
+    sheet = load_city_sheet(city_name, CACHEABLE_INTENTS[intent])
+    if sheet is None:
+        return answer_question(intent, query, session, city_name)
+
+    # A food that can't be found is echoed as typed, so only location questions can share a normalized key.
+    question = query if CACHEABLE_INTENTS[intent] == "Sheet3" else normalize_text(query)
+    # The intent is classified on the raw query, so two questions that normalize alike can still differ in it.
+    key = (intent, question, city_name, sheet.version)
+    response = response_cache.get(key)
+    if response is None:
+        response = answer_question(intent, query, session, city_name)
+        response_cache.put(key, response)
+    return response
+
+def chatbot_response(query, session):
+    query = query.lower()
+
+    city_name = extract_city(query)
+    with metrics.span("intent"):
+        intent, _ = intent_router.classify(query)
+        if is_accommodation_filter(query, intent):
+            intent = 'filtered_accommodations'
+    metrics.label(intent or "unknown")
+
+    if city_name is None:
+        if intent is None:
+            response = search_answer(query, ALL_CITIES)
+            if response is not None:
+                return response
+        if intent not in CATALOG_HANDLERS:
+            return "Sorry, I couldn't determine the city you're asking about. Please include the city in your question(in (City)...)"
+        city_name = ALL_CITIES
+
+    if intent in PAGINATED_INTENTS:
+        # Start from the first page and remember the intent and city so "yes" can continue from here
+        session.start(intent, city_name, query if intent in QUERY_INTENTS else None)
+        return show_more(session, intent, query, city_name)
+
+    if intent in SCHEDULE_HANDLERS:
+        return SCHEDULE_HANDLERS[intent](session, query, city_name)
+
+    if intent in CACHEABLE_INTENTS:
+        return cached_answer(intent, query, session, city_name)
+
+    response = search_answer(query, city_name)
+    if response is not None:
+        return response
+    return "Sorry, I didn't quite get that. Please ask about something you want to know about the place."
+
+@metrics.timed("answer")
+def handle_query(user_query, session):
+    """Answers one message, treating "yes" and "no" as follow-ups to the previous question."""
+    user_query_lower = user_query.lower()
+
+    # Whole words only: "no" also occurs inside "los banos", "know" or "nothing".
+    if re.search(r"\bno\b", user_query_lower):
+        metrics.label("no")
+        # Reset pagination and user intent when user says "no"
+        session.reset()
+        return "Okay, I won't show more results. Let me know if you need anything else."
+
+    if re.search(r"\byes\b", user_query_lower):
+        metrics.label(session.intent or "yes")
+        if session.intent is None:
+            return "Please ask about locations, best locations, or accommodations first before requesting more."
+
+        return show_more(session, session.intent, user_query, session.city_name)
+
+    # Default handling for queries
+    return chatbot_response(user_query, session)
+
+def session_from_cursor(token):
+    """Returns the Session a client's cursor describes, or None if it is missing or not one we issued."""
+    session = decode_cursor(token)
+    if session is None:
+        return None
+    if session.intent is None:
+        return session  # issued after "no": nothing to continue
+    if session.intent not in PAGINATED_INTENTS:
+        return None
+    if session.city_name == ALL_CITIES:
+        return session if session.intent in CATALOG_HANDLERS else None
+    if session.city_name not in city_index().files:
+        return None
+    return session
+
+def open_query(payload):
+    """Starts answering one /query request body ({query, user_id, cursor}).
+
+    Returns the response, either a string or an iterator of HTML chunks, and a function
+    to call once it has been consumed, which saves the session and returns the fields
+    that go with the response (the cursor).
+    """
+    if not isinstance(payload, dict):
+        return "Please send a valid query.", dict
+    user_query = payload.get('query')
+    user_id = payload.get('user_id')  # Unique identifier for each user session
+    if isinstance(user_query, str) and user_query and user_id:
+        # A cursor from the previous response carries the whole pagination state,
+        # so continuing with it needs no server-side session at all.
+        session = session_from_cursor(payload.get('cursor'))
+        if session is not None:
+            with dataset_cache.consistent():
+                return handle_query(user_query, session), lambda: {'cursor': encode_cursor(session)}
+
+        # One session read and one write per request, whichever backend holds them.
+        session_id = str(user_id)[:128]
+        with metrics.span("session"):
+            session = sessions.load(session_id)
+
+        def finish():
+            with metrics.span("session"):
+                sessions.save(session_id, session)
+            return {'cursor': encode_cursor(session)}
+
+        # Every sheet this question reads comes from the same dataset version.
+        with dataset_cache.consistent():
+            return handle_query(user_query, session), finish
+
+    return "Please send a valid query.", dict
+
+def answer_query(payload):
+    """Answers one /query request body with the JSON object to send back."""
+    return timed_answer(payload)[0]
+
+def timed_answer(payload):
+    """Like answer_query, but also returns the request's metrics.Timings."""
+    with metrics.request() as timings:
+        response, finish = open_query(payload)
+        if not isinstance(response, str):
+            with metrics.span("render"):
+                response = "".join(response)
+        return {'response': response, **finish()}, timings
+
+# Streamed /query responses by media type: how each JSON event is framed.
+STREAM_FORMATS = {
+    'application/x-ndjson': lambda event: json.dumps(event) + "\n",
+    'text/event-stream': lambda event: "data: " + json.dumps(event) + "\n\n",
+}
+
+def stream_format(accept):
+    """Returns the streaming media type a client's Accept header (a MIMEAccept) prefers to JSON, or None."""
+    media_type = accept.best_match(['application/json', *STREAM_FORMATS])
+    return media_type if media_type in STREAM_FORMATS else None
+
+def stream_query(payload, frame):
+    """Answers one /query request body as events: {'chunk': html} pieces of the response, then {'done': true, 'cursor': ...}."""
+    # The events may be produced on different threads (see asgi.py), so the request's timings
+    # are bound around each step that runs handler code instead of around the whole generator.
+    timings = metrics.Timings()
+    try:
+        with metrics.bind(timings):
+            response, finish = open_query(payload)
+        for chunk in [response] if isinstance(response, str) else response:
+            yield frame({'chunk': chunk})
+        with metrics.bind(timings):
+            done = finish()
+        yield frame({'done': True, **done})
+    except Exception:
+        timings.failed = True
+        raise
+    finally:
+        metrics.finish(timings)
+
+def answer_batch(items):
+    """Answers a list of /query request bodies, returning their responses in the same order."""
+    # Load each city's workbook once for the whole batch and pin it, so every question about
+    # that city reads the same version and none of them re-check or re-parse the file, even
+    # when the batch touches more cities than the dataset cache holds.
+    cities = {extract_city(item['query']) for item in items if isinstance(item, dict) and isinstance(item.get('query'), str)}
+    cities.discard(None)
+    _pinned.sheets = {(city, sheet): load_city_sheet(city, sheet) for city in sorted(cities) for sheet in SNAPSHOT_SHEETS}
+    try:
+        # Items are answered in order, so each user's follow-ups ("yes", "no") see their earlier questions.
+        return [answer_query(item) for item in items]
+    finally:
+        _pinned.sheets = None
 
 @app.route('/query', methods=['POST'])
 def query():
-    user_query = request.json.get('query')
-    user_id = request.json.get('user_id')  # Unique identifier for each user session
-    if user_query and user_id:
-        user_query_lower = user_query.lower()
-
-        if "no" in user_query_lower:
-            # Reset pagination and user intent when user says "no"
-            pagination_state[user_id]['user_intent'] = None
-            pagination_state[user_id]['locations'] = 0
-            pagination_state[user_id]['best_locations'] = 0
-            pagination_state[user_id]['accommodations'] = 0
-            pagination_state[user_id]['hours'] = 0
-            pagination_state[user_id]['city_name'] = None  # Clear city info
-            return jsonify({'response': "Okay, I won't show more results. Let me know if you need anything else."})
-
-        if "yes" in user_query_lower:
-            if pagination_state[user_id]['user_intent'] is None:
-                return jsonify({'response': "Please ask about locations, best locations, or accommodations first before requesting more."})
-
-            city_name = pagination_state[user_id]['city_name']
-            if pagination_state[user_id]['user_intent'] == 'accommodations':
-                response = show_accommodations(user_id, city_name)
-            elif pagination_state[user_id]['user_intent'] == 'best_accommodation':
-                response = show_best_accommodation(user_id, city_name)
-            elif pagination_state[user_id]['user_intent'] == 'locations':
-                response = show_locations(user_id, user_query, city_name)
-            elif pagination_state[user_id]['user_intent'] == 'best_locations':
-                response = show_best_locations(user_id, user_query, city_name)
-            elif pagination_state[user_id]['user_intent'] == 'cheapest_accommodation':
-                response = show_cheapest_accommodation(user_id, city_name)
-            elif pagination_state[user_id]['user_intent'] == 'most_expensive_accommodation':
-                response = show_most_expensive_accommodation(user_id, city_name)
-            elif pagination_state[user_id]['user_intent'] == 'famous_food':
-                response = show_famous_food(user_id, city_name)
-
-            return jsonify({'response': response})
-
-        # Default handling for queries
-        response = chatbot_response(user_query, user_id)
-        return jsonify({'response': response})
-
-    return jsonify({'response': "Please send a valid query."})
+    # Clients that accept NDJSON or server-sent events over JSON get the response as it is rendered.
+    payload = request.get_json(force=True, silent=True)
+    if not isinstance(payload, dict):
+        # The same answer asgi.py gives a body that is not a JSON object.
+        return jsonify({'response': "Please send a valid query."}), 400
+    media_type = stream_format(request.accept_mimetypes)
+    if media_type is not None:
+        events = stream_query(payload, STREAM_FORMATS[media_type])
+        return Response(events, mimetype=media_type, headers={'Cache-Control': 'no-cache'})
+    body, timings = timed_answer(payload)
+    response = jsonify(body)
+    if timing_header:
+        response.headers['Server-Timing'] = timings.server_timing()
+    return response
+
+@app.route('/query/batch', methods=['POST'])
+def query_batch():
+    # Parsed like /query's body, so a body that is not JSON gets the JSON 400 below.
+    items = request.get_json(force=True, silent=True)
+    if not isinstance(items, list) or len(items) > max_batch_size:
+        return jsonify({'error': f"Please send a list of at most {max_batch_size} queries."}), 400
+    return jsonify(answer_batch(items))
+
+@app.route('/stats', methods=['GET'])
+def stats():
+    """Reports the size and hit/miss counters of the caches and the session store."""
+    return jsonify(cache_stats())
+
+def cache_stats():
+    return {
+        'datasets': dataset_cache.stats(),
+        'responses': response_cache.stats(),
+        'sessions': sessions.stats(),
+    }
+
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    """Reports request and stage latencies and the cache counters in the Prometheus text format."""
+    return Response(metrics_text(), mimetype="text/plain; version=0.0.4")
+
+# cache_stats() fields that are current levels rather than running totals.
+GAUGE_STATS = {'size', 'maxsize', 'live', 'max_sessions', 'workbooks'}
+
+def metrics_text():
+    lines = []
+    for cache, stats in cache_stats().items():
+        for key, value in stats.items():
+            if not isinstance(value, (int, float)):
+                continue
+            if key in GAUGE_STATS:
+                name, kind = f"chatbot_{cache}_{key}", "gauge"
+            else:
+                name, kind = f"chatbot_{cache}_{key}_total", "counter"
+            lines += [f"# TYPE {name} {kind}", f"{name} {value}"]
+    return metrics.render(lines)
+
+def preload_datasets(freeze=True):
+    """Loads every sheet of every city, with its derived indexes, and the catalog into this process.
+
+    Meant for a master process about to fork its workers: they inherit all of it and share its
+    pages until something writes to them. freeze moves every object alive now into the garbage
+    collector's permanent generation, so collections in the workers never visit (and so copy)
+    them. A workbook that changes afterwards is loaded again by each worker on its own.
+    """
+    for city in city_index().files:
+        for sheet_name in SNAPSHOT_SHEETS:
+            sheet = load_city_sheet(city, sheet_name)
+            if sheet is not None:
+                for name, build in DERIVED_INDEXES[sheet_name]:
+                    sheet.derived(name, build)
+    catalog()
+    if freeze:
+        gc.collect()
+        gc.freeze()
+
+if preload:
+    if dataset_reload == "watch":
+        # Threads do not survive a fork, so the master loads without one and each worker starts its own.
+        dataset_cache.autostart = False
+        os.register_at_fork(after_in_child=dataset_cache.start)
+    preload_datasets()
 
 if __name__ == '__main__':
+    # Compile any workbook that changed since the last run so workers load the fast snapshots.
+    build_snapshots(datasets_path)
+    if dataset_reload == "watch":
+        dataset_cache.start()
     app.run(debug=True, host="0.0.0.0", port=5000)
@@ -0,0 +1,167 @@
+"""ASGI entry point for the chatbot, for servers such as uvicorn or hypercorn:
+
+    uvicorn asgi:application --host 0.0.0.0 --port 5000
+
+Serves POST /query and /query/batch with the same JSON contracts as the Flask app (and
+GET /stats and /metrics), but answers each query on a bounded thread pool so a workbook being parsed
+for one city never blocks the event loop or the requests for other cities behind it.
+Requests that miss on the same workbook at the same time share a single parse (see
+DatasetCache.load).
+"""
+import asyncio
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from werkzeug.datastructures import MIMEAccept
+from werkzeug.http import parse_accept_header
+
+import app as chatbot
+
+query_workers = int(os.environ.get("CHATBOT_QUERY_WORKERS", 8))
+executor = ThreadPoolExecutor(max_workers=query_workers, thread_name_prefix="chatbot-query")
+
+# Largest request body accepted, in bytes.
+max_body_size = 64 * 1024
+max_batch_body_size = 16 * 1024 * 1024
+
+# Matches flask_cors' defaults on the Flask app, so Untitled-1.html works against either.
+CORS_HEADERS = [
+    (b"access-control-allow-origin", b"*"),
+]
+PREFLIGHT_HEADERS = CORS_HEADERS + [
+    (b"access-control-allow-methods", b"GET, POST, OPTIONS"),
+    (b"access-control-allow-headers", b"content-type"),
+]
+
+
+async def application(scope, receive, send):
+    if scope["type"] == "lifespan":
+        await _lifespan(receive, send)
+        return
+    if scope["type"] != "http":
+        return
+
+    method, path = scope["method"], scope["path"]
+    if method == "OPTIONS":
+        await _send(send, 204, None, PREFLIGHT_HEADERS)
+    elif path == "/query" and method == "POST":
+        await _query(receive, send, _stream_format(scope))
+    elif path == "/query/batch" and method == "POST":
+        await _query_batch(receive, send)
+    elif path == "/stats" and method == "GET":
+        await _send(send, 200, chatbot.cache_stats())
+    elif path == "/metrics" and method == "GET":
+        await _send_text(send, 200, chatbot.metrics_text(), b"text/plain; version=0.0.4; charset=utf-8")
+    elif path in ("/query", "/query/batch", "/stats", "/metrics"):
+        await _send(send, 405, {"error": "Method not allowed"})
+    else:
+        await _send(send, 404, {"error": "Not found"})
+
+
+async def run_in_pool(func, *args):
+    """Runs blocking work (workbook loads, pandas) on the query pool and waits for it without blocking the loop."""
+    return await asyncio.get_running_loop().run_in_executor(executor, func, *args)
+
+
+async def _query(receive, send, media_type=None):
+    body = await _read_body(receive)
+    try:
+        payload = json.loads(body) if body is not None else None
+    except ValueError:
+        payload = None
+    if not isinstance(payload, dict):
+        await _send(send, 400, {"response": "Please send a valid query."})
+        return
+    if media_type is None:
+        body, timings = await run_in_pool(chatbot.timed_answer, payload)
+        headers = CORS_HEADERS
+        if chatbot.timing_header:
+            headers = headers + [(b"server-timing", timings.server_timing().encode("ascii"))]
+        await _send(send, 200, body, headers)
+        return
+
+    # Each event is rendered on the pool and sent as soon as it is ready.
+    events = chatbot.stream_query(payload, chatbot.STREAM_FORMATS[media_type])
+    headers = CORS_HEADERS + [(b"content-type", media_type.encode("ascii")), (b"cache-control", b"no-cache")]
+    await send({"type": "http.response.start", "status": 200, "headers": headers})
+    while True:
+        event = await run_in_pool(next, events, None)
+        if event is None:
+            break
+        await send({"type": "http.response.body", "body": event.encode("utf-8"), "more_body": True})
+    await send({"type": "http.response.body", "body": b""})
+
+
+def _stream_format(scope):
+    """Returns the streaming media type the client prefers over JSON, or None, negotiated
+    (q-values included) exactly as the Flask app does."""
+    accept = ",".join(value.decode("latin-1") for name, value in scope.get("headers", []) if name == b"accept")
+    return chatbot.stream_format(parse_accept_header(accept, MIMEAccept))
+
+
+async def _query_batch(receive, send):
+    body = await _read_body(receive, max_batch_body_size)
+    try:
+        items = json.loads(body) if body is not None else None
+    except ValueError:
+        items = None
+    if not isinstance(items, list) or len(items) > chatbot.max_batch_size:
+        await _send(send, 400, {"error": f"Please send a list of at most {chatbot.max_batch_size} queries."})
+        return
+    # One pool task for the whole batch: the sheets it pins belong to the thread answering it.
+    await _send(send, 200, await run_in_pool(chatbot.answer_batch, items))
+
+
+async def _read_body(receive, limit=None):
+    """Returns the request body, or None if it is larger than limit (max_body_size by default)."""
+    limit = limit or max_body_size
+    chunks = []
+    size = 0
+    while True:
+        message = await receive()
+        if message["type"] == "http.disconnect":
+            return None
+        chunk = message.get("body", b"")
+        size += len(chunk)
+        if size > limit:
+            return None
+        chunks.append(chunk)
+        if not message.get("more_body"):
+            return b"".join(chunks)
+
+
+async def _send(send, status, payload, headers=CORS_HEADERS):
+    body = b"" if payload is None else json.dumps(payload).encode("utf-8")
+    response_headers = list(headers)
+    if payload is not None:
+        response_headers += [
+            (b"content-type", b"application/json"),
+            (b"content-length", str(len(body)).encode("ascii")),
+        ]
+    await send({"type": "http.response.start", "status": status, "headers": response_headers})
+    await send({"type": "http.response.body", "body": body})
+
+
+async def _send_text(send, status, text, content_type):
+    body = text.encode("utf-8")
+    headers = CORS_HEADERS + [(b"content-type", content_type), (b"content-length", str(len(body)).encode("ascii"))]
+    await send({"type": "http.response.start", "status": status, "headers": headers})
+    await send({"type": "http.response.body", "body": body})
+
+
+async def _lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            # Same as app.py's __main__: compile changed workbooks before taking traffic.
+            await run_in_pool(chatbot.build_snapshots, chatbot.datasets_path)
+            if chatbot.dataset_reload == "watch":
+                await run_in_pool(chatbot.dataset_cache.start)
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            if chatbot.dataset_reload == "watch":
+                await run_in_pool(chatbot.dataset_cache.stop)
+            executor.shutdown(wait=True)
+            await send({"type": "lifespan.shutdown.complete"})
+            return
@@ -0,0 +1,1376 @@
+"""Benchmarks for the chatbot's data paths.
+
+Run ``python benchmark.py <name> [args...]``; every benchmark prints its results as JSON
+so runs can be saved and diffed between commits.
+"""
+import glob
+import json
+import os
+import subprocess
+import sys
+import time
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+default_datasets_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "data")
+
+BENCHMARKS = {}
+
+
+def benchmark(func):
+    BENCHMARKS[func.__name__[len("bench_"):]] = func
+    return func
+
+
+def peak_rss_kb():
+    """Returns the peak resident set size of this process in KiB, if the platform reports it."""
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss // 1024 if sys.platform == "darwin" else rss
+
+
+def current_rss_kb():
+    """Returns the current resident set size of this process in KiB, falling back to the peak."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") // 1024
+    except (OSError, AttributeError, ValueError):
+        return peak_rss_kb()
+
+
+def _child_load(mode, path):
+    """Loads every sheet of one workbook in a fresh process and reports time and memory."""
+    import datasets
+
+    rss_before = current_rss_kb()
+    start = time.perf_counter()
+    if mode == "snapshot":
+        datasets.read_workbook(path)
+    else:
+        for sheet in datasets.SNAPSHOT_SHEETS:
+            datasets.parse_sheet(path, sheet)
+    elapsed = time.perf_counter() - start
+    rss_after = current_rss_kb()
+    print(json.dumps({
+        "seconds": elapsed,
+        "rss_kb": rss_after,
+        "rss_delta_kb": None if rss_after is None else rss_after - rss_before,
+    }))
+
+
+@benchmark
+def bench_snapshot(datasets_path=default_datasets_path):
+    """Cold-load time and RSS of every workbook from Excel versus from its snapshot."""
+    import datasets
+
+    datasets.build_snapshots(datasets_path)
+    results = {}
+    for path in sorted(glob.glob(os.path.join(datasets_path, "*.xlsx"))):
+        city = os.path.splitext(os.path.basename(path))[0]
+        results[city] = {}
+        for mode in ("excel", "snapshot"):
+            # A fresh interpreter per load so neither mode benefits from warm imports or caches.
+            output = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), "_load", mode, path],
+                check=True, capture_output=True, text=True,
+            ).stdout
+            results[city][mode] = json.loads(output)
+
+    for mode in ("excel", "snapshot"):
+        results.setdefault("total", {})[mode] = {
+            "seconds": sum(r[mode]["seconds"] for city, r in results.items() if city != "total"),
+        }
+    results["total"]["speedup"] = results["total"]["excel"]["seconds"] / results["total"]["snapshot"]["seconds"]
+    return results
+
+
+# Representative questions, one or more per intent, plus a few that match nothing.
+INTENT_CORPUS = [
+    "what famous food can i try in calamba",
+    "show me local food in bay",
+    "what to eat in sta rosa",
+    "where can i buy buko pie in calamba",
+    "where to buy espasol in los baños",
+    "what type of food is bibingka in calamba",
+    "best hotel in san pedro",
+    "best accommodation in binan",
+    "cheapest hotel in cabuyao",
+    "most expensive accommodation in los baños",
+    "where to stay in pagsanjan",
+    "show me hotels in santa cruz",
+    "what are the available dates for rizal shrine in calamba",
+    "is it open on sundays, nuvali in sta rosa",
+    "why is this the best season for enchanted kingdom in sta rosa",
+    "what is the best date to visit nuvali in sta rosa",
+    "best time to visit pagsanjan falls in pagsanjan",
+    "what is the rating of rizal shrine in calamba",
+    "tell me about laguna capitol grounds in santa cruz",
+    "what activities can i do at sm city calamba in calamba",
+    "what can i do in kalayaan",
+    "show me the best locations in san pedro",
+    "show 10 locations in victoria",
+    "tourist attractions in bay",
+    "what are the opening hours of st. therese of lisieux shrine in calamba",
+    "operating time of japanese garden in santa cruz",
+    "what are the opening hours of rizal shrine on sunday in calamba",
+    "is rizal shrine open today in calamba",
+    "is rizal shrine open now in calamba",
+    "what is open now in calamba",
+    "hello there, i am planning a trip to calamba next week with my family",
+    "where can i go swimming in los baños",
+]
+
+
+# Questions the intent table routes differently from the chain on purpose, with the intent it picks.
+# Schedule questions naming a location are answered for that location, from its hours and days.
+INTENT_CHANGES = {
+    "is it open on sundays, nuvali in sta rosa": 'open_on_day',
+    "what are the opening hours of rizal shrine on sunday in calamba": 'open_on_day',
+    "is rizal shrine open today in calamba": 'open_on_day',
+    "is rizal shrine open now in calamba": 'open_now',
+    "what is open now in calamba": 'open_now',
+    # The chain took the "rating" in "operating" for a rating question.
+    "operating time of japanese garden in santa cruz": 'hours',
+}
+
+
+def _legacy_classify(query):
+    """The if/elif chain chatbot_response used before the intent table, kept for comparison."""
+    if "famous food" in query or "local food" in query or "what to eat" in query or "foods" in query:
+        return 'famous_food'
+    elif "where can i buy" in query or "where to buy" in query:
+        return 'food_locations'
+    elif "what type of food" in query or "type of food" in query:
+        return 'food_type'
+    if "best accommodation" in query or "best hotel" in query:
+        return 'best_accommodation'
+    if "cheapest hotel" in query or "cheapest accommodation" in query:
+        return 'cheapest_accommodation'
+    if "most expensive hotel" in query or "most expensive accommodation" in query:
+        return 'most_expensive_accommodation'
+    if "accommodation" in query or "where to stay" in query or "hotel" in query:
+        return 'accommodations'
+    if "available date" in query or "when is" in query or "is it open" in query:
+        return 'available_dates'
+    if "why the best season" in query or "why is this the best season" in query or "why visit in this season" in query:
+        return 'best_season_why'
+    if "best date" in query or "ideal date" in query or "when to visit" in query:
+        return 'best_date'
+    if "best season" in query or "best time to visit" in query or "when to visit" in query:
+        return 'best_season'
+    if "rating" in query or "rate" in query or "what is the rating" in query:
+        return 'rating'
+    if "what is" in query or "tell me about" in query or "description of" in query:
+        return 'description'
+    if "activity" in query or "activities" in query or "what can i do" in query:
+        return 'activities'
+    if "location" in query or "attraction" in query:
+        if "best location" in query or "best locations" in query or "rating" in query:
+            return 'best_locations'
+        return 'locations'
+    elif "operating hours" in query or "opening hours" in query or "operating time" in query or "opening time" in query:
+        return 'hours'
+    return None
+
+
+def _per_query_cost(classify, queries, repeat):
+    costs = []
+    for query in queries:
+        start = time.perf_counter()
+        for _ in range(repeat):
+            classify(query)
+        costs.append((time.perf_counter() - start) / repeat * 1e6)
+    costs.sort()
+    return {
+        "mean_us": sum(costs) / len(costs),
+        "median_us": costs[len(costs) // 2],
+        "max_us": costs[-1],
+    }
+
+
+@benchmark
+def bench_intents(repeat="2000"):
+    """Per-query intent classification cost of the old if/elif chain versus the compiled intent table,
+    and the questions they route differently other than the intended INTENT_CHANGES."""
+    from app import intent_router
+
+    repeat = int(repeat)
+    mismatches = [
+        query for query in INTENT_CORPUS
+        if INTENT_CHANGES.get(query, _legacy_classify(query)) != intent_router.classify(query)[0]
+    ]
+    return {
+        "queries": len(INTENT_CORPUS),
+        "mismatches": mismatches,
+        "before": _per_query_cost(_legacy_classify, INTENT_CORPUS, repeat),
+        "after": _per_query_cost(lambda query: intent_router.classify(query), INTENT_CORPUS, repeat),
+    }
+
+
+ACCOMMODATION_COLUMNS = [
+    'name', 'description', 'nearest_attraction', 'type_of_accomodation', 'level_of_accomodation', 'price_range',
+    'one-day_rate', '12-hours_rate', '6-hours_rate', 'rating', 'phone_number', 'distance_to_attraction', 'quality_service',
+]
+
+
+def synthetic_accommodations(count, seed=0):
+    """Builds a Sheet2-shaped frame of count accommodations with the formats seen in data/*.xlsx,
+    normalized like parse_sheet does."""
+    import numpy as np
+    import pandas as pd
+
+    from datasets import normalize_prices
+
+    rng = np.random.default_rng(seed)
+    low = rng.integers(3, 60, count) * 100
+    high = low + rng.integers(5, 40, count) * 100
+    frame = pd.DataFrame({
+        'name': [f"Hotel {i}" for i in range(count)],
+        'description': "A synthetic accommodation used for benchmarking.",
+        'nearest_attraction': rng.choice(["Rizal Shrine", "Nuvali", "Enchanted Kingdom", "Pagsanjan Falls"], count),
+        'type_of_accomodation': rng.choice(["Hotel", "Resort", "Inn", "Guesthouse", "Motel"], count),
+        'level_of_accomodation': rng.choice(["Budget", "Mid-range", "Luxury"], count),
+        'price_range': [f"₱{a:,} - ₱{b:,}" for a, b in zip(low, high)],
+        'one-day_rate': [f"₱{v:,}" for v in high],
+        '12-hours_rate': [f"₱{v:,}" for v in (low + high) // 2],
+        '6-hours_rate': [f"₱{v:,}" for v in low],
+        'rating': [f"{v:.1f}/5" for v in rng.integers(25, 51, count) / 10],
+        'phone_number': "+63 900 000 0000",
+        'distance_to_attraction': [f"{v} km" for v in rng.integers(1, 30, count)],
+        'quality_service': rng.choice(["High", "Medium"], count),
+    }, columns=ACCOMMODATION_COLUMNS)
+    return normalize_prices(frame, "Sheet2")
+
+
+def _legacy_cheapest_page(data, start):
+    """The per-request parse-and-sort show_cheapest_accommodation did before rankings were precomputed."""
+    def extract_min_price(price_range):
+        try:
+            min_price = price_range.split('-')[0].replace('₱', '').replace(',', '').strip()
+            return int(min_price)
+        except (ValueError, AttributeError):
+            return float('inf')
+
+    ranked = data.assign(min_price=data['price_range'].apply(extract_min_price)).sort_values(by='min_price', ascending=True)
+    return ranked.iloc[start:start + 1]
+
+
+def _legacy_price_bounds(data):
+    """The per-row parsing of the price range that handlers ran through .apply() on every request."""
+    def extract_min_price(price_range):
+        try:
+            return float(str(price_range).split('-')[0].replace('₱', '').replace(',', '').strip())
+        except ValueError:
+            return float('nan')
+
+    def extract_max_price(price_range):
+        try:
+            return float(str(price_range).split('-')[-1].replace('₱', '').replace(',', '').strip())
+        except ValueError:
+            return float('nan')
+
+    return data['price_range'].apply(extract_min_price), data['price_range'].apply(extract_max_price)
+
+
+@benchmark
+def bench_prices(sizes="1000,10000,100000"):
+    """Parsing every price column of Sheet2 at load time (vectorized) versus the price range alone per row."""
+    from datasets import PRICE_COLUMNS, normalize_prices
+
+    results = {}
+    for size in map(int, sizes.split(",")):
+        rows = synthetic_accommodations(size)[ACCOMMODATION_COLUMNS]
+        start = time.perf_counter()
+        _legacy_price_bounds(rows)
+        legacy = time.perf_counter() - start
+        start = time.perf_counter()
+        normalize_prices(rows.copy(), "Sheet2")
+        vectorized = time.perf_counter() - start
+        results[size] = {
+            "legacy_price_range_ms": legacy * 1e3,
+            "vectorized_all_columns_ms": vectorized * 1e3,
+            "columns": len(PRICE_COLUMNS["Sheet2"]),
+        }
+    return results
+
+
+def _time_pages(page, pages):
+    start = time.perf_counter()
+    for offset in range(pages):
+        page(offset)
+    return (time.perf_counter() - start) / pages * 1e3
+
+
+@benchmark
+def bench_rankings(sizes="100,1000,10000,100000", pages="20"):
+    """Latency of one "cheapest accommodation" page against the number of accommodations in the city."""
+    from datasets import SheetData
+    from rankings import build_accommodation_rankings, ranked_page
+
+    pages = int(pages)
+    results = {}
+    for size in map(int, sizes.split(",")):
+        data = synthetic_accommodations(size)
+        sheet = SheetData("synthetic.xlsx", "Sheet2", None, data)
+
+        start = time.perf_counter()
+        sheet.derived("accommodation_rankings", build_accommodation_rankings)
+        build_ms = (time.perf_counter() - start) * 1e3
+
+        def page(offset):
+            order = sheet.derived("accommodation_rankings", build_accommodation_rankings).by_min_price
+            return ranked_page(sheet.frame, order, offset, 1)
+
+        results[size] = {
+            "legacy_page_ms": _time_pages(lambda offset: _legacy_cheapest_page(data, offset), min(pages, 5)),
+            "ranked_page_ms": _time_pages(page, pages),
+            "ranking_build_ms": build_ms,
+        }
+    return results
+
+
+FILTER_QUERIES = [
+    "resorts under ₱2000 with rating above 4",
+    "budget hotels or inns",
+    "luxury resorts between 3000 and 5000",
+    "guesthouses rated 4.5 and up",
+]
+
+
+def _per_row_filter(data, filters):
+    """Filtering by checking every row's strings in Python, as the handlers did with their row loops."""
+    import re
+
+    from filters import ACCOMMODATION_LEVELS, ACCOMMODATION_TYPES
+
+    matches = []
+    for position, row in enumerate(data.itertuples(index=False)):
+        kind = row.type_of_accomodation.lower()
+        level = row.level_of_accomodation.lower()
+        prices = [float(value) for value in re.findall(r"\d+", row.price_range.replace(",", ""))]
+        low, high = prices[0], prices[-1]
+        rating = float(re.match(r"\d+(?:\.\d+)?", row.rating).group())
+        if filters.types and not any(word in kind for name in filters.types for word in ACCOMMODATION_TYPES[name]):
+            continue
+        if filters.levels and not any(word in level for name in filters.levels for word in ACCOMMODATION_LEVELS[name]):
+            continue
+        if filters.max_price is not None and not low <= filters.max_price:
+            continue
+        if filters.min_price is not None and not high >= filters.min_price:
+            continue
+        if filters.min_rating is not None and not rating >= filters.min_rating:
+            continue
+        matches.append(position)
+    return matches
+
+
+@benchmark
+def bench_filters(size="100000", repeat="20"):
+    """Accommodations within a budget, rating, kind and level: per-row checks versus one vectorized mask."""
+    import numpy as np
+
+    from filters import build_accommodation_index, filter_mask, parse_accommodation_filter
+
+    data = synthetic_accommodations(int(size))
+    start = time.perf_counter()
+    index = build_accommodation_index(data)
+    build_ms = (time.perf_counter() - start) * 1e3
+
+    results = {"accommodations": len(data), "index_build_ms": build_ms}
+    for query in FILTER_QUERIES:
+        filters = parse_accommodation_filter(query)
+        start = time.perf_counter()
+        expected = _per_row_filter(data, filters)
+        per_row = time.perf_counter() - start
+        start = time.perf_counter()
+        for _ in range(int(repeat)):
+            matches = np.flatnonzero(filter_mask(index, filters))
+        mask = (time.perf_counter() - start) / int(repeat)
+        assert matches.tolist() == expected, query
+        results[query] = {
+            "matches": len(expected),
+            "per_row_ms": per_row * 1e3,
+            "mask_ms": mask * 1e3,
+            "speedup": per_row / mask,
+        }
+    return results
+
+
+def _legacy_render(rows):
+    """The iterrows() + string concatenation loop the show_* handlers used before render.py."""
+    response = ""
+    for _, row in rows.iterrows():
+        response += (
+            f"<b>{row['name']}</b><br>"
+            f"Description: {row['description']}<br>"
+            f"Price Range: {row['price_range']}<br>"
+            f"One-Day Rate: {row['one-day_rate']}<br>"
+            f"Twelve Hours Rate: {row['12-hours_rate']}<br>"
+            f"Six Hours Rate: {row['6-hours_rate']}<br>"
+            f"Nearest Attraction: {row['nearest_attraction']}<br>"
+            f"Type: {row['type_of_accomodation']}<br>"
+            f"Level: {row['level_of_accomodation']}<br>"
+            f"Phone Number: {row['phone_number']}<br>"
+            f"Rating: {row['rating']}<br><br>"
+        )
+    return response
+
+
+@benchmark
+def bench_render(sizes="10,100,1000,10000", repeat="5"):
+    """Time to render a page of accommodation cards, old iterrows() loop versus the compiled template."""
+    from render import ACCOMMODATION_CARD
+
+    repeat = int(repeat)
+    results = {}
+    for size in map(int, sizes.split(",")):
+        rows = synthetic_accommodations(size)
+        assert _legacy_render(rows) == ACCOMMODATION_CARD.render(rows)
+        timings = {}
+        for name, render in (("legacy_ms", _legacy_render), ("template_ms", ACCOMMODATION_CARD.render)):
+            start = time.perf_counter()
+            for _ in range(repeat):
+                render(rows)
+            timings[name] = (time.perf_counter() - start) / repeat * 1e3
+        timings["speedup"] = timings["legacy_ms"] / timings["template_ms"]
+        results[size] = timings
+    return results
+
+
+LOAD_QUERIES = [
+    "show me locations in {city}",
+    "what are the best accommodations in {city}",
+    "what foods are famous in {city}",
+    "show me the cheapest hotel in {city}",
+    "yes",
+]
+
+
+def _percentile(values, percent):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * percent / 100))] if values else None
+
+
+def _load_summary(latencies, elapsed):
+    return {
+        "requests": len(latencies),
+        "requests_per_second": len(latencies) / elapsed,
+        "p50_ms": _percentile(latencies, 50) * 1e3,
+        "p95_ms": _percentile(latencies, 95) * 1e3,
+        "p99_ms": _percentile(latencies, 99) * 1e3,
+        "max_ms": max(latencies) * 1e3,
+    }
+
+
+def _client_payloads(client, cities, count):
+    """The messages one simulated user sends: questions about a few cities, each followed by "yes"."""
+    for i in range(count):
+        city = cities[(client + i // len(LOAD_QUERIES)) % len(cities)]
+        query = LOAD_QUERIES[i % len(LOAD_QUERIES)].format(city=city)
+        yield {"query": query, "user_id": f"load-{client}"}
+
+
+async def _asgi_post(application, path, payload):
+    body = json.dumps(payload).encode("utf-8")
+    received = []
+
+    async def receive():
+        return {"type": "http.request", "body": body, "more_body": False}
+
+    async def send(message):
+        received.append(message)
+
+    await application({"type": "http", "method": "POST", "path": path, "headers": []}, receive, send)
+    return received[0]["status"]
+
+
+def _http_post(url, payload):
+    from urllib.request import Request, urlopen
+
+    request = Request(url, json.dumps(payload).encode("utf-8"), {"Content-Type": "application/json"})
+    with urlopen(request) as response:
+        response.read()
+        return response.status
+
+
+@benchmark
+def bench_concurrency(clients="1,4,16,64", requests_per_client="25", datasets_path=default_datasets_path, url=None):
+    """Throughput and latency of /query under concurrent clients, starting from cold caches.
+
+    Without url, drives asgi.application in-process, once with a single query worker (what
+    one synchronous Flask worker can do) and once with the configured pool. With url (e.g.
+    http://localhost:5000/query), sends the requests to a running server from one thread
+    per client instead.
+    """
+    import asyncio
+    from concurrent.futures import ThreadPoolExecutor
+
+    import app
+    import asgi
+
+    app.datasets_path = os.path.join(datasets_path, "")
+    cities = sorted(app.city_index().files)
+    requests_per_client = int(requests_per_client)
+
+    async def run_asgi(count):
+        latencies = []
+
+        async def client(number):
+            for payload in _client_payloads(number, cities, requests_per_client):
+                start = time.perf_counter()
+                status = await _asgi_post(asgi.application, "/query", payload)
+                latencies.append(time.perf_counter() - start)
+                assert status == 200, status
+
+        await asyncio.gather(*(client(number) for number in range(count)))
+        return latencies
+
+    def run_http(count):
+        latencies = []
+
+        def client(number):
+            for payload in _client_payloads(number, cities, requests_per_client):
+                start = time.perf_counter()
+                status = _http_post(url, payload)
+                latencies.append(time.perf_counter() - start)
+                assert status == 200, status
+
+        with ThreadPoolExecutor(max_workers=count) as pool:
+            list(pool.map(client, range(count)))
+        return latencies
+
+    if url:
+        modes = {"http": None}
+    else:
+        modes = {"workers_1": 1, f"workers_{asgi.query_workers}": asgi.query_workers}
+
+    results = {}
+    for count in map(int, clients.split(",")):
+        results[count] = {}
+        for mode, workers in modes.items():
+            # Cold caches and fresh sessions for every run.
+            app.dataset_cache = app.DatasetCache(app.dataset_cache_size)
+            app.response_cache.clear()
+            app.sessions = app.open_session_store("memory", None, ttl=app.session_ttl, max_sessions=app.max_sessions)
+            start = time.perf_counter()
+            if workers is None:
+                latencies = run_http(count)
+            else:
+                asgi.executor = ThreadPoolExecutor(max_workers=workers)
+                latencies = asyncio.run(run_asgi(count))
+                asgi.executor.shutdown()
+            summary = _load_summary(latencies, time.perf_counter() - start)
+            if workers is not None:
+                summary["sheet_parses"] = app.dataset_cache.parses
+                summary["coalesced_loads"] = app.dataset_cache.coalesced
+            results[count][mode] = summary
+    return results
+
+@benchmark
+def bench_batch(clients="200", requests_per_client="5", datasets_path=default_datasets_path):
+    """Replaying a question log one POST /query at a time versus in a single POST /query/batch."""
+    import random
+
+    import app
+
+    app.datasets_path = os.path.join(datasets_path, "")
+    cities = sorted(app.city_index().files)
+    payloads = [payload for client in range(int(clients))
+                for payload in _client_payloads(client, cities, int(requests_per_client))]
+    client = app.app.test_client()
+
+    def replay(post):
+        # Same sessions, caches and shuffles for both runs, so their answers can be compared.
+        random.seed(0)
+        app.response_cache.clear()
+        app.sessions = app.open_session_store("memory", None, ttl=app.session_ttl, max_sessions=app.max_sessions)
+        for city in cities:
+            for sheet in app.SNAPSHOT_SHEETS:
+                app.load_city_sheet(city, sheet)  # both runs start from parsed workbooks
+        start = time.perf_counter()
+        responses = post()
+        return responses, time.perf_counter() - start
+
+    single, single_seconds = replay(lambda: [client.post("/query", json=payload).get_json() for payload in payloads])
+    batch, batch_seconds = replay(lambda: client.post("/query/batch", json=payloads).get_json())
+    assert single == batch
+    return {
+        "requests": len(payloads),
+        "single_seconds": single_seconds,
+        "batch_seconds": batch_seconds,
+        "speedup": single_seconds / batch_seconds,
+    }
+
+
+@benchmark
+def bench_metrics(requests_per_client="50", repeat="5", datasets_path=default_datasets_path):
+    """Per-query cost of the timing spans and /metrics counters, with warm caches, on versus off."""
+    import app
+    import metrics
+
+    app.datasets_path = os.path.join(datasets_path, "")
+    cities = sorted(app.city_index().files)
+    payloads = [payload for client in range(len(cities))
+                for payload in _client_payloads(client, cities, int(requests_per_client))]
+    for payload in payloads:
+        app.answer_query(payload)  # parse every workbook and fill the caches first
+
+    def per_query_us(enabled):
+        metrics.enabled = enabled
+        best = None
+        for _ in range(int(repeat)):
+            start = time.perf_counter()
+            for payload in payloads:
+                app.answer_query(payload)
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        return best / len(payloads) * 1e6
+
+    off, on = per_query_us(False), per_query_us(True)
+    metrics.enabled = True
+    return {
+        "queries": len(payloads),
+        "metrics_off_us": off,
+        "metrics_on_us": on,
+        "overhead_us": on - off,
+        "overhead_percent": (on - off) / off * 100,
+    }
+
+
+def synthetic_locations(count, seed=0):
+    """A Sheet1-shaped frame of count locations with ratings like the bundled workbooks."""
+    import numpy as np
+    import pandas as pd
+
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        "location": [f"Location {i}" for i in range(count)],
+        "rating": [f"{value:.1f}/5" for value in rng.uniform(1, 5, count)],
+        "entrance_fee": [f"\u20b1{value}" for value in rng.integers(0, 500, count)],
+        "to_do_activies": ["Sightseeing, swimming and picnics."] * count,
+    })
+
+
+def _per_row_open_at(data, when):
+    """Which locations are open, parsing every row's opening, closing and days strings per question."""
+    from schedules import EVERY_DAY, parse_days, parse_minute
+
+    minute, day = when.hour * 60 + when.minute, 1 << when.weekday()
+    matches = []
+    for position, (opening, closing, days) in enumerate(zip(data["opening"], data["closing"], data["available_days"])):
+        opening, closing = parse_minute(opening), parse_minute(closing)
+        if (parse_days(days) or EVERY_DAY) & day and opening <= minute < closing:
+            matches.append(position)
+    return matches
+
+
+@benchmark
+def bench_schedule(sizes="100,1000,10000,100000", repeat="20"):
+    """Latency of "what's open now": parsing every row's schedule per question versus the schedule arrays."""
+    import datetime
+
+    import numpy as np
+
+    from datasets import SheetData
+    from schedules import build_schedule, normalize_schedule, open_at
+
+    when = datetime.datetime(2024, 6, 2, 15, 30)  # a Sunday afternoon
+    results = {}
+    for size in map(int, sizes.split(",")):
+        rng = np.random.default_rng(0)
+        data = synthetic_locations(size).assign(
+            opening=[datetime.time(int(hour)) for hour in rng.integers(5, 11, size)],
+            closing=[datetime.time(int(hour)) for hour in rng.integers(15, 23, size)],
+            available_days=rng.choice(["Daily", "Monday to Friday", "Weekends", "Tuesday-Sunday"], size),
+        )
+        start = time.perf_counter()
+        sheet = SheetData("synthetic", "Sheet1", None, normalize_schedule(data))
+        schedule = sheet.derived("schedule", build_schedule)
+        build_ms = (time.perf_counter() - start) * 1e3
+
+        start = time.perf_counter()
+        expected = _per_row_open_at(data, when)
+        per_row = time.perf_counter() - start
+        start = time.perf_counter()
+        for _ in range(int(repeat)):
+            matches = np.flatnonzero(open_at(schedule, when))
+        indexed = (time.perf_counter() - start) / int(repeat)
+        assert matches.tolist() == expected
+        results[size] = {
+            "open": len(expected),
+            "per_row_ms": per_row * 1e3,
+            "schedule_ms": indexed * 1e3,
+            "schedule_build_ms": build_ms,
+        }
+    return results
+
+
+@benchmark
+def bench_streaming(sizes="10,100,1000,10000", repeat="5"):
+    """Time to the first chunk and to the whole response of "show N best locations", by page size."""
+    import app
+    from datasets import SheetData
+    from sessions import Session
+
+    repeat = int(repeat)
+    results = {}
+    for size in map(int, sizes.split(",")):
+        app.max_page_size = size
+        sheet = SheetData("synthetic", "Sheet1", None, synthetic_locations(size))
+        app._pinned.sheets = {("synthetic", "Sheet1"): sheet}
+        query = f"show {size} best locations"
+        app.show_best_locations(Session(), query, "synthetic")  # build the ranking outside the timings
+
+        first, whole = [], []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            response = app.show_best_locations(Session(), query, "synthetic")
+            next(response)
+            first.append(time.perf_counter() - start)
+            "".join(response)
+            whole.append(time.perf_counter() - start)
+        results[size] = {"first_chunk_ms": min(first) * 1e3, "whole_response_ms": min(whole) * 1e3}
+    app._pinned.sheets = None
+    return results
+
+
+def _per_city_best_accommodations(app, cities, count):
+    """Top accommodations across cities without the catalog: rank every city's sheet, then merge."""
+    import pandas as pd
+    from rankings import build_accommodation_rankings, first_number, ranked_page
+
+    pages = []
+    for city in cities:
+        sheet = app.load_city_sheet(city, "Sheet2")
+        if sheet is not None:
+            ranking = sheet.derived("accommodation_rankings", build_accommodation_rankings).by_rating
+            pages.append(ranked_page(sheet.frame, ranking, 0, count).assign(city=city))
+    merged = pd.concat(pages, ignore_index=True)
+    return merged.iloc[(-first_number(merged["rating"])).argsort(kind="stable")[:count]]
+
+
+@benchmark
+def bench_catalog(count="10", repeat="200", datasets_path=default_datasets_path):
+    """Top-k accommodations and food lookups across every city: per-city loops versus the merged catalog."""
+    import app
+    from rankings import ranked_page
+
+    app.datasets_path = os.path.join(datasets_path, "")
+    cities = sorted(app.city_index().files)
+    count, repeat = int(count), int(repeat)
+
+    start = time.perf_counter()
+    catalog = app.catalog()
+    build_seconds = time.perf_counter() - start  # includes parsing every sheet once
+
+    def per_query_ms(func):
+        start = time.perf_counter()
+        for _ in range(repeat):
+            func()
+        return (time.perf_counter() - start) / repeat * 1e3
+
+    def per_city_foods(name):
+        frames = [app.load_foods_data(city) for city in cities]
+        return [frame[frame["name"].str.contains(name, case=False, na=False, regex=False)] for frame in frames if frame is not None]
+
+    return {
+        "catalog_build_seconds": build_seconds,
+        "best_accommodations": {
+            "per_city_ms": per_query_ms(lambda: _per_city_best_accommodations(app, cities, count)),
+            "catalog_ms": per_query_ms(lambda: ranked_page(app.catalog().accommodations, catalog.accommodation_rankings.by_rating, 0, count)),
+        },
+        "food_by_name": {
+            "per_city_ms": per_query_ms(lambda: per_city_foods("buko pie")),
+            "catalog_ms": per_query_ms(lambda: app.catalog().find_foods("buko pie")),
+        },
+    }
+
+
+def misspell(text, rng):
+    """Returns text with one typo (a deleted, inserted, replaced or swapped letter) in one of its longer words."""
+    words = text.split()
+    longer = [i for i, word in enumerate(words) if len(word) >= 4] or list(range(len(words)))
+    i = longer[rng.integers(len(longer))]
+    word = words[i]
+    at = int(rng.integers(1, len(word) - 1)) if len(word) > 2 else 0
+    letter = "abcdefghijklmnopqrstuvwxyz"[rng.integers(26)]
+    edit = rng.integers(4)
+    if edit == 0:
+        word = word[:at] + word[at + 1:]
+    elif edit == 1:
+        word = word[:at] + letter + word[at:]
+    elif edit == 2:
+        word = word[:at] + letter + word[at + 1:]
+    elif len(word) > 2:
+        word = word[:at] + word[at + 1] + word[at] + word[at + 2:]
+    words[i] = word
+    return " ".join(words)
+
+
+@benchmark
+def bench_fuzzy(variants="5", datasets_path=default_datasets_path, seed="0"):
+    """Recall and latency of location and food lookups for questions with one typo in the name, and
+    how often a question about a name only other cities have is answered with one of this city's."""
+    import numpy as np
+
+    import app
+    from matchers import build_food_index, build_location_index, find_name, normalize_text
+
+    app.datasets_path = os.path.join(datasets_path, "")
+    rng = np.random.default_rng(int(seed))
+    kinds = {
+        "locations": ("Sheet1", build_location_index, "what is the rating of {name} in {city}"),
+        "foods": ("Sheet3", build_food_index, "where can i buy {name} in {city}"),
+    }
+    results = {}
+    for kind, (sheet_name, build, template) in kinds.items():
+        exact = top1 = top5 = total = 0
+        latencies = []
+        indexes = {}
+        for city in sorted(app.city_index().files):
+            sheet = app.load_city_sheet(city, sheet_name)
+            if sheet is not None:
+                indexes[city] = build(sheet.frame)
+        for city, index in indexes.items():
+            for key in index.names:
+                for _ in range(int(variants)):
+                    text = normalize_text(template.format(name=misspell(key, rng), city=city))
+                    start = time.perf_counter()
+                    matches = index.fuzzy.search(app.without_city(text))
+                    latencies.append(time.perf_counter() - start)
+                    found = [name for name, _ in matches]
+                    total += 1
+                    exact += index.matcher.longest(text) == key
+                    top1 += found[:1] == [key]
+                    top5 += key in found
+
+        # Negatives: every name of another city that this one doesn't have, asked about in this city.
+        negatives = found_any = found_fuzzy = 0
+        for city, index in indexes.items():
+            absent = {key for other, other_index in indexes.items() if other != city for key in other_index.names}
+            for key in sorted(absent - index.names.keys()):
+                text = normalize_text(template.format(name=key, city=city))
+                match, matched_exactly = find_name(index, text, app.without_city(text))
+                negatives += 1
+                found_any += match is not None
+                found_fuzzy += match is not None and not matched_exactly
+        results[kind] = {
+            "queries": total,
+            "exact_match_recall": exact / total,
+            "fuzzy_recall_at_1": top1 / total,
+            "fuzzy_recall_at_5": top5 / total,
+            "negatives": negatives,
+            "false_positive_rate": found_any / max(negatives, 1),
+            "fuzzy_false_positive_rate": found_fuzzy / max(negatives, 1),
+            "p50_ms": _percentile(latencies, 50) * 1e3,
+            "p95_ms": _percentile(latencies, 95) * 1e3,
+            "max_ms": max(latencies) * 1e3,
+        }
+    return results
+
+
+# The cities of the bundled workbooks, so synthetic ones are recognized the same way (aliases too).
+SYNTHETIC_CITIES = ["Bay", "Binan", "Cabuyao", "Calamba", "Kalayaan", "Los_Baños", "Pagsanjan", "San_Pedro", "Santa_Cruz", "Sta_Rosa", "Victoria"]
+
+
+def synthetic_workbook_sheets(locations, accommodations, foods, seed=0):
+    """The three sheets of one synthetic city workbook, with the columns and formats of data/*.xlsx."""
+    import datetime
+
+    import numpy as np
+    import pandas as pd
+
+    rng = np.random.default_rng(seed)
+    sheet1 = pd.DataFrame({
+        'Location': [f"Site {i}" for i in range(locations)],
+        'Description': "A synthetic attraction used for benchmarking.",
+        'To_Do_Activies': rng.choice(["Sightseeing, photography", "Swimming, picnics", "Hiking, bird watching"], locations),
+        'Opening': [datetime.time(int(hour)) for hour in rng.integers(5, 11, locations)],
+        'Closing': [datetime.time(int(hour)) for hour in rng.integers(15, 23, locations)],
+        'Best_Season': rng.choice(["Summer", "Dry season", "Year-round"], locations),
+        'Best_Date': rng.choice(["March to May", "December to February", "Any time"], locations),
+        'Rating': [f"{value:.1f}/5" for value in rng.integers(25, 51, locations) / 10],
+        'Entrance_Fee': [f"₱{value}" if value else "Free" for value in rng.integers(0, 5, locations) * 50],
+        'Distant_To_City': [f"{value} km" for value in rng.integers(1, 30, locations)],
+        'Best_Season_Why': "The weather is best for visiting then.",
+        'Available_Days': rng.choice(["Daily", "Monday to Friday", "Weekends", "Tuesday-Sunday"], locations),
+    })
+    sheet2 = synthetic_accommodations(accommodations, seed)[ACCOMMODATION_COLUMNS].rename(columns=str.title)
+    sheet3 = pd.DataFrame({
+        'Name': [f"Delicacy {i}" for i in range(foods)],
+        'Description': "A synthetic local food used for benchmarking.",
+        'Where_To_Buy': rng.choice(["Local bakeries, Pasalubong shops", "Public market", "Roadside stalls"], foods),
+        'Best_Date_To_Eat': "Year-round",
+        'Best_Season_To_Eat': "Year-round",
+        'Festival_To_Eat': "During town festivals",
+        'Price_Range': [f"₱{low} - ₱{low + 100}" for low in rng.integers(1, 10, foods) * 50],
+        'Type': rng.choice(["Pastry/Dessert", "Snack", "Main dish", "Delicacy"], foods),
+    })
+    return {"Sheet1": sheet1, "Sheet2": sheet2, "Sheet3": sheet3}
+
+
+def write_synthetic_workbooks(folder, cities=11, locations=50, accommodations=50, foods=20, seed=0):
+    """Writes one synthetic .xlsx per city into folder (named like the bundled ones) and returns their paths."""
+    import pandas as pd
+
+    os.makedirs(folder, exist_ok=True)
+    paths = []
+    for number in range(cities):
+        name = SYNTHETIC_CITIES[number] if number < len(SYNTHETIC_CITIES) else f"Town_{number}"
+        path = os.path.join(folder, f"{name}.xlsx")
+        with pd.ExcelWriter(path) as writer:
+            for sheet, frame in synthetic_workbook_sheets(locations, accommodations, foods, seed + number).items():
+                frame.to_excel(writer, sheet_name=sheet, index=False)
+        paths.append(path)
+    return paths
+
+
+# Questions replayed by bench_replay, each with the number of "yes" follow-ups sent after it
+# (paginated answers are then closed with "no").
+REPLAY_QUERIES = [
+    ("show me locations in {city}", 2),
+    ("show me the best locations in {city}", 1),
+    ("best hotel in {city}", 1),
+    ("cheapest hotel in {city}", 2),
+    ("most expensive accommodation in {city}", 0),
+    ("where to stay in {city}", 2),
+    ("what famous food can i try in {city}", 1),
+    ("where can i buy {food} in {city}", 0),
+    ("what type of food is {food} in {city}", 0),
+    ("what is the rating of {location} in {city}", 0),
+    ("tell me about {location} in {city}", 0),
+    ("what are the opening hours of {location} in {city}", 0),
+    ("resorts under ₱3000 with rating above 4 in {city}", 1),
+    ("what can i visit on sunday in {city}", 0),
+    ("best hotel in laguna", 1),
+    ("hello, i am planning a trip with my family", 0),
+]
+
+
+def replay_corpus(cities, users, questions, locations, foods, seed=0):
+    """Each simulated user's messages, in order: questions drawn from REPLAY_QUERIES with their follow-ups."""
+    import numpy as np
+
+    rng = np.random.default_rng(seed)
+    corpus = []
+    for user in range(users):
+        messages = []
+        for _ in range(questions):
+            template, follow_ups = REPLAY_QUERIES[rng.integers(len(REPLAY_QUERIES))]
+            messages.append(template.format(
+                city=cities[rng.integers(len(cities))].replace("_", " ").lower(),
+                location=f"site {rng.integers(locations)}",
+                food=f"delicacy {rng.integers(foods)}",
+            ))
+            messages += ["yes"] * follow_ups + (["no"] if follow_ups else [])
+        corpus.append([{"query": message, "user_id": f"replay-{user}"} for message in messages])
+    return corpus
+
+
+def _child_replay(folder, threads, users, questions, locations, foods, seed):
+    """Replays the corpus against cold caches in a fresh process, from the given number of threads."""
+    import random
+    from concurrent.futures import ThreadPoolExecutor
+
+    import app
+
+    random.seed(int(seed))
+    app.datasets_path = os.path.join(folder, "")
+    cities = [os.path.splitext(os.path.basename(path))[0] for path in sorted(glob.glob(os.path.join(folder, "*.xlsx")))]
+    corpus = replay_corpus(cities, int(users), int(questions), int(locations), int(foods), int(seed))
+
+    latencies, statuses = [], []
+
+    def replay_user(payloads):
+        client = app.app.test_client()
+        for payload in payloads:
+            start = time.perf_counter()
+            statuses.append(client.post("/query", json=payload).status_code)
+            latencies.append(time.perf_counter() - start)
+
+    rss_before = current_rss_kb()
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=int(threads)) as pool:
+        list(pool.map(replay_user, corpus))
+    summary = _load_summary(latencies, time.perf_counter() - start)
+    summary.update({
+        "errors": sum(status != 200 for status in statuses),
+        "sheet_parses": app.dataset_cache.parses,
+        "rss_before_kb": rss_before,
+        "peak_rss_kb": peak_rss_kb(),
+    })
+    print(json.dumps(summary))
+
+
+def _git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=os.path.dirname(os.path.abspath(__file__)),
+            check=True, capture_output=True, text=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+@benchmark
+def bench_replay(cities="11", locations="50", accommodations="50", foods="20", users="40", questions="10",
+                 threads="8", seed="0", folder=None):
+    """Replays a mixed question log, "yes"/"no" follow-ups included, against synthetic workbooks.
+
+    Writes cities workbooks of the given sizes (into folder, or a temporary directory that is
+    removed afterwards), compiles their snapshots like app.py's startup does, then replays the
+    same corpus single-threaded and from threads threads. Each run uses a fresh process, so it
+    starts from cold caches and its peak RSS is its own.
+    """
+    import platform
+    import shutil
+    import tempfile
+
+    import pandas as pd
+
+    import datasets
+
+    keep = folder is not None
+    folder = folder or tempfile.mkdtemp(prefix="chatbot-replay-")
+    try:
+        start = time.perf_counter()
+        write_synthetic_workbooks(folder, int(cities), int(locations), int(accommodations), int(foods), int(seed))
+        generate_seconds = time.perf_counter() - start
+        start = time.perf_counter()
+        datasets.build_snapshots(folder)
+        snapshot_seconds = time.perf_counter() - start
+
+        runs = {}
+        for mode, count in (("single_thread", "1"), (f"threads_{threads}", threads)):
+            output = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), "_replay", folder, count, users, questions, locations, foods, seed],
+                check=True, capture_output=True, text=True,
+            ).stdout
+            runs[mode] = json.loads(output.splitlines()[-1])
+    finally:
+        if not keep:
+            shutil.rmtree(folder, ignore_errors=True)
+
+    return {
+        "commit": _git_commit(),
+        "python": platform.python_version(),
+        "pandas": pd.__version__,
+        "config": {
+            "cities": int(cities), "locations": int(locations), "accommodations": int(accommodations), "foods": int(foods),
+            "users": int(users), "questions_per_user": int(questions), "threads": int(threads), "seed": int(seed),
+        },
+        "generate_seconds": generate_seconds,
+        "snapshot_seconds": snapshot_seconds,
+        "runs": runs,
+    }
+
+
+# Free-text questions about the bundled workbooks, each with the names a person judged to answer
+# it (from the descriptions and activities), for bench_search.
+SEARCH_QUERIES = [
+    ("where can i go swimming in los baños", "los baños", ["Flatrocks", "Dampalit Falls", "Trace Aqua Sports Complex and Museum"]),
+    ("places for hiking in kalayaan", "kalayaan", ["Paete-Kalayaan Rd.", "Brgy. San Juan"]),
+    ("where can i hike in sta rosa", "sta rosa", ["Muntingdilaw Falls", "Baldwin Hills", "Kabangaan Hills"]),
+    ("where can i attend mass in calamba", "calamba", ["St. John the Baptist Parish Church", "St. Therese of Lisieux Shrine"]),
+    ("churches in victoria", "victoria", ["St. Augustine Parish Church", "La Resurreccion Parish Church"]),
+    ("where to go fishing in cabuyao", "cabuyao", ["Sierra Lago Resort", "Brgy. Banay-Banay River"]),
+    ("kayaking in santa cruz", "santa cruz", ["Secret River Spot"]),
+    ("boat rides in pagsanjan", "pagsanjan", ["Cavinti-Pagsanjan Border", "Runs through the town", "Near Pagsanjan Falls"]),
+    ("bird watching in bay", "bay", ["Pulong Bae"]),
+    ("shopping in calamba", "calamba", ["SM City Calamba", "Paseo de Calamba", "Calamba Public Market", "Solenad"]),
+    ("a relaxing spa in san pedro", "san pedro", ["Zao Spa"]),
+    ("where can i play golf in sta rosa", "sta rosa", ["Thunderbird Resorts & Casinos", "Santa Elena Golf & Country Club"]),
+    ("zip line in binan", "binan", ["The Fun Farm at Sta. Elena"]),
+    ("horseback riding in cabuyao", "cabuyao", ["Villa Socorro Farm"]),
+    ("waterfalls in calamba", "calamba", ["Tinukib Falls", "Maimpis Falls"]),
+    ("picnic areas in santa cruz", "santa cruz", ["Laguna Capitol Grounds", "Aplaya Park"]),
+    ("what can i eat with coconut in calamba", "calamba", ["Buko Pie", "Cassava Cake", "Sinugno", "Tulingan sa Gata"]),
+    ("sticky rice desserts in binan", "binan", ["Suman", "Puto Bumbong", "Puto Maya", "Ginataang Bilo-Bilo"]),
+    ("noodle dishes in los baños", "los baños", ["Pancit Malabon", "Lomi"]),
+    ("pork dishes in calamba", "calamba", ["Lechon Kawali"]),
+    ("cheese snacks in sta rosa", "sta rosa", ["Kesong Puti", "Bibingka"]),
+    ("where can i go kayaking on a river", "laguna", ["Kalayaan Forest", "Near Pagsanjan", "Secret River Spot", "Nuvali"]),
+]
+
+# Small talk naming no city, which the search must not answer with places from every city.
+SMALL_TALK = ["can you help me", "please help", "thanks a lot", "hello there", "good morning", "i am bored", "what is your name"]
+
+
+def _keyword_scan(data, columns, query, limit):
+    """The first limit rows, in sheet order, whose text contains any word of the query."""
+    from matchers import normalize_text
+    from search import STOPWORDS
+
+    words = [word for word in normalize_text(query).split() if word not in STOPWORDS]
+    matches = []
+    for position, texts in enumerate(zip(*(data[column].tolist() for column in columns if column in data))):
+        text = normalize_text(" ".join(text for text in texts if isinstance(text, str)))
+        if any(word in text for word in words):
+            matches.append(position)
+            if len(matches) == limit:
+                break
+    return matches
+
+
+def _relevance(ranked, relevant, limit):
+    hits = [name in relevant for name in ranked[:limit]]
+    first = hits.index(True) + 1 if True in hits else None
+    return {
+        "precision": sum(hits) / limit,
+        "recall": sum(hits) / min(limit, len(relevant)),
+        "reciprocal_rank": 1 / first if first else 0.0,
+    }
+
+
+SEARCH_VOCABULARY = (
+    "swimming hiking fishing boating kayaking picnics shopping dining photography sightseeing biking camping "
+    "museum church falls lake river park garden farm mountain trail resort market heritage chapel spring view "
+    "quiet scenic historic famous local family cool green old small large public private natural"
+).split()
+
+
+@benchmark
+def bench_search(sizes="1000,10000,100000", repeat="20", limit="5", datasets_path=default_datasets_path):
+    """Relevance and latency of the free-text search that answers questions no intent matches.
+
+    Relevance: each SEARCH_QUERIES question is answered from the bundled workbooks by the BM25
+    search (through app.search_results, so its routing to locations or foods counts too) and by
+    a scan for rows containing any of its words; reported as mean precision@limit, recall@limit
+    (out of at most limit relevant rows) and reciprocal rank, and per question.
+    SMALL_TALK questions the search answers anyway are listed under small_talk_answered.
+    Latency: searching synthetic Sheet1 frames of each size, against the same per-row scan.
+    """
+    import numpy as np
+
+    import app
+    from search import LOCATION_SEARCH_FIELDS, FOOD_SEARCH_FIELDS, build_location_search, search
+
+    k = int(limit)
+    app.datasets_path = os.path.join(datasets_path, "")
+    per_query, totals = {}, {"search": [], "keyword_scan": []}
+    for query, city, relevant in SEARCH_QUERIES:
+        food, results = app.search_results(query, city, k)
+        data = app.catalog().foods if food else app.catalog().locations
+        if city != app.ALL_CITIES:
+            data = app.load_city_sheet(city, "Sheet3" if food else "Sheet1").frame
+        column = "name" if food else "location"
+        fields = FOOD_SEARCH_FIELDS if food else LOCATION_SEARCH_FIELDS
+        scanned = data[column].take(_keyword_scan(data, list(fields), app.without_city(app.normalize_text(query)), k))
+        scores = {
+            "search": _relevance(results[column].tolist(), set(relevant), k),
+            "keyword_scan": _relevance(scanned.tolist(), set(relevant), k),
+        }
+        for method, score in scores.items():
+            totals[method].append(score)
+        per_query[query] = dict(scores["search"], found=results[column].tolist())
+    relevance = {
+        method: {key: float(np.mean([score[key] for score in scores])) for key in ("precision", "recall", "reciprocal_rank")}
+        for method, scores in totals.items()
+    }
+    small_talk_answered = [query for query in SMALL_TALK if not app.search_results(query, app.ALL_CITIES, k)[1].empty]
+
+    queries = ["where can i go swimming", "places for hiking and camping", "quiet scenic lake with a view", "historic church museum"]
+    latency = {}
+    for size in map(int, sizes.split(",")):
+        rng = np.random.default_rng(0)
+        words = np.array(SEARCH_VOCABULARY)
+        data = synthetic_locations(size).assign(
+            description=[" ".join(row) for row in words[rng.integers(len(words), size=(size, 8))]],
+            to_do_activies=[", ".join(row) for row in words[rng.integers(12, size=(size, 3))]],
+        )
+        start = time.perf_counter()
+        index = build_location_search(data)
+        build_ms = (time.perf_counter() - start) * 1e3
+        start = time.perf_counter()
+        for _ in range(int(repeat)):
+            for query in queries:
+                search(index, query, k)
+        indexed = (time.perf_counter() - start) / (int(repeat) * len(queries))
+        start = time.perf_counter()
+        for query in queries:
+            _keyword_scan(data, list(LOCATION_SEARCH_FIELDS), query, size)
+        per_row = (time.perf_counter() - start) / len(queries)
+        latency[size] = {
+            "terms": len(index.vocabulary),
+            "stored_weights": len(index.weights),
+            "search_ms": indexed * 1e3,
+            "keyword_scan_ms": per_row * 1e3,
+            "build_ms": build_ms,
+        }
+    return {"relevance": relevance, "per_query": per_query, "small_talk_answered": small_talk_answered, "latency": latency}
+
+
+def memory_kb():
+    """Returns this process's memory from /proc/self/smaps_rollup in KiB: rss, pss (its fair share of
+    pages shared with other processes), shared and private. Only rss is known off Linux."""
+    fields = {"Rss": "rss", "Pss": "pss", "Shared_Clean": "shared", "Shared_Dirty": "shared",
+              "Private_Clean": "private", "Private_Dirty": "private"}
+    memory = dict.fromkeys(fields.values(), 0)
+    try:
+        with open("/proc/self/smaps_rollup") as f:
+            for line in f:
+                name, _, value = line.partition(":")
+                if name in fields:
+                    memory[fields[name]] += int(value.split()[0])
+    except OSError:
+        return {"rss": current_rss_kb(), "pss": None, "shared": None, "private": None}
+    return memory
+
+
+# Questions each forked worker answers: every sheet of every city, and the catalog.
+PRELOAD_QUERIES = [
+    "show me the best locations in {city}",
+    "what are the opening hours of site 1 in {city}",
+    "what can i visit on sunday in {city}",
+    "best hotel in {city}",
+    "resorts under ₱3000 with rating above 4 in {city}",
+    "what famous food can i try in {city}",
+    "where can i buy delicacy 1 in {city}",
+]
+
+
+def _preload_worker(app, cities, ready, release):
+    """Body of one forked worker: answers PRELOAD_QUERIES, then reports its memory once every worker is done."""
+    client = app.app.test_client()
+    parses = app.dataset_cache.parses
+    start = time.perf_counter()
+    first_answer = None
+    statuses = []
+    for city in cities:
+        for template in PRELOAD_QUERIES:
+            statuses.append(client.post("/query", json={"query": template.format(city=city), "user_id": "worker"}).status_code)
+            if first_answer is None:
+                first_answer = time.perf_counter() - start
+    statuses.append(client.post("/query", json={"query": "best hotel in laguna", "user_id": "worker"}).status_code)
+    elapsed = time.perf_counter() - start
+    # A long-running worker eventually runs full collections; run one now so their cost shows.
+    gc_start = time.perf_counter()
+    import gc
+    gc.collect()
+    gc_seconds = time.perf_counter() - gc_start
+    os.write(ready, b".")
+    os.read(release, 1)  # measure only once every worker has done its work
+    return dict(memory_kb(), first_answer_ms=first_answer * 1e3, answer_seconds=elapsed, gc_ms=gc_seconds * 1e3,
+                errors=sum(status != 200 for status in statuses), sheet_parses=app.dataset_cache.parses - parses)
+
+
+def _child_preload(folder, workers, mode):
+    """Imports the app in a fresh process, preloads the workbooks or not (mode), then forks workers
+    the way gunicorn --preload does and reports the memory of the master and of each worker."""
+    import app
+
+    app.datasets_path = os.path.join(folder, "")
+    cities = [os.path.splitext(os.path.basename(path))[0].replace("_", " ").lower()
+              for path in sorted(glob.glob(os.path.join(folder, "*.xlsx")))]
+    start = time.perf_counter()
+    if mode != "no_preload":
+        app.preload_datasets(freeze=mode == "preload")
+    preload_seconds = time.perf_counter() - start
+    master_before = memory_kb()
+
+    ready_read, ready_write = os.pipe()
+    release_read, release_write = os.pipe()
+    exit_read, exit_write = os.pipe()
+    children = []
+    for _ in range(int(workers)):
+        results_read, results_write = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            os.close(results_read)
+            try:
+                report = _preload_worker(app, cities, ready_write, release_read)
+                os.write(results_write, json.dumps(report).encode())
+                os.close(results_write)
+                os.read(exit_read, 1)  # stay alive, sharing pages, until the master has measured itself
+            finally:
+                os._exit(0)
+        os.close(results_write)
+        children.append((pid, results_read))
+
+    for _ in children:
+        os.read(ready_read, 1)
+    os.write(release_write, b"." * len(children))
+    reports = []
+    for pid, results_read in children:
+        with os.fdopen(results_read) as f:
+            reports.append(json.loads(f.read()))
+    # Every worker has measured itself; measure the master before any of them exits.
+    master = memory_kb()
+    os.write(exit_write, b"." * len(children))
+    for pid, _ in children:
+        os.waitpid(pid, 0)
+
+    def mean(key):
+        values = [report[key] for report in reports if report[key] is not None]
+        return sum(values) / len(values) if values else None
+
+    print(json.dumps({
+        "preload_seconds": preload_seconds,
+        "master_before_fork_kb": master_before,
+        "master_kb": master,
+        "worker_mean": {key: mean(key) for key in ("rss", "pss", "shared", "private", "first_answer_ms", "answer_seconds", "gc_ms")},
+        # Pss adds up to the memory the whole server takes, counting each shared page once.
+        "total_pss_kb": None if master["pss"] is None else master["pss"] + sum(report["pss"] for report in reports),
+        "errors": sum(report["errors"] for report in reports),
+        "sheet_parses_per_worker": [report["sheet_parses"] for report in reports],
+    }))
+
+
+@benchmark
+def bench_preload(workers="4", cities="11", locations="2000", accommodations="2000", foods="500", seed="0", folder=None):
+    """Measures the memory of forked workers with and without preloading the workbooks in the master.
+
+    Writes synthetic workbooks (like bench_replay), then, for each mode in a fresh process,
+    forks workers that answer questions over every city. "no_preload" leaves each worker to
+    parse and index the workbooks itself; "preload_no_freeze" and "preload" load them in the
+    master first, the latter freezing the garbage collector too. A worker's private memory is
+    what it does not share with the master or the other workers. Linux only (os.fork, /proc).
+    """
+    import shutil
+    import tempfile
+
+    import datasets
+
+    keep = folder is not None
+    folder = folder or tempfile.mkdtemp(prefix="chatbot-preload-")
+    try:
+        write_synthetic_workbooks(folder, int(cities), int(locations), int(accommodations), int(foods), int(seed))
+        datasets.build_snapshots(folder)
+        runs = {}
+        for mode in ("no_preload", "preload_no_freeze", "preload"):
+            output = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), "_preload", folder, workers, mode],
+                check=True, capture_output=True, text=True,
+            ).stdout
+            runs[mode] = json.loads(output.splitlines()[-1])
+    finally:
+        if not keep:
+            shutil.rmtree(folder, ignore_errors=True)
+
+    return {
+        "commit": _git_commit(),
+        "config": {
+            "workers": int(workers), "cities": int(cities), "locations": int(locations),
+            "accommodations": int(accommodations), "foods": int(foods), "seed": int(seed),
+        },
+        "runs": runs,
+    }
+
+
+if __name__ == "__main__":
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    if len(sys.argv) >= 2 and sys.argv[1] == "_load":
+        _child_load(sys.argv[2], sys.argv[3])
+    elif len(sys.argv) >= 2 and sys.argv[1] == "_replay":
+        _child_replay(*sys.argv[2:])
+    elif len(sys.argv) >= 2 and sys.argv[1] == "_preload":
+        _child_preload(*sys.argv[2:])
+    elif len(sys.argv) >= 2 and sys.argv[1] in BENCHMARKS:
+        print(json.dumps(BENCHMARKS[sys.argv[1]](*sys.argv[2:]), indent=2, default=str))
+    else:
+        print(f"usage: python benchmark.py {{{','.join(BENCHMARKS)}}} [args...]")
+        sys.exit(2)
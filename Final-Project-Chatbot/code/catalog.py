@@ -0,0 +1,54 @@
+import pandas as pd
+
+from datasets import compact_frame
+from filters import build_accommodation_index
+from matchers import build_food_index, find_name
+from rankings import build_accommodation_rankings, build_location_ranking
+from search import build_food_search, build_location_search
+
+# The columns of each sheet kept in the catalog: those the cross-city answers show or rank by.
+CATALOG_COLUMNS = {
+    "Sheet1": ["location", "description", "rating", "entrance_fee", "to_do_activies"],
+    "Sheet2": [
+        "name", "description", "price_range", "one-day_rate", "12-hours_rate", "6-hours_rate",
+        "nearest_attraction", "type_of_accomodation", "level_of_accomodation", "phone_number", "rating",
+        "price_range_min", "price_range_max",
+    ],
+    "Sheet3": ["name", "description", "where_to_buy", "price_range", "type", "price_range_min", "price_range_max"],
+}
+
+
+class Catalog:
+    """Every city's sheets merged into one table per sheet, with a city column and the indexes to search them all at once."""
+
+    def __init__(self, locations, accommodations, foods):
+        self.locations = locations
+        self.accommodations = accommodations
+        self.foods = foods
+        self.location_ranking = build_location_ranking(locations)
+        self.accommodation_rankings = build_accommodation_rankings(accommodations)
+        self.accommodation_filter_index = build_accommodation_index(accommodations)
+        self.food_index = build_food_index(foods)
+        self.location_search = build_location_search(locations)
+        self.food_search = build_food_search(foods)
+
+    def find_foods(self, text):
+        """Returns the rows, in every city, of the food a normalized text mentions (or most likely
+        means, for typos), and whether it mentions it exactly; no rows if it mentions none."""
+        key, exact = find_name(self.food_index, text)
+        return self.foods.iloc[self.food_index.rows[key] if key is not None else []], exact
+
+
+def build_catalog(frames):
+    """Builds a Catalog from {(city, sheet name): frame} for every sheet of every city."""
+    tables = {}
+    for sheet, columns in CATALOG_COLUMNS.items():
+        parts = [
+            frame.reindex(columns=columns).assign(city=city)
+            for (city, name), frame in sorted(frames.items())
+            if name == sheet
+        ]
+        table = pd.concat(parts, ignore_index=True) if parts else pd.DataFrame(columns=columns + ["city"])
+        # Categoricals of different cities concatenate to plain strings; store them compactly again.
+        tables[sheet] = compact_frame(table)
+    return Catalog(tables["Sheet1"], tables["Sheet2"], tables["Sheet3"])
@@ -0,0 +1,22 @@
+import numpy as np
+import pandas as pd
+
+
+def map_distinct(values, parse, missing, dtype=object):
+    """Returns parse(cell) for every cell of a column, as an array, calling parse once per distinct cell.
+
+    Prices, ratings, hours, days, kinds and activities repeat a lot, so this is how the sheets'
+    text columns are parsed. Missing cells (None, NaN) get missing instead. With a dtype other
+    than object, a parse returning tuples gives one row per cell.
+    """
+    codes, uniques = pd.factorize(pd.Series(values, copy=False))
+    if dtype is object:
+        # Filled one by one, so lists and tuples stay single values.
+        table = np.empty(len(uniques) + 1, dtype=object)
+        for position, value in enumerate(uniques):
+            table[position] = parse(value)
+        table[-1] = missing
+    else:
+        table = np.array([*map(parse, uniques), missing], dtype=dtype)
+    # Missing cells have code -1, which picks the last entry.
+    return table[codes]
@@ -0,0 +1,459 @@
+import glob
+import hashlib
+import itertools
+import logging
+import os
+import pickle
+import sys
+import threading
+from concurrent.futures import Future
+from contextlib import contextmanager
+
+import pandas as pd
+
+from cache import LRUCache
+from metrics import span
+from rankings import number_range
+from schedules import normalize_schedule
+
+_versions = itertools.count(1)
+
+logger = logging.getLogger(__name__)
+
+
+# Bump whenever the layout of a snapshot or the parsing in parse_sheet changes.
+SNAPSHOT_FORMAT = 6
+SNAPSHOT_SHEETS = ("Sheet1", "Sheet2", "Sheet3")
+
+# Price columns of each sheet. parse_sheet adds a typed <column>_min and <column>_max float
+# column for each ('₱1,500 - ₱2,500' -> 1500.0 and 2500.0, NaN if the cell has no number).
+PRICE_COLUMNS = {
+    "Sheet2": ("price_range", "one-day_rate", "12-hours_rate", "6-hours_rate"),
+    "Sheet3": ("price_range",),
+}
+
+# Columns a sheet must have to be served; a changed workbook missing one keeps its previous version.
+REQUIRED_COLUMNS = {
+    "Sheet1": ("location", "rating"),
+    "Sheet2": ("name", "rating", "price_range"),
+    "Sheet3": ("name", "price_range"),
+}
+
+# Column names some workbooks use, by the name the handlers read (Pagsanjan's Sheet1 has
+# "Opening Time" and "Closing Time" where the others have "Opening" and "Closing").
+COLUMN_ALIASES = {
+    "opening time": "opening",
+    "closing time": "closing",
+}
+
+
+def parse_sheet(path, sheet):
+    """Parses one sheet of a city workbook, or returns None if the sheet is missing."""
+    try:
+        data = pd.read_excel(path, sheet_name=sheet)
+    except ValueError:
+        # pandas raises ValueError when the workbook has no sheet with this name.
+        return None
+    data.columns = data.columns.str.lower()
+    data = data.rename(columns=COLUMN_ALIASES)
+    if sheet == "Sheet1":
+        normalize_schedule(data)
+    return compact_frame(normalize_prices(data, sheet))
+
+
+def normalize_prices(data, sheet):
+    """Adds the typed min/max columns of the sheet's price columns, parsed with vectorized string operations."""
+    for column in PRICE_COLUMNS.get(sheet, ()):
+        if column in data:
+            data[f"{column}_min"], data[f"{column}_max"] = number_range(data[column])
+    return data
+
+
+# Text columns whose distinct values are at most this share of their rows are stored as categoricals.
+CATEGORICAL_SHARE = 0.5
+
+
+def compact_frame(data):
+    """Stores the repetitive text columns of a parsed sheet (kinds, levels, ratings, prices, hours...)
+    as categoricals: an array of small integer codes plus each distinct value once, instead of a
+    Python string per cell.
+
+    Besides taking less memory, the codes are plain NumPy buffers that nothing writes to, so
+    worker processes forked from a master that preloaded the sheets keep sharing their pages;
+    every Python string read in a worker updates its reference count and copies its page.
+    """
+    for column in data.columns:
+        values = data[column]
+        if isinstance(values.dtype, pd.CategoricalDtype) or not pd.api.types.is_string_dtype(values):
+            continue
+        if len(values) and values.nunique() <= len(values) * CATEGORICAL_SHARE:
+            data[column] = values.astype("category")
+    return data
+
+
+def snapshot_path(path):
+    """Returns where the compiled snapshot of a workbook is stored."""
+    folder, name = os.path.split(path)
+    return os.path.join(folder, "snapshots", os.path.splitext(name)[0] + ".pkl")
+
+
+def file_sha256(path):
+    with open(path, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def load_snapshot(path, digest=None):
+    """Returns the snapshot of a workbook if it was built from the workbook's current contents."""
+    try:
+        with open(snapshot_path(path), "rb") as f:
+            bundle = pickle.load(f)
+    except FileNotFoundError:
+        return None
+    except Exception:
+        # Snapshots written by another pandas version may not unpickle; Excel is still there.
+        return None
+    if bundle.get("format") != SNAPSHOT_FORMAT:
+        return None
+    if bundle.get("sha256") != (digest or file_sha256(path)):
+        return None
+    return bundle
+
+
+def compile_snapshot(path, digest):
+    """Parses every sheet of a workbook into a snapshot bundle, without writing it."""
+    return {
+        "format": SNAPSHOT_FORMAT,
+        "source": os.path.basename(path),
+        "sha256": digest,
+        "sheets": {sheet: parse_sheet(path, sheet) for sheet in SNAPSHOT_SHEETS},
+    }
+
+
+def write_snapshot(path, bundle):
+    target = snapshot_path(path)
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    # Write next to the target and rename so a reader never sees a half-written file.
+    temp = f"{target}.{os.getpid()}.tmp"
+    with open(temp, "wb") as f:
+        pickle.dump(bundle, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(temp, target)
+
+
+def build_snapshot(path):
+    """Compiles every sheet of a workbook into a snapshot. Returns False if it was already fresh."""
+    digest = file_sha256(path)
+    if load_snapshot(path, digest) is not None:
+        return False
+    write_snapshot(path, compile_snapshot(path, digest))
+    return True
+
+
+def build_snapshots(datasets_path):
+    """Compiles all workbooks under datasets_path, returning the ones that were rebuilt."""
+    rebuilt = []
+    for path in sorted(glob.glob(os.path.join(datasets_path, "*.xlsx"))):
+        if build_snapshot(path):
+            rebuilt.append(path)
+    return rebuilt
+
+
+def read_workbook(path):
+    """Returns {sheet: frame, or None if the sheet is missing} for every sheet of a workbook.
+
+    The sheets come from the workbook's snapshot when it is fresh. Otherwise the workbook is
+    parsed and its snapshot written for the next process; a folder that cannot be written to
+    only costs that.
+    """
+    digest = file_sha256(path)
+    bundle = load_snapshot(path, digest)
+    if bundle is None:
+        bundle = compile_snapshot(path, digest)
+        try:
+            write_snapshot(path, bundle)
+        except OSError as error:
+            logger.warning("Could not write the snapshot of %s: %s", path, error)
+    return bundle["sheets"]
+
+
+class SheetData:
+    """One parsed sheet of a city workbook, shared read-only between requests."""
+
+    def __init__(self, path, sheet, signature, frame):
+        self.path = path
+        self.sheet = sheet
+        self.signature = signature
+        self.version = next(_versions)
+        self.frame = frame
+        self._derived = {}
+
+    def view(self):
+        """Returns a shallow copy of the frame. It shares its data with the cached frame, so a
+        write to it only stays in the copy under pandas' copy-on-write (app.py turns it on)."""
+        return self.frame.copy(deep=False)
+
+    def derived(self, name, build):
+        """Returns a structure computed from this sheet, building it on first use."""
+        value = self._derived.get(name)
+        if value is None:
+            value = self._derived[name] = build(self.frame)
+        return value
+
+
+class DatasetCache:
+    """Parses each workbook sheet once and keeps it until the file changes on disk."""
+
+    def __init__(self, max_sheets=33):
+        self.sheets = LRUCache(max_sheets)
+        # {path: (signature, {sheet: frame})}: the workbook read for the last sheet missed, so
+        # its other sheets are picked from it instead of reading and verifying the file again.
+        self.workbooks = LRUCache(max(1, max_sheets // len(SNAPSHOT_SHEETS)))
+        self.parses = 0
+        self.coalesced = 0
+        self._loading = {}
+        self._lock = threading.Lock()
+
+    def load(self, path, sheet='Sheet1'):
+        """Returns the SheetData for a sheet, re-parsing it only if the file's mtime or size changed."""
+        key = (path, sheet)
+        try:
+            stat = os.stat(path)
+        except OSError:
+            self.sheets.pop(key)
+            return None
+
+        signature = (stat.st_mtime_ns, stat.st_size)
+        entry = self.sheets.get(key)
+        if entry is not None and entry.signature == signature:
+            return entry if entry.frame is not None else None
+
+        # Requests that miss on the same sheet at the same time wait for a single parse
+        # instead of each reading the workbook.
+        with self._lock:
+            pending = self._loading.get((key, signature))
+            if pending is None:
+                pending = self._loading[(key, signature)] = Future()
+                self.parses += 1
+                loading = True
+            else:
+                self.coalesced += 1
+                loading = False
+        if not loading:
+            return pending.result()
+
+        try:
+            entry = self._parse(key, signature)
+            if entry.frame is None:
+                entry = None
+        except BaseException as error:
+            pending.set_exception(error)
+            raise
+        else:
+            pending.set_result(entry)
+        finally:
+            with self._lock:
+                del self._loading[(key, signature)]
+        return entry
+
+    def _parse(self, key, signature):
+        path, sheet = key
+        # A missing sheet (Victoria has no Sheet2) is cached too, as an entry without a frame,
+        # so it is not looked for again until the workbook changes.
+        with span("parse"):
+            workbook = self.workbooks.get(path)
+            if workbook is None or workbook[0] != signature:
+                workbook = (signature, read_workbook(path))
+                self.workbooks.put(path, workbook)
+            entry = SheetData(path, sheet, signature, workbook[1].get(sheet))
+        self.sheets.put(key, entry)
+        return entry
+
+    def is_current(self, entry):
+        """Whether a SheetData this cache returned still matches its file on disk, evicted or not."""
+        try:
+            stat = os.stat(entry.path)
+        except OSError:
+            return False
+        return entry.signature == (stat.st_mtime_ns, stat.st_size)
+
+    def clear(self):
+        self.sheets.clear()
+        self.workbooks.clear()
+
+    def stats(self):
+        return dict(self.sheets.stats(), parses=self.parses, coalesced=self.coalesced)
+
+    @contextmanager
+    def consistent(self):
+        """Same interface as DatasetWatcher.consistent; each load here already checks the file."""
+        yield
+
+
+def validate_sheet(frame, sheet):
+    """Raises ValueError if a parsed sheet lacks a column the handlers need."""
+    missing = [column for column in REQUIRED_COLUMNS.get(sheet, ()) if column not in frame]
+    if missing:
+        raise ValueError(f"{sheet} has no {', '.join(missing)} column")
+
+
+class DatasetWatcher:
+    """Every workbook under a folder, reloaded by a background thread when one changes on disk.
+
+    A changed workbook is compiled to its snapshot, parsed, validated and given its derived
+    indexes off the request path; then a new table of sheets is swapped in with a single
+    assignment. Requests only read that table, so they never take a lock or read a workbook.
+    A workbook that fails to load keeps serving its previous version, and the error is
+    reported in stats() until it loads again.
+
+    Same load()/stats() interface as DatasetCache. derived maps a sheet name to the
+    (name, build) pairs to prebuild, as passed to SheetData.derived. Unless autostart is
+    turned off, the first load() starts the thread if start() was not called before.
+    """
+
+    def __init__(self, datasets_path, interval=5.0, derived=None):
+        self.datasets_path = datasets_path
+        self.interval = interval
+        self.derived = derived or {}
+        # {(path, sheet): SheetData}, replaced as a whole and never modified once published.
+        self._sheets = {}
+        self._signatures = {}
+        self._local = threading.local()
+        self._stop = threading.Event()
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self.autostart = True
+        self._scanned = False
+        self._scan_lock = threading.Lock()
+        self.scans = 0
+        self.reloads = 0
+        self.failed_reloads = 0
+        self.errors = {}
+
+    def load(self, path, sheet='Sheet1'):
+        """Returns the current SheetData for a sheet, or None if the workbook or sheet is missing."""
+        if self._thread is None:
+            self._first_use()
+        sheets = getattr(self._local, "sheets", None) or self._sheets
+        entry = sheets.get((path, sheet))
+        return entry if entry is not None and entry.frame is not None else None
+
+    @contextmanager
+    def consistent(self):
+        """Serves every load in the block, on this thread, from the same table of sheets,
+        so one request never mixes two versions of a workbook."""
+        if self._thread is None:
+            self._first_use()
+        previous = getattr(self._local, "sheets", None)
+        self._local.sheets = self._sheets
+        try:
+            yield
+        finally:
+            self._local.sheets = previous
+
+    def is_current(self, entry):
+        """Whether a SheetData this watcher returned is still the one it serves."""
+        sheets = getattr(self._local, "sheets", None) or self._sheets
+        return sheets.get((entry.path, entry.sheet)) is entry
+
+    def _first_use(self):
+        # A process nobody called start() in (a plain `gunicorn app:app` worker) starts watching
+        # on its first request; without autostart it only loads the workbooks once.
+        if self.autostart:
+            self.start()
+        elif not self._scanned:
+            self.refresh()
+
+    def start(self):
+        """Loads every workbook now, then keeps checking for changes every interval seconds."""
+        self.refresh()
+        with self._start_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._stop.clear()
+                self._thread = threading.Thread(target=self._run, name="chatbot-dataset-watcher", daemon=True)
+                self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.refresh()
+            except Exception:
+                logger.exception("Scanning %s for changed workbooks failed", self.datasets_path)
+
+    def refresh(self):
+        """Reloads the workbooks that changed since the last scan and swaps them in. Returns their paths."""
+        with self._scan_lock:
+            self.scans += 1
+            signatures = {}
+            for path in sorted(glob.glob(os.path.join(self.datasets_path, "*.xlsx"))):
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                signatures[path] = (stat.st_mtime_ns, stat.st_size)
+
+            sheets = {key: entry for key, entry in self._sheets.items() if key[0] in signatures}
+            changed = []
+            for path, signature in signatures.items():
+                if self._signatures.get(path) == signature:
+                    continue
+                try:
+                    loaded = self._load_workbook(path, signature)
+                except Exception as error:
+                    # Keep serving the previous version (if any) and try again once the file changes.
+                    self.failed_reloads += 1
+                    self.errors[os.path.basename(path)] = f"{type(error).__name__}: {error}"
+                    logger.warning("Keeping the previous version of %s: %s", path, error)
+                else:
+                    sheets.update(loaded)
+                    self.errors.pop(os.path.basename(path), None)
+                    self.reloads += 1
+                    changed.append(path)
+                self._signatures[path] = signature
+            for path in list(self._signatures):
+                if path not in signatures:
+                    del self._signatures[path]
+                    self.errors.pop(os.path.basename(path), None)
+
+            if changed or len(sheets) != len(self._sheets):
+                self._sheets = sheets  # the swap: requests see either the old table or the new one
+            self._scanned = True
+            return changed
+
+    def _load_workbook(self, path, signature):
+        """Parses, validates and indexes every sheet of a workbook without publishing anything."""
+        with span("parse"):
+            frames = read_workbook(path)
+            # parse_sheet reads an unreadable file as one without these sheets.
+            if all(frames.get(sheet) is None for sheet in SNAPSHOT_SHEETS):
+                raise ValueError("no sheet could be read; is it a valid .xlsx workbook?")
+            loaded = {}
+            for sheet in SNAPSHOT_SHEETS:
+                frame = frames.get(sheet)
+                entry = SheetData(path, sheet, signature, frame)
+                if frame is not None:
+                    validate_sheet(frame, sheet)
+                    for name, build in self.derived.get(sheet, ()):
+                        entry.derived(name, build)
+                loaded[(path, sheet)] = entry
+        return loaded
+
+    def stats(self):
+        sheets = self._sheets
+        return {
+            'size': sum(entry.frame is not None for entry in sheets.values()),
+            'workbooks': len({path for path, _ in sheets}),
+            'scans': self.scans,
+            'reloads': self.reloads,
+            'failed_reloads': self.failed_reloads,
+            'errors': dict(self.errors),
+        }
+
+
+if __name__ == "__main__":
+    for path in sys.argv[1:]:
+        for rebuilt in build_snapshots(path):
+            print(f"Compiled {rebuilt} -> {snapshot_path(rebuilt)}")
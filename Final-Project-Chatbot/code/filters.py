@@ -0,0 +1,189 @@
+import re
+from collections import namedtuple
+
+import numpy as np
+
+from cells import map_distinct
+from matchers import KeywordMatcher, normalize_text
+from rankings import first_number
+
+# Ways users and the workbooks write each kind of accommodation, by the name used in answers.
+ACCOMMODATION_TYPES = {
+    "resort": ["resort", "resorts"],
+    "hotel": ["hotel", "hotels"],
+    "inn": ["inn", "inns"],
+    "guest house": ["guest house", "guest houses", "guesthouse", "guesthouses"],
+    "motel": ["motel", "motels"],
+    "lodge": ["lodge", "lodges"],
+    "apartelle": ["apartelle", "apartelles"],
+    "apartment": ["apartment", "apartments"],
+    "hostel": ["hostel", "hostels"],
+    "villa": ["villa", "villas"],
+    "bed and breakfast": ["bed and breakfast", "bed & breakfast", "b&b"],
+    "homestay": ["homestay", "homestays", "home stay"],
+    "campsite": ["campsite", "campsites", "camping"],
+    "transient house": ["transient", "transient house", "transient houses"],
+    "pension house": ["pension", "pension house", "pension houses"],
+}
+
+# Kinds users name when they mean any accommodation ("best hotel", "cheap hotels"), as the intent
+# table does; they narrow the results only alongside another kind ("hotels or resorts").
+GENERIC_TYPES = {"hotel"}
+
+# Price levels, by the name used in answers. Premium and high-end places count as luxury. "cheap"
+# is not one: "cheap hotels" asks for the cheapest ones, like "cheapest hotel", not for Budget ones.
+ACCOMMODATION_LEVELS = {
+    "budget": ["budget", "affordable", "inexpensive", "low cost"],
+    "mid-range": ["mid range", "midrange", "mid-range", "moderate", "mid priced"],
+    "luxury": ["luxury", "luxurious", "premium", "high end", "upscale"],
+}
+LEVEL_NAMES = list(ACCOMMODATION_LEVELS)
+TYPE_NAMES = list(ACCOMMODATION_TYPES)
+
+_type_matcher = KeywordMatcher(
+    ((normalize_text(word), name) for name, words in ACCOMMODATION_TYPES.items() for word in words), whole_words=True
+)
+_level_matcher = KeywordMatcher(
+    ((normalize_text(word), name) for name, words in ACCOMMODATION_LEVELS.items() for word in words), whole_words=True
+)
+
+# Words after a number that make it a count or a distance rather than a price: "up to 4 people",
+# "at least 10 guests", "within 5 km".
+_units = (
+    r"people|persons?|pax|guests?|adults?|kids?|child(?:ren)?|heads?|rooms?|beds?|bedrooms?|stars?"
+    r"|km|kms|kilomet(?:er|re)s?|m|met(?:er|re)s?|mi|miles?|min|mins|minutes?|hrs?|hours?|nights?|days?|weeks?|years?"
+)
+# Amounts like "2000", "₱2,000", "php 2000" or "2k", in the lowercased query; never a number followed by a unit.
+_amount = r"(?:₱|php|p)?\s*(\d[\d,]*(?:\.\d+)?)(?![\d.])\s*(k\b)?(?!\s*(?:" + _units + r")\b)"
+_max_price = re.compile(
+    r"\b(?:under|below|less than|cheaper than|at most|up to|max(?:imum)?(?: of)?|within|not more than)\s*" + _amount
+)
+_min_price = re.compile(r"\b(?:over|above|more than|at least|min(?:imum)?(?: of)?|starting at)\s*" + _amount)
+_between = re.compile(r"\bbetween\s*" + _amount + r"\s*(?:and|to|-)\s*" + _amount)
+# "rating above 4", "rated at least 4.5", "4+ stars", "at least 4 stars", "4/5 and up".
+_min_rating = re.compile(
+    r"\b(?:rating|rated)\s*(?:of\s*)?(?:above|over|at least|higher than|greater than|>=?)?\s*(\d(?:\.\d+)?)(?![\d,])"
+    r"|(?:\bat least\s*|\babove\s*|\bover\s*)?\b(\d(?:\.\d+)?)\s*(?:\+\s*)?(?:stars?\b|/\s*5)(?:\s*(?:and|or)\s*(?:up|above|higher))?"
+)
+
+AccommodationFilter = namedtuple("AccommodationFilter", ["types", "levels", "max_price", "min_price", "min_rating"])
+
+
+def _number(digits, thousands):
+    value = float(digits.replace(",", ""))
+    return value * 1000 if thousands else value
+
+
+def parse_accommodation_filter(query):
+    """Reads the constraints on accommodations in a query: kinds, price levels, budget and minimum rating."""
+    text = query.lower()
+    min_rating = None
+    match = _min_rating.search(text)
+    if match:
+        min_rating = float(match.group(1) or match.group(2))
+        # The rating's number must not be read as a price ("at least 4 stars").
+        text = text[:match.start()] + " " + text[match.end():]
+
+    max_price = min_price = None
+    match = _between.search(text)
+    if match:
+        min_price, max_price = sorted((_number(*match.group(1, 2)), _number(*match.group(3, 4))))
+    else:
+        match = _max_price.search(text)
+        if match:
+            max_price = _number(*match.group(1, 2))
+        match = _min_price.search(text)
+        if match:
+            min_price = _number(*match.group(1, 2))
+
+    words = normalize_text(query)
+    types = tuple(dict.fromkeys(name for _, _, name in _type_matcher.find_all(words)))
+    if GENERIC_TYPES.issuperset(types):
+        types = ()
+    levels = tuple(dict.fromkeys(name for _, _, name in _level_matcher.find_all(words)))
+    return AccommodationFilter(types, levels, max_price, min_price, min_rating)
+
+
+def has_limits(filters):
+    """Whether a filter constrains budget, rating or price level (not just the kind of place)."""
+    return bool(filters.levels) or any(value is not None for value in (filters.max_price, filters.min_price, filters.min_rating))
+
+
+def describe_filter(filters):
+    """Describes a filter for answers: "resort or inn, budget, ₱2,000 or less, rated 4.0 and up"."""
+    parts = []
+    if filters.types:
+        parts.append(" or ".join(filters.types))
+    if filters.levels:
+        parts.append(" or ".join(filters.levels))
+    if filters.min_price is not None and filters.max_price is not None:
+        parts.append(f"₱{filters.min_price:,.0f} to ₱{filters.max_price:,.0f}")
+    elif filters.max_price is not None:
+        parts.append(f"₱{filters.max_price:,.0f} or less")
+    elif filters.min_price is not None:
+        parts.append(f"₱{filters.min_price:,.0f} or more")
+    if filters.min_rating is not None:
+        parts.append(f"rated {filters.min_rating:.1f} and up")
+    return ", ".join(parts)
+
+
+AccommodationIndex = namedtuple("AccommodationIndex", ["min_price", "max_price", "rating", "types", "levels"])
+
+
+def build_accommodation_index(data):
+    """Pre-indexes a Sheet2 (or catalog) frame for filtering: price bounds and rating as floats,
+    a row mask per kind of accommodation and a price level code per row (-1 if unknown)."""
+    count = len(data)
+    kinds = np.zeros(count, dtype=np.int32)
+    if "type_of_accomodation" in data:
+        kinds = map_distinct(data["type_of_accomodation"], _type_bits, 0, dtype=np.int32)
+    levels = np.full(count, -1, dtype=np.int8)
+    if "level_of_accomodation" in data:
+        levels = map_distinct(data["level_of_accomodation"], _level_code, -1, dtype=np.int8)
+    types = {name: (kinds & 1 << bit) != 0 for bit, name in enumerate(ACCOMMODATION_TYPES)}
+    return AccommodationIndex(
+        min_price=data["price_range_min"].to_numpy(dtype=float),
+        max_price=data["price_range_max"].to_numpy(dtype=float),
+        rating=first_number(data["rating"]),
+        types=types,
+        levels=levels,
+    )
+
+
+def _type_bits(cell):
+    """The kinds a cell of type_of_accomodation names, as a bitmask in ACCOMMODATION_TYPES order."""
+    if not isinstance(cell, str):
+        return 0
+    return sum({1 << TYPE_NAMES.index(name) for _, _, name in _type_matcher.find_all(normalize_text(cell))})
+
+
+def _level_code(cell):
+    """The position in LEVEL_NAMES of the level a cell of level_of_accomodation names, or -1."""
+    name = _level_matcher.longest(normalize_text(cell)) if isinstance(cell, str) else None
+    return -1 if name is None else LEVEL_NAMES.index(name)
+
+
+def filter_mask(index, filters):
+    """Evaluates a filter over every row at once. Rows with an unknown price or rating never match a limit on it."""
+    mask = np.ones(len(index.rating), dtype=bool)
+    with np.errstate(invalid="ignore"):
+        if filters.max_price is not None:
+            # Affordable if its cheapest option fits the budget.
+            mask &= index.min_price <= filters.max_price
+        if filters.min_price is not None:
+            mask &= index.max_price >= filters.min_price
+        if filters.min_rating is not None:
+            mask &= index.rating >= filters.min_rating
+    if filters.types:
+        mask &= np.logical_or.reduce([index.types[name] for name in filters.types])
+    if filters.levels:
+        # A lookup table by level code; unknown levels (-1) land on its last slot, which stays False.
+        allowed = np.zeros(len(LEVEL_NAMES) + 1, dtype=bool)
+        allowed[[LEVEL_NAMES.index(name) for name in filters.levels]] = True
+        mask &= allowed[index.levels]
+    return mask
+
+
+def filtered_ranking(index, filters, ranking):
+    """Returns the rows of ranking (an array of row offsets) that pass the filter, in ranking order."""
+    return ranking[filter_mask(index, filters)[ranking]]
@@ -0,0 +1,255 @@
+import glob
+import os
+import re
+import unicodedata
+from collections import deque, namedtuple
+
+import numpy as np
+
+_non_word = re.compile(r"[^0-9a-z]+")
+
+
+def normalize_text(text):
+    """Lowercases text, strips accents (ñ -> n) and collapses punctuation and spacing to single spaces."""
+    text = str(text)
+    if text.isascii():
+        return _non_word.sub(" ", text.lower()).strip()
+    text = unicodedata.normalize("NFKD", text)
+    text = "".join(ch for ch in text if not unicodedata.combining(ch))
+    return _non_word.sub(" ", text.lower()).strip()
+
+
+class KeywordMatcher:
+    """Aho-Corasick automaton that finds every keyword occurring in a text in a single pass."""
+
+    def __init__(self, keywords, whole_words=False):
+        self.whole_words = whole_words
+        self._goto = [{}]
+        self._fail = [0]
+        self._out = [()]
+        for keyword, value in keywords:
+            if keyword:
+                self._add(keyword, value)
+        self._link()
+
+    def _add(self, keyword, value):
+        state = 0
+        for ch in keyword:
+            nxt = self._goto[state].get(ch)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto[state][ch] = nxt
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append(())
+            state = nxt
+        self._out[state] += ((len(keyword), value),)
+
+    def _link(self):
+        # Resolve failure links into a full transition table so matching never backtracks.
+        self._delta = [None] * len(self._goto)
+        self._delta[0] = dict(self._goto[0])
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            self._delta[state] = {**self._delta[self._fail[state]], **self._goto[state]}
+            for ch, nxt in self._goto[state].items():
+                queue.append(nxt)
+                fail = self._fail[state]
+                while fail and ch not in self._goto[fail]:
+                    fail = self._fail[fail]
+                target = self._goto[fail].get(ch, 0)
+                self._fail[nxt] = target if target != nxt else 0
+                self._out[nxt] += self._out[self._fail[nxt]]
+
+    def find_all(self, text):
+        """Yields (start, end, value) for every keyword occurrence in text."""
+        delta, out = self._delta, self._out
+        state = 0
+        for i, ch in enumerate(text):
+            state = delta[state].get(ch, 0)
+            if not out[state]:
+                continue
+            for length, value in out[state]:
+                start, end = i + 1 - length, i + 1
+                if self.whole_words and not _is_word_bounded(text, start, end):
+                    continue
+                yield start, end, value
+
+    def longest(self, text):
+        """Returns the value of the longest keyword in text (leftmost on ties), or None."""
+        best = None
+        for start, end, value in self.find_all(text):
+            if best is None or end - start > best[1] - best[0] or (end - start == best[1] - best[0] and start < best[0]):
+                best = (start, end, value)
+        return None if best is None else best[2]
+
+    def last(self, text):
+        """Returns the value of the keyword that ends last in text (longest on ties), or None."""
+        match = self.last_match(text)
+        return None if match is None else match[2]
+
+    def last_match(self, text):
+        """Returns (start, end, value) of the keyword that ends last in text (longest on ties), or None."""
+        best = None
+        for start, end, value in self.find_all(text):
+            if best is None or end > best[1] or (end == best[1] and start < best[0]):
+                best = (start, end, value)
+        return best
+
+
+def _is_word_bounded(text, start, end):
+    return (start == 0 or not text[start - 1].isalnum()) and (end == len(text) or not text[end].isalnum())
+
+
+# Other ways users write a city, by the city name used in responses. Accents, case and
+# punctuation are normalized away before matching, so "Biñan" or "Sta. Rosa" need no entry.
+CITY_ALIASES = {
+    "sta rosa": ["santa rosa"],
+    "santa cruz": ["sta cruz", "sta. cruz"],
+    "los baños": ["los banos", "lb"],
+    "san pedro": ["san pedro laguna"],
+}
+
+CityIndex = namedtuple("CityIndex", ["matcher", "files"])
+
+
+def build_city_index(datasets_path, aliases=CITY_ALIASES):
+    """Builds a matcher over the cities that have a workbook under datasets_path, plus their aliases."""
+    files = {}
+    for path in sorted(glob.glob(os.path.join(datasets_path, "*.xlsx"))):
+        stem = unicodedata.normalize("NFC", os.path.splitext(os.path.basename(path))[0])
+        files[stem.replace("_", " ").lower()] = path
+
+    keywords = [(normalize_text(city), city) for city in files]
+    keywords += [(normalize_text(alias), city) for city, names in aliases.items() if city in files for alias in names]
+    return CityIndex(KeywordMatcher(keywords, whole_words=True), files)
+
+
+def ngrams(text, n=2):
+    """Returns the set of character n-grams of text, padded with a space on both sides."""
+    padded = f" {text} "
+    return {padded[i:i + n] for i in range(len(padded) - n + 1)}
+
+
+class FuzzyIndex:
+    """Character n-gram inverted index over names, for finding the names a misspelled mention most likely means."""
+
+    def __init__(self, names, n=2):
+        # Bigrams rather than trigrams: one typo in a short food name ("lomi", "taho") leaves too few trigrams.
+        self.n = n
+        self.names = [name for name in names if name]
+        self._grams = [ngrams(name, n) for name in self.names]
+        self._sizes = np.array([len(grams) for grams in self._grams], dtype=float)
+        self._widths = [len(name.split()) for name in self.names]
+        # The n-grams of each word a match must cover; short words ("de", "ng", "of") may be left out.
+        self._words = [[ngrams(word, n) for word in name.split() if len(word) > 2] for name in self.names]
+        postings = {}
+        for i, grams in enumerate(self._grams):
+            for gram in grams:
+                postings.setdefault(gram, []).append(i)
+        self._postings = {gram: np.array(ids, dtype=np.intp) for gram, ids in postings.items()}
+
+    def search(self, text, limit=5, threshold=0.6, word_threshold=0.4):
+        """Returns up to limit (name, score) pairs for the names best matching a run of words in text, best first.
+
+        text must be normalized like the names (normalize_text). The score is the Dice coefficient
+        of the n-grams of the name and of the closest run of words in text, between 0 and 1. Only
+        runs that mention every word of the name (each one close to a word of the run, by at least
+        word_threshold) count, so a different name sharing a word ("buko pie" and "buko pandan",
+        "puto calasiao" and "puto binan") is never taken for it.
+        """
+        hits = [self._postings[gram] for gram in ngrams(text, self.n) if gram in self._postings]
+        if not hits:
+            return []
+        # Candidates: names many of whose n-grams occur somewhere in text, counted in one pass over the
+        # postings. The floor is loose so that partial mentions ("buko" for "buko pie") reach scoring.
+        shared = np.bincount(np.concatenate(hits), minlength=len(self.names))
+        containment = shared / self._sizes
+        candidates = np.flatnonzero(containment >= threshold / 2)
+        candidates = candidates[np.argsort(-containment[candidates], kind="stable")][:limit * 4]
+
+        words = text.split()
+        # Words of two letters or less ("in", "sa") are too short to stand for a word of a name.
+        word_grams = [ngrams(word, self.n) if len(word) > 2 else set() for word in words]
+        results = []
+        for i in candidates:
+            score = self._best_window(words, word_grams, i, word_threshold)
+            if score >= threshold:
+                results.append((self.names[i], score))
+        results.sort(key=lambda result: -result[1])
+        return results[:limit]
+
+    def _best_window(self, words, word_grams, i, word_threshold):
+        grams, width = self._grams[i], self._widths[i]
+        best = 0.0
+        for size in {max(1, width - 1), width, width + 1}:
+            for start in range(max(1, len(words) - size + 1)):
+                window_words = word_grams[start:start + size]
+                if not all(any(word and _dice(name_word, word) >= word_threshold for word in window_words) for name_word in self._words[i]):
+                    continue
+                window = ngrams(" ".join(words[start:start + size]), self.n)
+                best = max(best, 2 * len(window & grams) / (len(window) + len(grams)))
+        return best
+
+
+def _dice(a, b):
+    return 2 * len(a & b) / (len(a) + len(b))
+
+
+NameIndex = namedtuple("NameIndex", ["matcher", "names", "rows", "fuzzy"])
+
+
+def build_name_index(data, column):
+    """Indexes a sheet by the normalized values of one name column: an exact matcher and a fuzzy index
+    for queries, the original spelling of each name and the row offsets of each name."""
+    names = {}
+    rows = {}
+    for position, name in enumerate(data[column]):
+        if not isinstance(name, str):
+            continue
+        key = normalize_text(name)
+        names.setdefault(key, name)
+        rows.setdefault(key, []).append(position)
+
+    matcher = KeywordMatcher(((key, key) for key in names), whole_words=True)
+    rows = {key: np.array(positions) for key, positions in rows.items()}
+    return NameIndex(matcher, names, rows, FuzzyIndex(names))
+
+
+def build_location_index(data):
+    """Indexes a city's Sheet1 by normalized location name."""
+    return build_name_index(data, "location")
+
+
+def build_food_index(data):
+    """Indexes a city's Sheet3 by normalized food name."""
+    return build_name_index(data, "name")
+
+
+def find_name(index, text, fuzzy_text=None):
+    """Returns (key, exact) for the normalized name text mentions: the longest exact mention, else
+    the closest fuzzy match in fuzzy_text (text if not given) with exact False, else (None, False)."""
+    key = index.matcher.longest(text)
+    if key is not None:
+        return key, True
+    matches = index.fuzzy.search(text if fuzzy_text is None else fuzzy_text, limit=1)
+    return (matches[0][0] if matches else None), False
+
+
+class IntentRouter:
+    """Classifies a query by the first intent, in table order, that has a phrase anywhere in the query."""
+
+    def __init__(self, table):
+        self.intents = [intent for intent, _ in table]
+        self.matcher = KeywordMatcher((phrase, rank) for rank, (_, phrases) in enumerate(table) for phrase in phrases)
+
+    def classify(self, query):
+        """Returns (intent, (start, end)) for the winning phrase, or (None, None) if nothing matched."""
+        best = None
+        for start, end, rank in self.matcher.find_all(query):
+            if best is None or rank < best[0]:
+                best = (rank, start, end)
+        if best is None:
+            return None, None
+        return self.intents[best[0]], (best[1], best[2])
@@ -0,0 +1,185 @@
+"""Request and stage timings, counted in process and exposed in the Prometheus text format.
+
+A request is timed with `with request() as timings:`; inside it, each `span(stage)` (or function
+decorated with `timed(stage)`) adds its duration to that request's timings and to the stage's
+histogram. Spans may nest: "answer" (the whole handler) includes "dataset", "location" and
+"render". Set CHATBOT_METRICS=0 to turn all of it into no-ops.
+"""
+import bisect
+import functools
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+enabled = os.environ.get("CHATBOT_METRICS", "1") != "0"
+
+# Upper bounds of the histogram buckets, in seconds.
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Counter:
+    """A monotonically increasing count per value of one label."""
+
+    def __init__(self, name, help, label):
+        self.name, self.help, self.label = name, help, label
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, label_value, amount=1):
+        with self._lock:
+            self._values[label_value] = self._values.get(label_value, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            values = sorted(self._values.items())
+        lines += [f'{self.name}{{{self.label}="{value}"}} {count}' for value, count in values]
+        return lines
+
+
+class Histogram:
+    """Durations per value of one label, counted in the fixed BUCKETS."""
+
+    def __init__(self, name, help, label, buckets=BUCKETS):
+        self.name, self.help, self.label = name, help, label
+        self.buckets = buckets
+        # Per label value: [count per bucket (the last one for +Inf), sum].
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, label_value, seconds):
+        bucket = bisect.bisect_left(self.buckets, seconds)
+        with self._lock:
+            value = self._values.get(label_value)
+            if value is None:
+                value = self._values[label_value] = [[0] * (len(self.buckets) + 1), 0.0]
+            value[0][bucket] += 1
+            value[1] += seconds
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            values = sorted((label_value, list(counts), total) for label_value, (counts, total) in self._values.items())
+        for label_value, counts, total in values:
+            label = f'{self.label}="{label_value}"'
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), counts):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{{{label},le="{bound}"}} {cumulative}')
+            lines.append(f"{self.name}_sum{{{label}}} {total}")
+            lines.append(f"{self.name}_count{{{label}}} {cumulative}")
+        return lines
+
+
+requests_total = Counter("chatbot_requests_total", "Queries answered, by intent.", "intent")
+request_errors_total = Counter("chatbot_request_errors_total", "Queries that raised an error, by intent.", "intent")
+request_seconds = Histogram("chatbot_request_duration_seconds", "Time to answer a query, by intent.", "intent")
+stage_seconds = Histogram("chatbot_stage_duration_seconds", "Time spent in each stage of answering a query.", "stage")
+
+
+class Timings:
+    """The stages of one request and the time spent in each, in seconds."""
+
+    __slots__ = ("stages", "intent", "failed", "start", "total")
+
+    def __init__(self):
+        self.stages = {}
+        self.intent = "none"
+        self.failed = False
+        self.start = time.perf_counter()
+        self.total = None
+
+    def server_timing(self):
+        """Formats the timings as a Server-Timing header value, durations in milliseconds."""
+        parts = [f"{stage};dur={seconds * 1e3:.2f}" for stage, seconds in self.stages.items()]
+        if self.total is not None:
+            parts.append(f"total;dur={self.total * 1e3:.2f}")
+        return ", ".join(parts)
+
+
+_current = threading.local()
+
+
+@contextmanager
+def bind(timings):
+    """Makes spans on this thread count towards timings (for work a request spreads over several threads)."""
+    previous = getattr(_current, "timings", None)
+    _current.timings = timings
+    try:
+        yield timings
+    finally:
+        _current.timings = previous
+
+
+def finish(timings):
+    """Records a finished request in the request counters and histogram."""
+    timings.total = time.perf_counter() - timings.start
+    if not enabled:
+        return
+    requests_total.inc(timings.intent)
+    request_seconds.observe(timings.intent, timings.total)
+    if timings.failed:
+        request_errors_total.inc(timings.intent)
+
+
+@contextmanager
+def request():
+    """Times one request answered on this thread, yielding its Timings."""
+    timings = Timings()
+    try:
+        with bind(timings):
+            yield timings
+    except BaseException:
+        timings.failed = True
+        raise
+    finally:
+        finish(timings)
+
+
+def label(intent):
+    """Sets the intent the current request is counted under."""
+    timings = getattr(_current, "timings", None)
+    if timings is not None:
+        timings.intent = intent
+
+
+class span:
+    """Times a block as one stage of the current request: `with span("intent"): ...`."""
+
+    __slots__ = ("stage", "start")
+
+    def __init__(self, stage):
+        self.stage = stage
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+
+    def __exit__(self, *exc):
+        if not enabled:
+            return
+        seconds = time.perf_counter() - self.start
+        stage_seconds.observe(self.stage, seconds)
+        timings = getattr(_current, "timings", None)
+        if timings is not None:
+            timings.stages[self.stage] = timings.stages.get(self.stage, 0.0) + seconds
+
+
+def timed(stage):
+    """Decorates a function so each call is timed as a span of the given stage."""
+    def decorate(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(stage):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def render(extra=()):
+    """Returns every metric in the Prometheus text exposition format, followed by the extra lines."""
+    lines = []
+    for metric in (requests_total, request_errors_total, request_seconds, stage_seconds):
+        lines += metric.render()
+    lines += extra
+    return "\n".join(lines) + "\n"
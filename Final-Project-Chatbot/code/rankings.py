@@ -0,0 +1,74 @@
+import re
+from collections import namedtuple
+
+import numpy as np
+
+from cells import map_distinct
+
+_first_number = r"(\d+(?:\.\d+)?)"
+_number_range = r"(\d+(?:\.\d+)?)(?:.*\D(\d+(?:\.\d+)?))?"
+
+
+def _extract(values, pattern):
+    """Applies pattern to each cell as text, without commas. Returns the float groups, one column each."""
+    pattern = re.compile(pattern)
+    unmatched = (np.nan,) * pattern.groups
+
+    def parse(cell):
+        match = pattern.search(str(cell).replace(",", ""))
+        if match is None:
+            return unmatched
+        return tuple(np.nan if group is None else float(group) for group in match.groups())
+
+    return map_distinct(values, parse, unmatched, dtype=float)
+
+
+def _numbers(values, pattern):
+    return _extract(values, pattern)[:, 0]
+
+
+def first_number(values):
+    """Parses the first number of each cell ('₱1,500 - ₱2,500' -> 1500, '4.5/5' -> 4.5), NaN if there is none."""
+    return _numbers(values, _first_number)
+
+
+def number_range(values):
+    """Parses the first and last number of each cell in one pass: ('₱1,500 - ₱2,500' -> 1500, 2500),
+    ('₱1,000' -> 1000, 1000), NaN for both if there is none."""
+    bounds = _extract(values, _number_range)
+    low, high = bounds[:, 0], bounds[:, 1]
+    return low, np.where(np.isnan(high), low, high)
+
+
+def _order(values, descending=False):
+    """Returns row offsets sorted by value, ties in sheet order and unparsable values last."""
+    values = np.asarray(values, dtype=float)
+    keys = np.where(np.isnan(values), np.inf, -values if descending else values)
+    order = np.argsort(keys, kind="stable")
+    order.flags.writeable = False
+    return order
+
+
+AccommodationRankings = namedtuple("AccommodationRankings", ["by_rating", "by_min_price", "by_max_price"])
+
+
+def build_accommodation_rankings(data):
+    """Ranks a city's Sheet2 by rating (best first), minimum price (cheapest first) and maximum price (priciest first).
+
+    Prices come from the typed price_range_min/price_range_max columns added by datasets.parse_sheet.
+    """
+    return AccommodationRankings(
+        by_rating=_order(first_number(data["rating"]), descending=True),
+        by_min_price=_order(data["price_range_min"]),
+        by_max_price=_order(data["price_range_max"], descending=True),
+    )
+
+
+def build_location_ranking(data):
+    """Ranks a city's Sheet1 by rating, best first."""
+    return _order(first_number(data["rating"]), descending=True)
+
+
+def ranked_page(frame, order, start, count):
+    """Returns the rows at positions start..start+count of a ranking, touching only those rows."""
+    return frame.take(order[start:start + count])
@@ -0,0 +1,128 @@
+from string import Formatter
+
+from metrics import span
+
+
+class Template:
+    """An HTML snippet repeated once per record, compiled once into a positional format string."""
+
+    def __init__(self, source):
+        self.source = source
+        self.columns = []
+        parts = []
+        for literal, field, spec, conversion in Formatter().parse(source):
+            parts.append(literal.replace("{", "{{").replace("}", "}}"))
+            if field is None:
+                continue
+            if field not in self.columns:
+                self.columns.append(field)
+            parts.append("{%d%s%s}" % (
+                self.columns.index(field),
+                "!" + conversion if conversion else "",
+                ":" + spec if spec else "",
+            ))
+        self._format = "".join(parts).format
+
+    def rows(self, records):
+        """Yields the snippet for each record. records maps column names to equal-length sequences (e.g. a DataFrame)."""
+        # Pull each column out once as a plain list instead of building a Series per row.
+        columns = [_values(records[column]) for column in self.columns]
+        for values in zip(*columns):
+            yield self._format(*values)
+
+    def render(self, records):
+        with span("render"):
+            return "".join(self.rows(records))
+
+
+def chunks(header, template, records, footer):
+    """Yields header, the snippet of each record, then footer, so a list can be sent as it is rendered.
+
+    records may be a function returning them; it is only called once header has been taken,
+    so the first chunk costs the same however long the list is.
+    """
+    yield header
+    if callable(records):
+        records = records()
+    yield from template.rows(records)
+    yield footer
+
+
+def _values(column):
+    tolist = getattr(column, "tolist", None)
+    return tolist() if tolist is not None else list(column)
+
+
+#Locations
+LOCATION_ITEM = Template("* {location}<br>")
+LOCATION_CARD = Template(
+    "Location: {location}<br>"
+    "Rating: {rating}<br>"
+    "Entrance Fee: {entrance_fee}<br>"
+    "Activities: {to_do_activies}<br><br>"
+)
+HOURS_LINE = Template(
+    "Location: {location}<br>"
+    "Operating Hours: {operating_hours}<br><br>"
+)
+OPEN_LOCATION_ITEM = Template("* {location} ({operating_hours})<br>")
+ACTIVITIES_LINE = Template("* {to_do_activies}<br>")
+DESCRIPTION_LINE = Template("{description}<br>")
+RATING_LINE = Template("Rating: {rating}<br>")
+BEST_SEASON_LINE = Template(
+    "Best Season: {best_season}<br>"
+    "Reason: {best_season_why}<br>"
+)
+BEST_DATE_LINE = Template("Best Date: {best_date}<br>")
+BEST_SEASON_WHY_LINE = Template("Reason:{best_season_why}<br>")
+AVAILABLE_DATES_LINE = Template("Available Date: {available_days}<br>")
+
+#Accommodations
+_ACCOMMODATION_DETAILS = (
+    "Description: {description}<br>"
+    "Price Range: {price_range}<br>"
+    "One-Day Rate: {one-day_rate}<br>"
+    "Twelve Hours Rate: {12-hours_rate}<br>"
+    "Six Hours Rate: {6-hours_rate}<br>"
+    "Nearest Attraction: {nearest_attraction}<br>"
+    "Type: {type_of_accomodation}<br>"
+    "Level: {level_of_accomodation}<br>"
+    "Phone Number: {phone_number}<br>"
+    "Rating: {rating}<br><br>"
+)
+ACCOMMODATION_CARD = Template("<b>{name}</b><br>" + _ACCOMMODATION_DETAILS)
+
+#Foods
+FOOD_CARD = Template(
+    "<b>{name}</b><br>"
+    "Description: {description}<br>"
+    "Price Range: {price_range}<br>"
+    "Type of Food: {type}<br><br>"
+)
+FOOD_LOCATION_CARD = Template(
+    "<b>{name}</b><br>"
+    "You Can Buy It In: {where_to_buy}<br>"
+    "Price Range: {price_range}<br>"
+)
+FOOD_TYPE_LINE = Template("Type: {type}<br>")
+
+#Across cities
+LOCATION_CITY_CARD = Template(
+    "Location: {location} ({city})<br>"
+    "Rating: {rating}<br>"
+    "Entrance Fee: {entrance_fee}<br>"
+    "Activities: {to_do_activies}<br><br>"
+)
+ACCOMMODATION_CITY_CARD = Template("<b>{name}</b> ({city})<br>" + _ACCOMMODATION_DETAILS)
+FOOD_LOCATION_CITY_CARD = Template(
+    "<b>{name}</b> ({city})<br>"
+    "You Can Buy It In: {where_to_buy}<br>"
+    "Price Range: {price_range}<br>"
+)
+FOOD_TYPE_CITY_LINE = Template("{name} ({city}) - Type: {type}<br>")
+FOOD_CITY_CARD = Template(
+    "<b>{name}</b> ({city})<br>"
+    "Description: {description}<br>"
+    "Price Range: {price_range}<br>"
+    "Type of Food: {type}<br><br>"
+)
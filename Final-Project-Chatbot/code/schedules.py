@@ -0,0 +1,189 @@
+import datetime
+import re
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+
+from cells import map_distinct
+
+DAY_NAMES = ["monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday"]
+EVERY_DAY = (1 << 7) - 1
+WEEKDAYS = (1 << 5) - 1
+WEEKENDS = EVERY_DAY & ~WEEKDAYS
+MINUTES_PER_DAY = 24 * 60
+
+# Opening hours written as text instead of a time: open all day.
+_all_day = re.compile(r"24\s*(?:hours|/\s*7)")
+_clock = re.compile(r"(\d{1,2})(?::(\d{2}))?\s*([ap])?\.?\s*m?\b")
+_day = r"(mon|tue|wed|thu|fri|sat|sun)[a-z]*"
+_day_range = re.compile(_day + r"\s*(?:to|-|–|until|through)\s*" + _day)
+_single_day = re.compile(r"\b" + _day)
+
+
+def parse_minute(value):
+    """Returns the minute of the day an opening or closing cell stands for, or NaN if it names no time.
+
+    Cells are datetime.time values, or text such as "8:00 AM", "17:00" or "Open 24 hours".
+    """
+    if isinstance(value, (datetime.time, datetime.datetime)):
+        return value.hour * 60 + value.minute
+    if not isinstance(value, str):
+        return np.nan
+    text = value.lower()
+    if _all_day.search(text):
+        return np.nan
+    match = _clock.search(text)
+    if match is None:
+        return np.nan
+    hour, minute = int(match.group(1)), int(match.group(2) or 0)
+    if match.group(3) == "p" and hour < 12:
+        hour += 12
+    elif match.group(3) == "a" and hour == 12:
+        hour = 0
+    if hour > 24 or minute > 59:
+        return np.nan
+    return hour * 60 + minute
+
+
+def is_all_day(value):
+    return isinstance(value, str) and _all_day.search(value.lower()) is not None
+
+
+def parse_days(value):
+    """Returns the days a cell of available_days covers, as a bitmask (bit 0 is Monday), or 0 if unknown.
+
+    Understands "Daily", "Weekdays", "Weekends & Holidays", "Monday to Friday", "Tuesday-Sunday"
+    and lists of day names.
+    """
+    if not isinstance(value, str):
+        return 0
+    text = value.lower()
+    if "daily" in text or "every day" in text or _all_day.search(text):
+        return EVERY_DAY
+    days = 0
+    if "weekday" in text:
+        days |= WEEKDAYS
+    if "weekend" in text:
+        days |= WEEKENDS
+    for first, last in _day_range.findall(text):
+        start, end = _day_index(first), _day_index(last)
+        # Ranges may wrap around the week ("Friday to Monday").
+        for offset in range((end - start) % 7 + 1):
+            days |= 1 << (start + offset) % 7
+    text = _day_range.sub(" ", text)
+    for name in _single_day.findall(text):
+        days |= 1 << _day_index(name)
+    return days
+
+
+def _day_index(prefix):
+    return next(i for i, name in enumerate(DAY_NAMES) if name.startswith(prefix))
+
+
+def format_minute(minute):
+    """Formats a minute of the day for answers: 570 -> "9:30 AM", 1020 -> "5:00 PM"."""
+    hour, minute = divmod(int(minute) % MINUTES_PER_DAY, 60)
+    return f"{(hour - 1) % 12 + 1}:{minute:02d} {'AM' if hour < 12 else 'PM'}"
+
+
+def format_hours(opening, closing, opening_text, closing_text):
+    if not np.isnan(opening) and not np.isnan(closing):
+        if opening == closing or (opening == 0 and closing == MINUTES_PER_DAY):
+            return "Open 24 hours"
+        return f"{format_minute(opening)} - {format_minute(closing)}"
+    # Text such as "Varies" or "Year-round" is shown as written.
+    texts = [str(text).strip() for text in (opening_text, closing_text) if isinstance(text, str) and text.strip()]
+    return " - ".join(dict.fromkeys(texts)) or "Not listed"
+
+
+def normalize_schedule(data):
+    """Adds the typed schedule columns of a Sheet1: opening_minute and closing_minute (minutes after
+    midnight, NaN if unknown), open_days (bitmask of weekdays, 0 if unknown) and operating_hours
+    (the hours as shown in answers). A sheet without opening, closing or available_days gets them
+    all the same, as unknown: NaN, 0 and "Not listed"; a missing available_days is added as "Not listed"."""
+    missing = pd.Series([None] * len(data), index=data.index, dtype=object)
+    opening_cells = data["opening"] if "opening" in data else missing
+    closing_cells = data["closing"] if "closing" in data else missing
+    opening = map_distinct(opening_cells, parse_minute, np.nan, dtype=float)
+    closing = map_distinct(closing_cells, parse_minute, np.nan, dtype=float)
+    all_day = map_distinct(opening_cells, is_all_day, False, dtype=bool)
+    opening[all_day], closing[all_day] = 0, MINUTES_PER_DAY
+    data["opening_minute"], data["closing_minute"] = opening, closing
+    if "available_days" in data:
+        data["open_days"] = map_distinct(data["available_days"], parse_days, 0, dtype=np.int8)
+    else:
+        # San Pedro's and Biñan's Sheet1 list no days; answers that show them read "Not listed".
+        data["available_days"] = "Not listed"
+        data["open_days"] = np.zeros(len(data), dtype=np.int8)
+    data["operating_hours"] = [
+        format_hours(*row) for row in zip(opening, closing, opening_cells.tolist(), closing_cells.tolist())
+    ]
+    return data
+
+
+Schedule = namedtuple("Schedule", ["opening", "closing", "days"])
+
+
+def build_schedule(data):
+    """Pulls a Sheet1's typed schedule columns out as arrays, for open_at and open_on.
+
+    Rows without listed days are taken to be open every day, so their hours still count.
+    """
+    days = data["open_days"].to_numpy(dtype=np.int8)
+    return Schedule(
+        opening=data["opening_minute"].to_numpy(dtype=float),
+        closing=data["closing_minute"].to_numpy(dtype=float),
+        days=np.where(days == 0, EVERY_DAY, days).astype(np.int8),
+    )
+
+
+def open_on(schedule, days):
+    """Rows open on any of the days in a bitmask."""
+    return (schedule.days & days) != 0
+
+
+def open_at(schedule, when):
+    """Rows open at a datetime: within their hours on its weekday. Rows with unknown hours are never open.
+
+    Hours closing at or before they open run past midnight, into the next day.
+    """
+    minute = when.hour * 60 + when.minute
+    today = open_on(schedule, 1 << when.weekday())
+    yesterday = open_on(schedule, 1 << (when.weekday() - 1) % 7)
+    with np.errstate(invalid="ignore"):
+        overnight = schedule.closing <= schedule.opening
+        same_day = (schedule.opening <= minute) & ((minute < schedule.closing) | overnight)
+        after_midnight = overnight & (minute < schedule.closing)
+    return (same_day & today) | (after_midnight & yesterday)
+
+
+_asked_day = re.compile(r"\b(" + "|".join(DAY_NAMES) + r")s?\b")
+
+
+def days_asked(text, today):
+    """Returns the days a lowercased question asks about as a bitmask: day names, "weekdays",
+    "weekends", "today" or "tomorrow" (relative to the weekday number today); 0 if none."""
+    days = 0
+    for name in _asked_day.findall(text):
+        days |= 1 << DAY_NAMES.index(name)
+    if re.search(r"\bweekdays?\b", text):
+        days |= WEEKDAYS
+    if re.search(r"\bweekends?\b", text):
+        days |= WEEKENDS
+    if re.search(r"\btoday\b", text):
+        days |= 1 << today
+    if re.search(r"\btomorrow\b", text):
+        days |= 1 << (today + 1) % 7
+    return days
+
+
+def describe_days(days):
+    """Names a bitmask of days for answers: "Sunday", "weekends", "Monday or Friday"."""
+    if days == EVERY_DAY:
+        return "every day"
+    if days == WEEKENDS:
+        return "weekends"
+    if days == WEEKDAYS:
+        return "weekdays"
+    return " or ".join(name.capitalize() for i, name in enumerate(DAY_NAMES) if days & 1 << i)
@@ -0,0 +1,142 @@
+from collections import namedtuple
+from functools import lru_cache
+
+import numpy as np
+
+from cells import map_distinct
+from matchers import normalize_text
+
+# Words that say nothing about what a place or food is, in the questions or the workbooks, and the
+# small talk around questions ("can you help me", "thanks"), which would otherwise match a name.
+STOPWORDS = frozenset("""
+    a about all am an and any anything are around as at be best can city could do does for from get go going good
+    have here i in is it its me my near nearby of on or our place places recommend show some something somewhere
+    spot spots suggest that the there this to try us visit want we where which with would you
+    afternoon bye evening hello help hey hi how im just know let lets like maybe morning need no ok okay please
+    really tell thank thanks what when who why yes your
+""".split())
+
+# Okapi BM25 parameters: how fast repeated terms saturate, and how much long texts are discounted.
+K1 = 1.2
+B = 0.75
+
+
+@lru_cache(maxsize=65536)
+def stem(word):
+    """Strips common English suffixes so inflections share a term: "swimming", "swims" -> "swim";
+    "hikers", "hiking", "hike" -> "hik"; "activities" -> "activity". Stems keep at least 3 letters."""
+    if word.endswith("ies") and len(word) > 4:
+        word = word[:-3] + "y"
+    elif word.endswith("s") and not word.endswith("ss") and len(word) > 3:
+        word = word[:-1]
+    for suffix in ("ing", "ed", "er", "e"):
+        if word.endswith(suffix) and len(word) - len(suffix) >= 3:
+            word = word[:-len(suffix)]
+            # "swimm" -> "swim", but not "fall" or "pass"; "picnick" -> "picnic".
+            if suffix != "e" and word[-1] == word[-2] and word[-1] not in "aeiouslz":
+                word = word[:-1]
+            elif suffix in ("ing", "ed") and word.endswith("ick") and len(word) > 5:
+                word = word[:-1]
+            break
+    return word
+
+
+def tokenize(text):
+    """Splits a text into the stemmed terms it is indexed or searched by, stopwords left out."""
+    return [stem(word) for word in normalize_text(text).split() if word not in STOPWORDS and not word.isdigit()]
+
+
+# A term-by-document matrix in compressed sparse column form: the rows (documents) that contain
+# term j are rows[indptr[j]:indptr[j + 1]], with their BM25 weights at the same positions.
+TextIndex = namedtuple("TextIndex", ["vocabulary", "indptr", "rows", "weights", "size"])
+
+
+def build_text_index(data, fields):
+    """Indexes the text of each row of a sheet for search(), weighting each column's terms by
+    fields ({column: weight}); missing columns are skipped."""
+    size = len(data)
+    vocabulary = {}
+    row_ids, term_ids, counts = [], [], []
+
+    def term_ids_of(cell):
+        if not isinstance(cell, str):
+            return []
+        return [vocabulary.setdefault(term, len(vocabulary)) for term in tokenize(cell)]
+
+    for column, weight in fields.items():
+        if column not in data:
+            continue
+        for row, terms in enumerate(map_distinct(data[column], term_ids_of, []).tolist()):
+            row_ids += [row] * len(terms)
+            term_ids += terms
+            counts += [weight] * len(terms)
+
+    row_ids = np.asarray(row_ids, dtype=np.int64)
+    term_ids = np.asarray(term_ids, dtype=np.int64)
+    # Sum the (weighted) occurrences of each term in each row, sorted by term, then row.
+    pairs, inverse = np.unique(term_ids * max(size, 1) + row_ids, return_inverse=True)
+    frequency = np.bincount(inverse.ravel(), weights=np.asarray(counts, dtype=float), minlength=len(pairs))
+    terms, rows = np.divmod(pairs, max(size, 1))
+
+    length = np.bincount(rows, weights=frequency, minlength=size)
+    average = length.mean() if size and length.any() else 1.0
+    postings = np.bincount(terms, minlength=len(vocabulary))
+    idf = np.log1p((size - postings + 0.5) / (postings + 0.5))
+    weights = idf[terms] * frequency * (K1 + 1) / (frequency + K1 * (1 - B + B * length[rows] / average))
+    indptr = np.concatenate([[0], np.cumsum(postings)])
+    return TextIndex(vocabulary, indptr, rows.astype(np.int32), weights, size)
+
+
+def _postings(index, query):
+    """Returns the rows of every stored entry of the columns of the query's terms, and their BM25
+    weights times the term's count in the query. A row appears once per term it shares with the query."""
+    counts = {}
+    for term in tokenize(query):
+        column = index.vocabulary.get(term)
+        if column is not None:
+            counts[column] = counts.get(column, 0) + 1
+    if not counts:
+        return np.zeros(0, dtype=np.int32), np.zeros(0)
+    columns = np.fromiter(counts, dtype=np.int64, count=len(counts))
+    starts, ends = index.indptr[columns], index.indptr[columns + 1]
+    lengths = ends - starts
+    # Positions of every stored entry of those columns, without a Python loop over them.
+    positions = np.repeat(starts - np.cumsum(lengths) + lengths, lengths) + np.arange(lengths.sum())
+    values = index.weights[positions] * np.repeat(np.fromiter(counts.values(), dtype=float, count=len(counts)), lengths)
+    return index.rows[positions], values
+
+
+def scores(index, query, min_terms=1):
+    """Scores every row against a query: the BM25 matrix times the query's term counts, as one
+    gather and scatter over the columns of the terms it contains. Rows sharing fewer than
+    min_terms distinct terms with the query score 0."""
+    rows, values = _postings(index, query)
+    values = np.bincount(rows, weights=values, minlength=index.size)
+    if min_terms > 1:
+        values[np.bincount(rows, minlength=index.size) < min_terms] = 0
+    return values
+
+
+def search(index, query, limit=5, min_terms=1):
+    """Returns the offsets of the rows that best match a query, best first (ties in sheet order),
+    at most limit of them; rows sharing fewer than min_terms distinct terms with the query are never returned."""
+    values = scores(index, query, min_terms)
+    matches = np.flatnonzero(values > 0)
+    if len(matches) > limit:
+        matches = matches[np.argpartition(-values[matches], limit - 1)[:limit]]
+    return matches[np.lexsort((matches, -values[matches]))]
+
+
+# Columns searched in each sheet, with the weight of their terms.
+LOCATION_SEARCH_FIELDS = {"to_do_activies": 2.0, "description": 1.0, "location": 1.0}
+FOOD_SEARCH_FIELDS = {"description": 1.0, "type": 1.0, "name": 1.0}
+
+
+def build_location_search(data):
+    """Indexes a Sheet1 by what can be done at each location and what it is."""
+    return build_text_index(data, LOCATION_SEARCH_FIELDS)
+
+
+def build_food_search(data):
+    """Indexes a Sheet3 by the description and type of each food."""
+    return build_text_index(data, FOOD_SEARCH_FIELDS)
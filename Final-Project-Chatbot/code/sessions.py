@@ -0,0 +1,235 @@
+import base64
+import binascii
+import json
+import os
+import random
+import sqlite3
+import threading
+import time
+
+from cache import LRUCache
+
+# Longest question a session keeps for its later pages.
+max_query_length = 256
+
+
+class Session:
+    """Pagination state of one user: what they last asked for and how far they have paged through it."""
+
+    __slots__ = ("intent", "city_name", "offset", "page_size", "seed", "query")
+
+    def __init__(self):
+        self.reset()
+
+    def start(self, intent, city_name, query=None):
+        """Begins a new paginated result list from its first page.
+
+        query is kept only for lists whose later pages need the question itself (its filters);
+        it is cut to max_query_length so cursors stay small.
+        """
+        self.intent = intent
+        self.city_name = city_name
+        self.offset = 0
+        self.page_size = None
+        self.query = query[:max_query_length] if query is not None else None
+        # Fixes the order of shuffled lists, so later pages continue the same permutation.
+        self.seed = random.getrandbits(31)
+
+    def reset(self):
+        self.start(None, None)
+
+
+class SessionStore:
+    """In-process sessions keyed by user id, expired when idle and capped in number (least recently used go first).
+
+    Every backend has the same interface: load a session at the start of a request and save
+    it once at the end.
+    """
+
+    def __init__(self, ttl=1800, max_sessions=10000):
+        self.sessions = LRUCache(max_sessions, ttl=ttl)
+        self.created = 0
+
+    def load(self, user_id):
+        """Returns the user's session, starting a new one if they have none or it expired."""
+        self.sessions.purge_expired()
+        session = self.sessions.get(user_id)
+        if session is None:
+            session = Session()
+            self.created += 1
+        # Storing it again renews the idle timeout and marks it most recently used.
+        self.sessions.put(user_id, session)
+        return session
+
+    def save(self, user_id, session):
+        # The loaded object is the stored one, so its changes are already visible.
+        pass
+
+    def stats(self):
+        stats = self.sessions.stats()
+        return {
+            'live': stats['size'],
+            'max_sessions': stats['maxsize'],
+            'created': self.created,
+            'evictions': stats['evictions'],
+            'expirations': stats['expirations'],
+        }
+
+
+class SQLiteSessionStore:
+    """Sessions in a SQLite database in WAL mode, shared by every worker process on the machine."""
+
+    # Expired and over-cap sessions are pruned once every this many saves.
+    prune_every = 200
+
+    def __init__(self, path, ttl=1800, max_sessions=10000):
+        self.path = path
+        self.ttl = ttl
+        self.max_sessions = max_sessions
+        self.created = 0
+        self.evictions = 0
+        self.expirations = 0
+        self._saves = 0
+        self._local = threading.local()
+        # A SQLite connection must not be used across fork(), so the table is created on a connection
+        # of its own that is closed at once: a worker forked after import (gunicorn --preload) inherits
+        # none, and children forget any the parent opened later.
+        conn = self._open()
+        conn.executescript("""
+            CREATE TABLE IF NOT EXISTS sessions (
+                user_id TEXT PRIMARY KEY,
+                intent TEXT,
+                city_name TEXT,
+                offset INTEGER NOT NULL,
+                page_size INTEGER,
+                seed INTEGER,
+                query TEXT,
+                last_seen REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS sessions_last_seen ON sessions (last_seen);
+        """)
+        conn.close()
+        if hasattr(os, "register_at_fork"):
+            os.register_at_fork(after_in_child=self._forget_connections)
+
+    def _forget_connections(self):
+        self._local = threading.local()
+
+    def _connect(self):
+        # sqlite3 connections may not be shared between threads, so each thread opens its own.
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = self._open()
+        return conn
+
+    def _open(self):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def load(self, user_id):
+        """Reads the user's session in a single query, starting a new one if they have none or it expired."""
+        row = self._connect().execute(
+            "SELECT intent, city_name, offset, page_size, seed, query FROM sessions WHERE user_id = ? AND last_seen >= ?",
+            (user_id, time.time() - self.ttl),
+        ).fetchone()
+        session = Session()
+        if row is None:
+            self.created += 1
+        else:
+            session.intent, session.city_name, session.offset, session.page_size, session.seed, session.query = row
+        return session
+
+    def save(self, user_id, session):
+        """Writes the session back in a single statement, renewing its idle timeout."""
+        self._connect().execute(
+            "INSERT OR REPLACE INTO sessions (user_id, intent, city_name, offset, page_size, seed, query, last_seen) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (user_id, session.intent, session.city_name, session.offset, session.page_size, session.seed, session.query, time.time()),
+        )
+        self._saves += 1
+        if self._saves % self.prune_every == 0:
+            self.prune()
+
+    def prune(self):
+        """Deletes expired sessions and the least recently active ones beyond max_sessions."""
+        conn = self._connect()
+        self.expirations += conn.execute(
+            "DELETE FROM sessions WHERE last_seen < ?", (time.time() - self.ttl,)
+        ).rowcount
+        self.evictions += conn.execute(
+            "DELETE FROM sessions WHERE user_id IN (SELECT user_id FROM sessions ORDER BY last_seen DESC LIMIT -1 OFFSET ?)",
+            (self.max_sessions,),
+        ).rowcount
+
+    def stats(self):
+        live = self._connect().execute(
+            "SELECT COUNT(*) FROM sessions WHERE last_seen >= ?", (time.time() - self.ttl,)
+        ).fetchone()[0]
+        return {
+            'live': live,
+            'max_sessions': self.max_sessions,
+            'created': self.created,
+            'evictions': self.evictions,
+            'expirations': self.expirations,
+        }
+
+
+# Changes whenever the fields of a cursor do; cursors of any other version are rejected.
+CURSOR_VERSION = 2
+
+
+def encode_cursor(session):
+    """Packs the session's pagination state into an opaque token the client sends back for the next page.
+
+    A session with no list ("no" reset it) gets a cursor too, so a client that sends it back is
+    told there is nothing to continue instead of being answered from an older stored session.
+    """
+    if session.intent is None:
+        state = [CURSOR_VERSION, None, None, 0, 0, None, None]
+    else:
+        state = [CURSOR_VERSION, session.intent, session.city_name, session.seed, session.offset, session.page_size, session.query]
+    return base64.urlsafe_b64encode(json.dumps(state, separators=(",", ":")).encode()).decode().rstrip("=")
+
+
+def decode_cursor(token):
+    """Unpacks a cursor into a Session, or returns None if the token is malformed.
+
+    The fields are only checked for type here; callers decide which intents and cities are valid.
+    """
+    if not isinstance(token, str) or len(token) > 2048:
+        return None
+    try:
+        state = json.loads(base64.urlsafe_b64decode(token + "=" * (-len(token) % 4)))
+        version, intent, city_name, seed, offset, page_size, query = state
+    except (binascii.Error, UnicodeDecodeError, ValueError, TypeError):
+        return None
+    if version != CURSOR_VERSION:
+        return None
+    if intent is None and city_name is None:
+        return Session()  # the cursor of a reset session
+    if not isinstance(intent, str) or not isinstance(city_name, str):
+        return None
+    if query is not None and not (isinstance(query, str) and len(query) <= max_query_length):
+        return None
+    if not all(isinstance(value, int) and value >= 0 for value in (seed, offset)):
+        return None
+    if page_size is not None and not (isinstance(page_size, int) and page_size > 0):
+        return None
+
+    session = Session()
+    session.intent, session.city_name, session.seed, session.offset, session.page_size = intent, city_name, seed, offset, page_size
+    session.query = query
+    return session
+
+
+def open_session_store(backend, path=None, ttl=1800, max_sessions=10000):
+    """Creates the session store named by backend: "memory" (this process only) or "sqlite" (shared)."""
+    if backend == "memory":
+        return SessionStore(ttl=ttl, max_sessions=max_sessions)
+    if backend == "sqlite":
+        return SQLiteSessionStore(path, ttl=ttl, max_sessions=max_sessions)
+    raise ValueError(f"Unknown session backend {backend!r}; expected 'memory' or 'sqlite'.")
@@ -0,0 +1,71 @@
+import pandas as pd
+import pytest
+
+from app import app, chatbot_response, extract_number, max_batch_size, max_page_size, show_open_now, show_open_on_day
+from datasets import SheetData
+from schedules import normalize_schedule
+from sessions import Session
+
+
+@pytest.fixture
+def client():
+    return app.test_client()
+
+
+@pytest.mark.parametrize("body, content_type", [
+    ("not json", "text/plain"),
+    ("not json", "application/json"),
+    ('{"query": "best hotel in calamba"}', "application/json"),
+    ("[" + ",".join(['{"query": "hi"}'] * (max_batch_size + 1)) + "]", "application/json"),
+])
+def test_batch_rejects_non_list(client, body, content_type):
+    response = client.post("/query/batch", data=body, content_type=content_type)
+    assert response.status_code == 400
+    assert response.get_json() == {"error": f"Please send a list of at most {max_batch_size} queries."}
+
+
+@pytest.mark.parametrize("query, number", [
+    ("show 7 locations in calamba", 7),
+    ("show ten locations in calamba", 10),
+    ("show a million locations in calamba", max_page_size),
+    ("show a million hundred locations in calamba", 5),
+    ("show a million hundred locations in los banos", 5),
+    ("show more locations in santa rosa", 5),
+])
+def test_extract_number(query, number):
+    assert extract_number(query) == number
+
+
+@pytest.fixture
+def sheet_without_hours(monkeypatch):
+    # Like San Pedro's and Biñan's Sheet1: no opening, closing or available_days columns.
+    frame = normalize_schedule(pd.DataFrame({"location": ["Zao Spa", "Alberto Mansion"], "rating": [4.5, 4.0]}))
+    sheet = SheetData("San_Pedro.xlsx", "Sheet1", None, frame)
+    monkeypatch.setattr("app.load_city_sheet", lambda city_name, sheet_name: sheet if sheet_name == "Sheet1" else None)
+
+
+@pytest.mark.parametrize("show, query", [
+    (show_open_on_day, "is zao spa open on sunday in san pedro"),
+    (show_open_on_day, "is zao spa open today in san pedro"),
+    (show_open_now, "is zao spa open now in san pedro"),
+])
+def test_location_open_without_hours(sheet_without_hours, show, query):
+    response = show(Session(), query, "San Pedro")
+    assert "Zao Spa" in response
+    assert "Operating Hours: Not listed" in response and "Available Date: Not listed" in response
+
+
+def test_cached_answers_keep_their_intent(monkeypatch):
+    frame = pd.DataFrame({
+        "location": ["Rizal Shrine"],
+        "description": ["The ancestral house of Jose Rizal."],
+        "best_season": ["Dry season"],
+        "best_season_why": ["Clear skies."],
+    })
+    sheet = SheetData("Calamba.xlsx", "Sheet1", None, frame)
+    monkeypatch.setattr("app.load_city_sheet", lambda city_name, sheet_name: sheet if sheet_name == "Sheet1" else None)
+    monkeypatch.setattr("app.extract_city", lambda query: "Calamba")
+
+    # Both normalize to the same text, but only the second asks for the best season.
+    assert "ancestral house" in chatbot_response("what is the best-season for rizal shrine in calamba", Session())
+    assert "Best Season: Dry season" in chatbot_response("what is the best season for rizal shrine in calamba", Session())
@@ -0,0 +1,71 @@
+import pytest
+
+from filters import describe_filter, has_limits, parse_accommodation_filter
+
+
+@pytest.mark.parametrize("query, max_price, min_price", [
+    ("resorts under ₱2000 in calamba", 2000, None),
+    ("hotels below php 1,500", 1500, None),
+    ("cheap inn under 2k", 2000, None),
+    ("hotel at least 800 in bay", None, 800),
+    ("hotels between 3,000 and 1k", 3000, 1000),
+    ("up to 1500 for 2 nights", 1500, None),
+    ("under 2000, with a pool", 2000, None),
+])
+def test_prices(query, max_price, min_price):
+    filters = parse_accommodation_filter(query)
+    assert (filters.max_price, filters.min_price) == (max_price, min_price)
+
+
+@pytest.mark.parametrize("query", [
+    "hotel for up to 4 people in calamba",
+    "resort for at least 10 guests",
+    "inn within 5 km of rizal shrine",
+    "hotel within 5km",
+    "between 2 and 4 pax",
+    "at least 3 nights",
+])
+def test_counts_and_distances_are_not_prices(query):
+    filters = parse_accommodation_filter(query)
+    assert filters.max_price is None and filters.min_price is None
+
+
+@pytest.mark.parametrize("query, min_rating", [
+    ("resorts with rating above 4", 4.0),
+    ("hotels rated at least 4.5", 4.5),
+    ("4+ stars inn", 4.0),
+    ("at least 4 stars", 4.0),
+    ("4/5 and up", 4.0),
+])
+def test_rating(query, min_rating):
+    filters = parse_accommodation_filter(query)
+    assert filters.min_rating == min_rating
+    # The rating's number is never also read as a price.
+    assert filters.min_price is None
+
+
+def test_types_and_levels():
+    filters = parse_accommodation_filter("budget resorts or b&b, luxury hotels")
+    assert filters.types == ("resort", "bed and breakfast", "hotel")
+    assert filters.levels == ("budget", "luxury")
+
+
+@pytest.mark.parametrize("query", [
+    "cheapest hotel under 5000 in calamba",
+    "cheap hotels in calamba",
+    "best hotel rated 4 and up",
+])
+def test_hotel_and_cheap_mean_any_accommodation(query):
+    filters = parse_accommodation_filter(query)
+    assert filters.types == () and filters.levels == ()
+
+
+def test_has_limits():
+    assert not has_limits(parse_accommodation_filter("resorts in calamba"))
+    assert has_limits(parse_accommodation_filter("budget resorts"))
+    assert has_limits(parse_accommodation_filter("resorts under 2000"))
+
+
+def test_describe_filter():
+    filters = parse_accommodation_filter("resorts or inns under ₱2000 with rating above 4")
+    assert describe_filter(filters) == "resort or inn, ₱2,000 or less, rated 4.0 and up"
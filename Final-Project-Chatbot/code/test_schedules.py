@@ -0,0 +1,111 @@
+import datetime
+import math
+
+import pandas as pd
+import pytest
+
+from schedules import (
+    EVERY_DAY, WEEKDAYS, WEEKENDS, build_schedule, days_asked, describe_days, format_minute, normalize_schedule,
+    open_at, open_on, parse_days, parse_minute,
+)
+
+MONDAY, FRIDAY, SATURDAY, SUNDAY = 1 << 0, 1 << 4, 1 << 5, 1 << 6
+
+
+@pytest.mark.parametrize("value, minute", [
+    (datetime.time(9, 30), 570),
+    ("8:00 AM", 480),
+    ("5:00 pm", 1020),
+    ("17:00", 1020),
+    ("12:00 AM", 0),
+    ("12 noon", 720),
+])
+def test_parse_minute(value, minute):
+    assert parse_minute(value) == minute
+
+
+@pytest.mark.parametrize("value", ["Open 24 hours", "Varies", None, "25:00"])
+def test_parse_minute_without_a_time(value):
+    assert math.isnan(parse_minute(value))
+
+
+@pytest.mark.parametrize("value, days", [
+    ("Daily", EVERY_DAY),
+    ("Weekdays", WEEKDAYS),
+    ("Weekends & Holidays", WEEKENDS),
+    ("Monday to Friday", WEEKDAYS),
+    ("Tuesday-Sunday", EVERY_DAY & ~MONDAY),
+    ("Friday to Monday", FRIDAY | SATURDAY | SUNDAY | MONDAY),
+    ("Saturday, Sunday", WEEKENDS),
+    ("Year-round", 0),
+    (None, 0),
+])
+def test_parse_days(value, days):
+    assert parse_days(value) == days
+
+
+@pytest.mark.parametrize("text, days", [
+    ("what is open on sundays in calamba", SUNDAY),
+    ("is it open on monday or friday", MONDAY | FRIDAY),
+    ("what can i visit this weekend", WEEKENDS),
+    ("open on weekdays", WEEKDAYS),
+    ("is rizal shrine open today", SATURDAY),
+    ("open tomorrow", SUNDAY),
+    ("is it open", 0),
+])
+def test_days_asked(text, days):
+    assert days_asked(text, today=5) == days
+
+
+def test_days_asked_tomorrow_wraps_around_the_week():
+    assert days_asked("open tomorrow", today=6) == MONDAY
+
+
+def test_format_minute():
+    assert [format_minute(minute) for minute in (0, 570, 720, 1020)] == ["12:00 AM", "9:30 AM", "12:00 PM", "5:00 PM"]
+
+
+def test_describe_days():
+    assert describe_days(EVERY_DAY) == "every day"
+    assert describe_days(WEEKENDS) == "weekends"
+    assert describe_days(MONDAY | FRIDAY) == "Monday or Friday"
+
+
+@pytest.fixture
+def schedule():
+    sheet = pd.DataFrame({
+        "location": ["Museum", "Night Market", "Park", "Casino", "Farm"],
+        "opening": [datetime.time(9), "6:00 PM", "Varies", "Open 24 hours", datetime.time(8)],
+        "closing": [datetime.time(17), "2:00 AM", "Varies", "Open 24 hours", datetime.time(16)],
+        "available_days": ["Tuesday to Sunday", "Friday", "Daily", "Daily", None],
+    })
+    return build_schedule(normalize_schedule(sheet))
+
+
+def test_open_at(schedule):
+    # A Friday at 10 AM: the museum and the farm (no days listed, so every day) are open; the night market is not yet.
+    assert open_at(schedule, datetime.datetime(2024, 5, 3, 10)).tolist() == [True, False, False, True, True]
+    # Monday morning: the museum is closed for the day.
+    assert open_at(schedule, datetime.datetime(2024, 5, 6, 10)).tolist() == [False, False, False, True, True]
+
+
+def test_open_at_runs_past_midnight(schedule):
+    # Friday's night market is still open at 1 AM on Saturday, but not at 1 AM on Friday.
+    assert open_at(schedule, datetime.datetime(2024, 5, 4, 1))[1]
+    assert not open_at(schedule, datetime.datetime(2024, 5, 3, 1))[1]
+
+
+def test_sheet_without_hours():
+    sheet = normalize_schedule(pd.DataFrame({"location": ["Museum", "Park"], "opening": [datetime.time(9), None]}))
+    assert sheet["operating_hours"].tolist() == ["Not listed", "Not listed"]
+    assert sheet["open_days"].tolist() == [0, 0]
+    assert sheet["available_days"].tolist() == ["Not listed", "Not listed"]
+    schedule = build_schedule(sheet)
+    # Unknown hours are never open, though unknown days count as every day.
+    assert not open_at(schedule, datetime.datetime(2024, 5, 3, 10)).any()
+    assert open_on(schedule, SUNDAY).all()
+
+
+def test_open_on(schedule):
+    assert open_on(schedule, MONDAY).tolist() == [False, False, True, True, True]
+    assert open_on(schedule, FRIDAY).tolist() == [True, True, True, True, True]
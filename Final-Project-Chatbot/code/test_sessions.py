@@ -0,0 +1,71 @@
+import base64
+import json
+import os
+
+import pytest
+
+from sessions import CURSOR_VERSION, Session, SQLiteSessionStore, decode_cursor, encode_cursor, max_query_length
+
+
+def _token(state):
+    return base64.urlsafe_b64encode(json.dumps(state).encode()).decode().rstrip("=")
+
+
+def test_round_trip():
+    session = Session()
+    session.start("filtered_accommodations", "calamba", "resorts under 2000 in calamba")
+    session.offset, session.page_size = 10, 5
+
+    decoded = decode_cursor(encode_cursor(session))
+    assert [getattr(decoded, name) for name in Session.__slots__] == [getattr(session, name) for name in Session.__slots__]
+
+
+def test_reset_session():
+    session = Session()
+    session.start("locations", "bay")
+    session.reset()
+
+    decoded = decode_cursor(encode_cursor(session))
+    assert decoded is not None and decoded.intent is None and decoded.offset == 0
+
+
+@pytest.mark.parametrize("token", [
+    None,
+    123,
+    "",
+    "not base64!",
+    "x" * 4096,
+    _token({"intent": "locations"}),
+    _token([CURSOR_VERSION, "locations", "bay", 7, 5]),
+    _token([CURSOR_VERSION + 1, "locations", "bay", 7, 5, None, None]),
+    _token([1, "locations", "bay", 7, 5, None]),
+    _token([CURSOR_VERSION, 1, "bay", 7, 5, None, None]),
+    _token([CURSOR_VERSION, "locations", None, 7, 5, None, None]),
+    _token([CURSOR_VERSION, "locations", "bay", -1, 5, None, None]),
+    _token([CURSOR_VERSION, "locations", "bay", 7, "5", None, None]),
+    _token([CURSOR_VERSION, "locations", "bay", 7, 5, 0, None]),
+    _token([CURSOR_VERSION, "locations", "bay", 7, 5, None, "q" * (max_query_length + 1)]),
+])
+def test_malformed(token):
+    assert decode_cursor(token) is None
+
+
+@pytest.mark.skipif(not hasattr(os, "fork"), reason="needs fork()")
+def test_sqlite_store_reconnects_after_fork(tmp_path):
+    store = SQLiteSessionStore(str(tmp_path / "sessions.db"))
+    parent_conn = store._connect()
+
+    pid = os.fork()
+    if pid == 0:
+        try:
+            session = store.load("child")
+            session.start("locations", "bay")
+            store.save("child", session)
+            ok = store._connect() is not parent_conn
+        except BaseException:
+            ok = False
+        os._exit(0 if ok else 1)
+    _, status = os.waitpid(pid, 0)
+
+    assert os.waitstatus_to_exitcode(status) == 0
+    assert store.load("child").intent == "locations"